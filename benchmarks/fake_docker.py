@@ -0,0 +1,274 @@
+"""Stand-in for the Docker Engine API, served over a unix socket.
+
+Simulates N running containers. The latency and payload size of the `stats`, `top` and
+`inspect` endpoints are configurable, so that the monitor can be benchmarked without a
+Docker daemon (and without N real containers).
+
+    python benchmarks/fake_docker.py --socket /tmp/fake-docker.sock --containers 100
+"""
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import socketserver
+
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+API_VERSION = '1.43'
+_VERSION_PREFIX_RE = re.compile(r'^/v[0-9.]+')
+
+
+class FakeDockerDaemon(object):
+
+    def __init__(self, socket_path: str, containers: int = 10, processes: int = 10,
+                 env_size: int = 20, cpus: int = 4, stats_latency: float = 0.0,
+                 top_latency: float = 0.0, inspect_latency: float = 0.0,
+                 stream_every: float = 1.0):
+        self.socket_path = socket_path
+        self.processes = processes
+        self.env_size = env_size
+        self.cpus = cpus
+        self.stats_latency = stats_latency
+        self.top_latency = top_latency
+        self.inspect_latency = inspect_latency
+        self.stream_every = stream_every
+        self.containers = [
+            hashlib.sha256('container-{}'.format(i).encode()).hexdigest()
+            for i in range(containers)
+        ]
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return 'unix://' + os.path.abspath(self.socket_path)
+
+    def start(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = _UnixHTTPServer(self.socket_path, _handler(self))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        os.remove(self.socket_path)
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    # payloads
+
+    def summary(self, cid: str) -> dict:
+        return {
+            'Id': cid,
+            'Names': ['/fake-{}'.format(cid[:12])],
+            'Image': 'fake/image:latest',
+            'Command': 'sleep infinity',
+            'Created': 0,
+            'State': 'running',
+            'Status': 'Up'
+        }
+
+    def inspect(self, cid: str) -> dict:
+        return {
+            'Id': cid,
+            'Name': '/fake-{}'.format(cid[:12]),
+            'Created': '2020-01-01T00:00:00Z',
+            'State': {'Status': 'running', 'Running': True, 'Pid': 1},
+            'Image': 'sha256:' + '0' * 64,
+            'Config': {
+                'Image': 'fake/image:latest',
+                'Env': ['VAR_{}=value_{}'.format(i, i) for i in range(self.env_size)],
+                'Labels': {}
+            },
+            'HostConfig': {'NetworkMode': 'host', 'Privileged': False},
+            'Mounts': [],
+            'NetworkSettings': {'Networks': {}}
+        }
+
+    def stats(self, cid: str) -> dict:
+        # counters grow with time, so that rates are not zero
+        t = time.monotonic() - self._start
+        usage = int(t * 1e9 * (1 + int(cid[:2], 16) % 4) / 10)
+        return {
+            'read': '2020-01-01T00:00:00Z',
+            'cpu_stats': {
+                'cpu_usage': {
+                    'total_usage': usage,
+                    'percpu_usage': [usage // self.cpus] * self.cpus
+                },
+                'system_cpu_usage': int(t * 1e9 * self.cpus),
+                'online_cpus': self.cpus
+            },
+            'memory_stats': {
+                'usage': 50 * 1024 * 1024,
+                'limit': 4 * 1024 * 1024 * 1024,
+                'stats': {'cache': 1024 * 1024}
+            },
+            'blkio_stats': {
+                'io_service_bytes_recursive': [
+                    {'major': 8, 'minor': 0, 'op': 'Read', 'value': int(t * 1000)},
+                    {'major': 8, 'minor': 0, 'op': 'Write', 'value': int(t * 500)}
+                ]
+            },
+            'networks': {
+                'eth0': {'rx_bytes': int(t * 2000), 'tx_bytes': int(t * 1000)}
+            }
+        }
+
+    def top(self, cid: str) -> dict:
+        return {
+            'Titles': ['PPID', 'PID', '%CPU', 'THCNT', 'TIME', '%MEM', 'SIZE', 'CMD'],
+            'Processes': [
+                ['0', str(100 + i), '1.5', '2', '00:00:01', '0.3', '2048',
+                 'python3 worker.py --id {}'.format(i)]
+                for i in range(self.processes)
+            ]
+        }
+
+    def info(self) -> dict:
+        return {
+            'ID': 'FAKE',
+            'Containers': len(self.containers),
+            'ContainersRunning': len(self.containers),
+            'NCPU': self.cpus,
+            'MemTotal': 4 * 1024 * 1024 * 1024,
+            'OperatingSystem': 'fake',
+            'ServerVersion': '24.0.0'
+        }
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _handler(daemon: FakeDockerDaemon):
+
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            path = _VERSION_PREFIX_RE.sub('', url.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            parts = path.strip('/').split('/')
+            if path == '/_ping':
+                return self._send('OK', content_type='text/plain')
+            if path == '/version':
+                return self._send({'ApiVersion': API_VERSION, 'Version': '24.0.0',
+                                   'MinAPIVersion': '1.12', 'Os': 'linux'})
+            if path == '/info':
+                return self._send(daemon.info())
+            if path == '/containers/json':
+                daemon.count('list')
+                return self._send([daemon.summary(c) for c in daemon.containers])
+            if path == '/events':
+                # nothing ever happens, keep the stream open
+                return self._stream(lambda: None, every=None)
+            if len(parts) == 3 and parts[0] == 'containers':
+                cid = self._container(parts[1])
+                if cid is None:
+                    return self._send({'message': 'No such container'}, status=404)
+                if parts[2] == 'json':
+                    daemon.count('inspect')
+                    time.sleep(daemon.inspect_latency)
+                    return self._send(daemon.inspect(cid))
+                if parts[2] == 'top':
+                    daemon.count('top')
+                    time.sleep(daemon.top_latency)
+                    return self._send(daemon.top(cid))
+                if parts[2] == 'stats':
+                    daemon.count('stats')
+                    if query.get('stream', 'true') in ('0', 'false', 'False'):
+                        time.sleep(daemon.stats_latency)
+                        return self._send(daemon.stats(cid))
+                    return self._stream(lambda: daemon.stats(cid), every=daemon.stream_every)
+            return self._send({'message': 'page not found'}, status=404)
+
+        def _container(self, key: str):
+            for cid in daemon.containers:
+                if cid.startswith(key) or key == 'fake-' + cid[:12]:
+                    return cid
+            return None
+
+        def _send(self, body, status: int = 200, content_type: str = 'application/json'):
+            body = (body if isinstance(body, str) else json.dumps(body)).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Api-Version', API_VERSION)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, sample, every):
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.close_connection = True
+            try:
+                while True:
+                    if every is None:
+                        # only keep the connection alive
+                        self.wfile.flush()
+                        time.sleep(1.0)
+                        continue
+                    chunk = (json.dumps(sample()) + '\n').encode('utf-8')
+                    self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii'))
+                    self.wfile.write(chunk + b'\r\n')
+                    self.wfile.flush()
+                    time.sleep(every)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+
+        def address_string(self):
+            return 'unix'
+
+        def log_message(self, *_):
+            pass
+
+    return _Handler
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Fake Docker daemon')
+    parser.add_argument('--socket', default='/tmp/fake-docker.sock')
+    parser.add_argument('--containers', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=10,
+                        help="Processes per container (size of the 'top' payload)")
+    parser.add_argument('--env-size', type=int, default=20,
+                        help="Environment variables per container (size of the 'inspect' payload)")
+    parser.add_argument('--stats-latency', type=float, default=0.0)
+    parser.add_argument('--top-latency', type=float, default=0.0)
+    parser.add_argument('--inspect-latency', type=float, default=0.0)
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    daemon = FakeDockerDaemon(args.socket, args.containers, args.processes, args.env_size,
+                              stats_latency=args.stats_latency, top_latency=args.top_latency,
+                              inspect_latency=args.inspect_latency)
+    daemon.start()
+    print('Serving {} fake containers on {}'.format(args.containers, daemon.base_url))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        daemon.stop()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Benchmarks of the monitor's hot paths, against the fake Docker daemon.
+
+Two modes:
+
+    pool     drives a Pool (or AsyncPool) with N trivial jobs, measures scheduling lag
+             and throughput of the scheduler alone
+    monitor  runs SystemMonitor end to end against N fake containers, measures samples/s,
+             scheduling lag, peak RSS, extend_log lock wait and log serialization time
+
+The report is printed as JSON (and written to --output), for regression tracking.
+
+    python benchmarks/harness.py monitor --containers 100 --duration 60 --engine async
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'packages'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_docker import FakeDockerDaemon  # noqa: E402
+
+
+def bench_pool(args) -> dict:
+    from system_monitor.pool import Pool
+    from system_monitor.asyncpool import AsyncPool
+    from system_monitor.jobs.jobs import Job
+
+    class _NoopJob(Job):
+        def run(self):
+            pass
+
+    engine = AsyncPool if args.engine == 'async' else Pool
+    pool = engine(logging.getLogger('benchmark'), args.workers, _raise)
+    for _ in range(args.jobs):
+        pool.enqueue(_NoopJob(period=args.period))
+    start = time.monotonic()
+    pool.run()
+    time.sleep(args.duration)
+    stats = pool.get_stats()
+    pool.black_hole(True)
+    pool.terminate_all()
+    pool.join()
+    elapsed = time.monotonic() - start
+    pool.abort(block=True)
+    lag = stats.get('scheduling_lag', {}).get('_NoopJob', {'count': 0, 'mean': 0, 'max': 0})
+    return {
+        'executions': lag['count'],
+        'executions_per_s': lag['count'] / elapsed,
+        'expected_per_s': args.jobs / args.period,
+        'scheduling_lag_mean_s': lag['mean'],
+        'scheduling_lag_max_s': lag['max'],
+        'peak_rss_mb': _peak_rss_mb()
+    }
+
+
+def bench_monitor(args) -> dict:
+    import system_monitor.target as target_module
+    from system_monitor.cli import get_parser
+    from system_monitor.app import SystemMonitor
+    from system_monitor.jobs.publisher import _Compressor, _iter_parts
+    from system_monitor.constants import LOG_API_CHUNK_SIZE_BYTES
+
+    socket_path = os.path.join(tempfile.mkdtemp(), 'docker.sock')
+    daemon = FakeDockerDaemon(socket_path, args.containers, args.processes, args.env_size,
+                              stats_latency=args.stats_latency, top_latency=args.top_latency,
+                              inspect_latency=args.inspect_latency)
+    daemon.start()
+    if not args.host_readers:
+        # the fake containers do not exist on this host
+        target_module.JOB_FETCH_CONTAINER_STATS_FROM_CGROUP = False
+        target_module.JOB_FETCH_CONTAINER_TOP_FROM_PROC = False
+    monitor_args = get_parser().parse_args([
+        '--type', 'benchmark',
+        '--app-id', 'benchmark',
+        '--app-secret', 'benchmark',
+        '--target', daemon.base_url,
+        '--duration', str(args.duration),
+        '--engine', args.engine,
+        '--no-upload'
+    ] + (['--adaptive'] if args.adaptive else []))
+    report = {}
+
+    class _Monitor(SystemMonitor):
+
+        def is_done(self):
+            done = super().is_done()
+            if done and not report:
+                # snapshot before the jobs are cleared and the log is published
+                report.update(self.get_progress())
+            return done
+
+    app = _Monitor(monitor_args)
+    start = time.monotonic()
+    app.start()
+    elapsed = time.monotonic() - start
+    target = app.targets[0]
+    log = target.get_log()
+    # serialization of the log, as done by PublisherJob
+    t = time.perf_counter()
+    size = sum(len(chunk) for chunk in target._log.iter_json())
+    serialization = time.perf_counter() - t
+    t = time.perf_counter()
+    parts = sum(1 for _ in _iter_parts(
+        target._log.iter_json(), _Compressor('gzip'), LOG_API_CHUNK_SIZE_BYTES))
+    compression = time.perf_counter() - t
+    daemon.stop()
+    samples = sum(len(log.get(k, [])) for k in ('container_stats', 'process_stats'))
+    lags = [s for s in report.get('scheduling_lag', {}).values()]
+    lock_wait = report.get('lock_wait', {}).get('extend_log', {'mean': 0, 'max': 0})
+    return {
+        'containers': args.containers,
+        'duration_s': args.duration,
+        'samples': samples,
+        'samples_per_s': samples / args.duration,
+        'container_stats': len(log.get('container_stats', [])),
+        'process_stats': len(log.get('process_stats', [])),
+        'scheduling_lag_mean_s': _weighted_mean(lags),
+        'scheduling_lag_max_s': max([s['max'] for s in lags], default=0),
+        'lock_wait_mean_s': lock_wait['mean'],
+        'lock_wait_max_s': lock_wait['max'],
+        'tasks_failed': report.get('tasks_failed', 0),
+        'log_bytes': size,
+        'serialization_s': serialization,
+        'serialization_mb_per_s': size / serialization / 1e6 if serialization else 0,
+        'gzip_parts': parts,
+        'gzip_s': compression,
+        'peak_rss_mb': _peak_rss_mb(),
+        'docker_requests': daemon.requests,
+        'run_s': elapsed
+    }
+
+
+def _weighted_mean(samples: list) -> float:
+    count = sum(s['count'] for s in samples)
+    return sum(s['mean'] * s['count'] for s in samples) / count if count else 0.0
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _raise(ex_type, ex, tb):
+    raise ex
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='System monitor benchmarks')
+    parser.add_argument('mode', choices=['pool', 'monitor'])
+    parser.add_argument('--engine', default='threads', choices=['threads', 'async'])
+    parser.add_argument('--duration', type=int, default=30)
+    parser.add_argument('--output', default=None, help="Write the report to this JSON file")
+    # pool
+    parser.add_argument('--jobs', type=int, default=1000)
+    parser.add_argument('--period', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    # monitor
+    parser.add_argument('--containers', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=10)
+    parser.add_argument('--env-size', type=int, default=20)
+    parser.add_argument('--stats-latency', type=float, default=0.0)
+    parser.add_argument('--top-latency', type=float, default=0.0)
+    parser.add_argument('--inspect-latency', type=float, default=0.0)
+    parser.add_argument('--adaptive', action='store_true', default=False)
+    parser.add_argument('--host-readers', action='store_true', default=False,
+                        help="Also try cgroup/procfs readers (the fake containers are not there)")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    report = bench_pool(args) if args.mode == 'pool' else bench_monitor(args)
+    report = {'mode': args.mode, 'engine': args.engine, **report}
+    print(json.dumps(report, indent=4))
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(report, fout, indent=4)
+
+
+if __name__ == '__main__':
+    main()
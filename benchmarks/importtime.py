@@ -0,0 +1,118 @@
+"""Import time of the monitor's entry points, from `python -X importtime`.
+
+For each scenario, the interpreter is started `--repeat` times and the fastest run is kept.
+The report has the wall time, the total import time and the modules that take the longest
+(self time, and cumulative time of the top-level imports). With `--baseline`, the run fails
+if any scenario got slower than the baseline by more than `--tolerance`.
+
+    python benchmarks/importtime.py --output importtime.json
+    python benchmarks/importtime.py --baseline importtime.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+PACKAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'packages')
+
+SCENARIOS = {
+    # what `--version` and `--help` cost
+    'version': ['-m', 'system_monitor', '--version'],
+    # everything needed to start monitoring
+    'app': ['-c', 'import system_monitor.app'],
+    # offline analysis of a recorded log
+    'analysis': ['-c', 'import system_monitor.analysis']
+}
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure(args: list) -> dict:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [PACKAGES, env.get('PYTHONPATH')]))
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + args, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            # nesting is given by the indentation of the name, two spaces per level
+            modules.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return {
+        'returncode': proc.returncode,
+        'wall_s': wall,
+        'import_us': sum(m[1] for m in modules),
+        'modules': modules
+    }
+
+
+def report(scenario: str, args: list, repeat: int, top: int) -> dict:
+    best = min((measure(args) for _ in range(repeat)), key=lambda r: r['wall_s'])
+    if best['returncode'] != 0:
+        raise RuntimeError('Scenario {} failed (exit code {})'.format(scenario,
+                                                                      best['returncode']))
+    modules = best['modules']
+    by_self = sorted(modules, key=lambda m: -m[1])[:top]
+    top_level = sorted([m for m in modules if m[3] == 0], key=lambda m: -m[2])[:top]
+    return {
+        'wall_s': round(best['wall_s'], 4),
+        'import_ms': round(best['import_us'] / 1000, 2),
+        'modules': len(modules),
+        'slowest_self_ms': {m[0]: round(m[1] / 1000, 2) for m in by_self},
+        'slowest_top_level_ms': {m[0]: round(m[2] / 1000, 2) for m in top_level}
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for scenario, result in current.items():
+        if scenario not in baseline:
+            continue
+        before, after = baseline[scenario]['import_ms'], result['import_ms']
+        if after > before * (1 + tolerance):
+            regressions.append('{}: {:.1f} ms -> {:.1f} ms (+{:.0f}%)'.format(
+                scenario, before, after, 100 * (after / before - 1)))
+    return regressions
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='System monitor import time')
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS),
+                        help="Scenarios to measure (default: all of {})".format(
+                            ', '.join(SCENARIOS)))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--output', default=None, help="Write the report to this JSON file")
+    parser.add_argument('--baseline', default=None,
+                        help="Report from a previous run, fail if slower than that")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Slowdown allowed with respect to the baseline (fraction)")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    results = {
+        scenario: report(scenario, SCENARIOS[scenario], args.repeat, args.top)
+        for scenario in args.scenarios
+    }
+    print(json.dumps(results, indent=4))
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(results, fout, indent=4)
+    if args.baseline:
+        with open(args.baseline, 'rt') as fin:
+            regressions = compare(results, json.load(fin), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,23 @@
 import sys
-from .app import SystemMonitor
 from .constants import APP_NAME
-from .cli import get_parser
+from .cli import get_parser, get_analyze_parser
 from . import __version__
 
 
 def main():
-    parser = get_parser()
-    # ---
-    # version
+    # version (before importing anything heavy)
     if '-v' in sys.argv[1:] or '--version' in sys.argv[1:]:
         print('{} version {}\n'.format(APP_NAME, __version__))
         exit(0)
-    # ---
-    
+    # offline analysis of a recorded log
+    if sys.argv[1:2] == ['analyze']:
+        from .analysis import main as analyze
+        analyze(get_analyze_parser().parse_args(sys.argv[2:]))
+        return
     # parse arguments
-    parsed = parser.parse_args()
+    parsed = get_parser().parse_args()
+    # the app pulls in docker, requests and dt_class_utils, only import it to run
+    from .app import SystemMonitor
     # create app and spin it
     app = SystemMonitor(parsed)
     app.start()
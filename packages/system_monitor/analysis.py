@@ -0,0 +1,330 @@
+import os
+import json
+
+import numpy as np
+
+from typing import Dict, List, Optional
+
+from .columnar import COLUMNAR_SCHEMAS
+from .loader import ExportedLog
+from .constants import \
+    ANALYSIS_TOP_PROCESSES, \
+    ANALYSIS_TIMELINE_STEP_S, \
+    ANALYSIS_PERCENTILE
+
+
+class SectionArrays(object):
+    """Columns of a list section as NumPy arrays.
+
+    String columns hold indices into `strings` (-1 is None), map columns are dicts of arrays
+    (`offsets`, `keys` and one per field), as in the binary export.
+    """
+
+    def __init__(self, columns: Dict[str, object], strings: List[str]):
+        self.columns = columns
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def lookup(self, idx: int) -> Optional[str]:
+        return None if idx < 0 else self.strings[idx]
+
+
+class RecordedLog(object):
+    """Log recorded by the monitor, loaded column-wise.
+
+    Reads both the JSON log and the binary export (a directory, see `export.py`).
+    """
+
+    def __init__(self, path: str):
+        self.sections: Dict[str, SectionArrays] = {}
+        if os.path.isdir(path):
+            exported = ExportedLog(path)
+            self.general = exported.general
+            self.container_names = exported.section('containers', {})
+            for key in exported.columnar_sections():
+                columns = {name: exported.column(key, name) for name in exported.column_names(key)}
+                self.sections[key] = SectionArrays(columns, exported.strings(key))
+        else:
+            with open(path, 'rt') as fin:
+                log = json.load(fin)
+            self.general = log.get('general', {})
+            self.container_names = log.get('containers', {})
+            for key, schema in COLUMNAR_SCHEMAS.items():
+                if log.get(key):
+                    self.sections[key] = _from_rows(log[key], schema)
+
+    def analyze(self, top: int = ANALYSIS_TOP_PROCESSES,
+                step: float = ANALYSIS_TIMELINE_STEP_S) -> dict:
+        report = {'log': self.general, 'containers': [], 'processes': [], 'timeline': {}}
+        stats = self.sections.get('container_stats')
+        if stats is not None and len(stats):
+            report['containers'] = self._containers(stats)
+            report['timeline'] = self._timeline(stats, step)
+        processes = self.sections.get('process_stats')
+        if processes is not None and len(processes):
+            report['processes'] = self._top_processes(processes, top)
+        return report
+
+    def _containers(self, section: SectionArrays) -> List[dict]:
+        columns = section.columns
+        containers, codes = np.unique(columns['container'], return_inverse=True)
+        groups = _Groups(codes, columns['time'])
+        time = groups.sorted(columns['time'])
+        duration = groups.last(time) - groups.first(time)
+        profiles = {
+            metric: groups.describe(groups.sorted(_floats(columns[metric])))
+            for metric in ('pcpu', 'mem', 'pmem')
+        }
+        # cumulative counters, rate over the whole run
+        rates = {
+            metric: groups.rate(groups.sorted(_floats(columns[metric])), time)
+            for metric in ('io_r', 'io_w')
+        }
+        network = columns.get('network')
+        if network is not None:
+            for field in ('rx', 'tx'):
+                totals = _map_totals(network['offsets'], network[field])
+                rates['net_' + field] = groups.rate(groups.sorted(totals), time)
+        out = []
+        for i, container in enumerate(containers.tolist()):
+            container_id = section.lookup(container)
+            out.append({
+                'id': container_id,
+                'name': self.container_names.get(container_id),
+                'samples': int(groups.counts[i]),
+                'duration_s': _value(duration[i]),
+                **{metric: {k: _value(v[i]) for k, v in profile.items()}
+                   for metric, profile in profiles.items()},
+                **{metric + '_rate': _value(rate[i]) for metric, rate in rates.items()}
+            })
+        out.sort(key=lambda c: -(c['pcpu']['mean'] or 0))
+        return out
+
+    def _top_processes(self, section: SectionArrays, top: int) -> List[dict]:
+        columns = section.columns
+        # a process is a (container, pid, command)
+        processes, codes = _unique_rows([
+            np.asarray(columns['container'], dtype=np.int64),
+            np.asarray(columns['pid'], dtype=np.int64),
+            np.asarray(columns['command'], dtype=np.int64)
+        ])
+        groups = _Groups(codes, columns['time'])
+        pcpu = groups.describe(groups.sorted(_floats(columns['pcpu'])))
+        mem = groups.describe(groups.sorted(_floats(columns['mem'])))
+        ranking = np.argsort(-np.nan_to_num(pcpu['mean']), kind='stable')[:top]
+        out = []
+        for i in ranking.tolist():
+            container, pid, command = processes[i].tolist()
+            container_id = section.lookup(container)
+            out.append({
+                'container': container_id,
+                'name': self.container_names.get(container_id),
+                'pid': pid,
+                'command': section.lookup(command),
+                'samples': int(groups.counts[i]),
+                'pcpu': {k: _value(v[i]) for k, v in pcpu.items()},
+                'mem': {k: _value(v[i]) for k, v in mem.items()}
+            })
+        return out
+
+    def _timeline(self, section: SectionArrays, step: float) -> dict:
+        # mean of each container over a common grid of `step` seconds
+        columns = section.columns
+        containers, codes = np.unique(columns['container'], return_inverse=True)
+        time = _floats(columns['time'])
+        start = np.nanmin(time)
+        bins = ((time - start) // step).astype(np.int64)
+        num_bins = int(bins.max()) + 1
+        cells = codes * num_bins + bins
+        counts = np.bincount(cells, minlength=len(containers) * num_bins)
+        timeline = {
+            'start': float(start),
+            'step': step,
+            'containers': [section.lookup(c) for c in containers.tolist()]
+        }
+        for metric in ('pcpu', 'mem'):
+            values = _floats(columns[metric])
+            valid = ~np.isnan(values)
+            sums = np.bincount(cells[valid], weights=values[valid],
+                               minlength=len(containers) * num_bins)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                means = np.where(counts > 0, sums / counts, np.nan)
+            timeline[metric] = [
+                [None if v != v else v for v in row]
+                for row in np.round(means, 4).reshape(len(containers), num_bins).tolist()
+            ]
+        return timeline
+
+
+class _Groups(object):
+    # rows sorted by group, then time; statistics per group with segmented reductions
+
+    def __init__(self, codes: np.ndarray, time):
+        self._order = np.lexsort((_floats(time), codes))
+        sorted_codes = codes[self._order]
+        self.starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_codes)) + 1))
+        self.counts = np.diff(np.append(self.starts, len(sorted_codes)))
+        self._ends = self.starts + self.counts - 1
+
+    def sorted(self, values: np.ndarray) -> np.ndarray:
+        return values[self._order]
+
+    def first(self, values: np.ndarray) -> np.ndarray:
+        return values[self.starts]
+
+    def last(self, values: np.ndarray) -> np.ndarray:
+        return values[self._ends]
+
+    def describe(self, values: np.ndarray) -> dict:
+        # NaNs (missing values) sort last within each group and are left out
+        group = np.repeat(np.arange(len(self.starts)), self.counts)
+        valid = ~np.isnan(values)
+        counts = np.bincount(group[valid], minlength=len(self.starts))
+        sums = np.bincount(group[valid], weights=values[valid], minlength=len(self.starts))
+        order = np.lexsort((values, group))
+        ranked = values[order]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(counts > 0, sums / counts, np.nan)
+        has = counts > 0
+        last = self.starts + np.maximum(counts - 1, 0)
+        pct = self.starts + np.floor(ANALYSIS_PERCENTILE / 100 * np.maximum(counts - 1, 0))
+        return {
+            'mean': mean,
+            'min': np.where(has, ranked[self.starts], np.nan),
+            'max': np.where(has, ranked[last], np.nan),
+            'p{:d}'.format(ANALYSIS_PERCENTILE): np.where(has, ranked[pct.astype(np.int64)],
+                                                          np.nan)
+        }
+
+    def rate(self, values: np.ndarray, time: np.ndarray) -> np.ndarray:
+        # (last - first) / elapsed, for cumulative counters
+        elapsed = self.last(time) - self.first(time)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(elapsed > 0, (self.last(values) - self.first(values)) / elapsed,
+                            np.nan)
+
+
+def _unique_rows(keys: List[np.ndarray]) -> tuple:
+    # like np.unique(axis=0) on the stacked keys, a lot faster: each key is made dense on its
+    # own, then they are combined into a single int64
+    uniques, combined = [], np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        unique, inverse = np.unique(key, return_inverse=True)
+        uniques.append(unique)
+        combined = combined * len(unique) + inverse.reshape(-1)
+    groups, codes = np.unique(combined, return_inverse=True)
+    rows = []
+    for unique in reversed(uniques):
+        groups, idx = np.divmod(groups, len(unique))
+        rows.append(unique[idx])
+    return np.stack(rows[::-1], axis=1), codes.reshape(-1)
+
+
+def _from_rows(rows: List[dict], schema: tuple) -> SectionArrays:
+    strings, index = [], {}
+
+    def intern(value) -> int:
+        if value is None:
+            return -1
+        idx = index.get(value)
+        if idx is None:
+            idx = index[value] = len(strings)
+            strings.append(value)
+        return idx
+
+    columns = {}
+    for name, kind in schema:
+        values = [row.get(name) for row in rows]
+        if kind in ('d', 'q'):
+            columns[name] = _floats(values)
+        elif kind == 's':
+            columns[name] = np.array([intern(v) for v in values], dtype=np.int64)
+        else:
+            offsets, keys, data = [0], [], {field: [] for field in kind[1:]}
+            for value in values:
+                for key, entry in (value or {}).items():
+                    keys.append(intern(key))
+                    for field in kind[1:]:
+                        data[field].append(entry.get(field, 0))
+                offsets.append(len(keys))
+            columns[name] = {
+                'offsets': np.array(offsets, dtype=np.int64),
+                'keys': np.array(keys, dtype=np.int64),
+                **{field: np.array(d, dtype=np.int64) for field, d in data.items()}
+            }
+    return SectionArrays(columns, strings)
+
+
+def _floats(values) -> np.ndarray:
+    # missing values become NaN, numbers as strings (e.g., from `docker top`) are parsed
+    if isinstance(values, np.ndarray) and values.dtype.kind == 'f':
+        return values
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array([_float(v) for v in values], dtype=np.float64)
+
+
+def _float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _map_totals(offsets: np.ndarray, values: np.ndarray) -> np.ndarray:
+    # sum of the entries of each row of a map column (e.g., over network interfaces)
+    cumulative = np.concatenate(([0], np.cumsum(values, dtype=np.float64)))
+    return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+
+def _value(value) -> Optional[float]:
+    value = float(value)
+    return None if np.isnan(value) else round(value, 4)
+
+
+def print_report(report: dict):
+    general = report['log']
+    print('Log: {} (target: {}, duration: {} secs)'.format(
+        general.get('time_iso', '?'), general.get('target', '?'), general.get('duration', '?')))
+    print()
+    print('{:<30s} {:>8s} {:>8s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+        'Container', 'CPU%', 'CPU% max', 'Mem MB', 'Read B/s', 'Write B/s', 'Rx B/s', 'Tx B/s'))
+    for c in report['containers']:
+        print('{:<30s} {:>8s} {:>8s} {:>8s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+            (c['name'] or c['id'] or '?')[:30],
+            _fmt(c['pcpu']['mean']),
+            _fmt(c['pcpu']['max']),
+            _fmt(c['mem']['mean'], 1 / 2 ** 20),
+            _fmt(c.get('io_r_rate')),
+            _fmt(c.get('io_w_rate')),
+            _fmt(c.get('net_rx_rate')),
+            _fmt(c.get('net_tx_rate'))
+        ))
+    if report['processes']:
+        print()
+        print('{:<20s} {:>8s} {:>8s} {:>8s}  {}'.format(
+            'Container', 'PID', 'CPU%', 'CPU% max', 'Command'))
+        for p in report['processes']:
+            print('{:<20s} {:>8d} {:>8s} {:>8s}  {}'.format(
+                (p['name'] or p['container'] or 'host')[:20],
+                p['pid'],
+                _fmt(p['pcpu']['mean']),
+                _fmt(p['pcpu']['max']),
+                (p['command'] or '')[:60]
+            ))
+
+
+def _fmt(value: Optional[float], scale: float = 1.0) -> str:
+    return '-' if value is None else '{:.1f}'.format(value * scale)
+
+
+def main(args):
+    log = RecordedLog(args.log)
+    report = log.analyze(top=args.top, step=args.step)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'wt') as fout:
+            json.dump(report, fout)
@@ -1,12 +1,8 @@
 import os
 import sys
 import time
-import copy
 import logging
 import traceback
-import threading
-import docker
-import socket
 import datetime
 
 from dt_class_utils import DTProcess
@@ -15,22 +11,20 @@ from dt_class_utils import AppStatus
 from typing import Iterable, Union, Dict
 
 from .pool import Pool
+from .target import MonitorTarget, read_targets
+from .httpclient import HttpClient
+from .sampling import AdaptiveSampler
+from . import clock
 from .jobs import \
     PrinterJob, \
-    ContainerListJob, \
-    DeviceHealthJob, \
-    PublisherJob, \
-    EndpointInfoJob, \
+    AdaptiveSamplingJob, \
+    SelfProfileJob, \
     SystemProcessStatsJob
 from .constants import \
     APP_NAME, \
     WORKERS_NUM, \
     APP_HEARTBEAT_HZ, \
-    DEFAULT_DOCKER_TCP_PORT, \
-    JOB_FETCH_CONTAINER_LIST, \
-    JOB_FETCH_DEVICE_HEALTH, \
     JOB_PUSH_TO_SERVER, \
-    JOB_FETCH_ENDPOINT_INFO, \
     JOB_FETCH_SYSTEM_PROCESSES_STATS, \
     LOG_VERSION
 
@@ -40,87 +34,103 @@ class SystemMonitor(DTProcess):
     def __init__(self, args):
         super(SystemMonitor, self).__init__(APP_NAME)
         self.args = args
-        self._start_time = time.time()
-        self._start_time_iso = _iso_now()
-        self._lock = threading.Semaphore(1)
+        self.start_time = clock.ANCHOR_TIME
+        self.start_time_iso = _iso_now()
         # parse notes
         if os.environ.get('LOG_NOTES', None) is not None:
             self.args.notes = os.environ.get('LOG_NOTES')
         # ---
-        self._log: Dict[str, Union[dict, list]] = {
-            'general': {
-                'time': self._start_time,
-                'time_iso': self._start_time_iso,
-                'version': LOG_VERSION,
-                'group': self.args.group,
-                'subgroup': self.args.subgroup,
-                'type': self.args.type.lower(),
-                'target': self.get_target_name(),
-                'duration': self.args.duration,
-                'system': self.args.system,
-                'notes': self.args.notes,
-                'no_upload': self.args.no_upload
-            }
-        }
-        self._log_size = sys.getsizeof(self._log)
-        # ---
         # configure logger
         if self.args.debug or self.logger.getEffectiveLevel() == logging.DEBUG:
             self.logger.setLevel(logging.DEBUG)
             self.logger.debug('Running in Debug Mode!')
         # setup shutdown procedure
         self.register_shutdown_callback(self._clean_shutdown)
-        # create workers pool
-        self.pool = Pool(self.logger, WORKERS_NUM, self._exception_handler)
+        # create workers pool (shared by all the targets)
+        # (optional modules are only imported when used, to start sampling sooner)
+        self.profiler = None
+        if self.args.profile or self.args.profile_memory:
+            from .profiler import SelfProfiler
+            self.profiler = SelfProfiler(self.args.profile_memory)
+        engine = Pool
+        if self.args.engine == 'async':
+            from .asyncpool import AsyncPool as engine
+        self.pool = engine(self.logger, WORKERS_NUM, self.exception_handler, self.profiler)
+        # HTTP client shared by the jobs
+        self.http = HttpClient(self.pool.stats)
+        # latest samples, served by the metrics server (if needed)
+        self.metrics = None
+        if self.args.metrics_port:
+            from .metrics import MetricsSnapshot
+            self.metrics = MetricsSnapshot()
+        self._metrics_server = None
+        # adapts the sampling periods of the jobs (if needed)
+        self.sampler = AdaptiveSampler(self.pool.reschedule) if self.args.adaptive else None
+        # one log per target
+        self.targets = [MonitorTarget(self, target) for target in read_targets(self.args)]
+        # what is measured on this machine is only logged for the endpoints running on it
+        self._local_targets = [target for target in self.targets if target.is_local()]
+        if not self._local_targets and (self.args.system or self.profiler is not None):
+            self.logger.warning('No local target (unix://), the processes of the system and '
+                                'the cost of the monitor will not be logged')
         # print configuration
         print("""
 System-Monitor
 -- Configuration --------------------------
-Target: {target:s}
+Target(s): {target_list:s}
 Target Type: {type:s}
-Target Name: {target_name:s}
+Target Name(s): {target_names:s}
 Log Version: {log_version:s}
 Log Database: {database:s}
 Log Group: {group:s}
 Log SubGroup: {subgroup:s}
 Log duration: {duration:d} secs
-Log ID: {key:s}
+Log ID(s): {keys:s}
 Log Notes:
     "{notes}"
 -------------------------------------------
         """.format(
             **self.args.__dict__,
-            key=self.get_log_key(),
-            target_name=self.get_target_name(),
+            target_list=', '.join(t.args.target for t in self.targets),
+            target_names=', '.join(t.get_target_name() for t in self.targets),
+            keys=', '.join(t.get_log_key() for t in self.targets),
             log_version=LOG_VERSION
         ))
 
     def start(self):
         self.logger.info('Started logging...')
+        # start pool, jobs are executed as soon as they are enqueued
+        self.pool.run()
         # add printer job (if needed)
         if self.args.verbose:
             self.pool.enqueue(PrinterJob(self))
+        # add self profile job (if needed)
+        if self.profiler is not None:
+            self.pool.enqueue(SelfProfileJob(self, self.profiler))
+        # add adaptive sampling job (if needed)
+        if self.sampler is not None:
+            self.pool.enqueue(AdaptiveSamplingJob(self, self.sampler))
         # create system process stats job
-        if JOB_FETCH_SYSTEM_PROCESSES_STATS and self.args.system:
+        if JOB_FETCH_SYSTEM_PROCESSES_STATS and self.args.system and self._local_targets:
             self.pool.enqueue(SystemProcessStatsJob(self))
-        # initialize docker client
-        client = docker.DockerClient(base_url=_base_url(self.args))
-        # create endpoint info job
-        if JOB_FETCH_ENDPOINT_INFO:
-            self.pool.enqueue(EndpointInfoJob(self, client))
-        # create container updater job
-        if JOB_FETCH_CONTAINER_LIST:
-            self.pool.enqueue(ContainerListJob(self, client))
-        # create device health job
-        if JOB_FETCH_DEVICE_HEALTH:
-            self.pool.enqueue(DeviceHealthJob(self, self.args.target))
-        # start pool
-        self.pool.run()
+        # create the jobs of each target
+        for target in self.targets:
+            target.start()
+        # start metrics server (if needed)
+        if self.metrics is not None:
+            from .metrics import MetricsServer
+            self._metrics_server = MetricsServer(
+                self.args.metrics_port, self.metrics, self.get_progress)
+            self._metrics_server.start()
+            self.logger.info('Serving metrics on port {:d}'.format(self._metrics_server.port))
         # spin the app
         while not self.is_done():
             # breath
             time.sleep(1.0 / APP_HEARTBEAT_HZ)
         self.logger.info('The monitor timed out. Clearing jobs...')
+        # stop listening for new containers
+        for target in self.targets:
+            target.stop()
         # drop all the jobs returned by the workers
         self.pool.black_hole(True)
         # remove all jobs from the queue
@@ -132,8 +142,11 @@ Log Notes:
         # send log to server
         if not self.is_shutdown() and JOB_PUSH_TO_SERVER:
             self.logger.info('Collecting logged data')
-            self.pool.enqueue(PublisherJob(
-                self, self.get_log_key(), self.get_log(), self.args.no_upload))
+            if self.profiler is not None:
+                # final cost of the jobs
+                self.extend_log('monitor_self', self.profiler.rows())
+            for target in self.targets:
+                target.publish()
             self.logger.info('Pushing data to the cloud')
             # drop all the jobs returned by the workers
             self.pool.black_hole(True)
@@ -146,30 +159,23 @@ Log Notes:
             self.shutdown()
         self.pool.abort()
         self.logger.info('Workers stopped!')
+        # close the logs
+        for target in self.targets:
+            target.close()
+        self.http.close()
+        if self.profiler is not None:
+            self.profiler.close()
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
         # update status bar one more time and then stop it
         # ---
         self.logger.info('Done!')
 
     def extend_log(self, key: str, value: Union[Iterable, Dict]):
-        self._lock.acquire()
-        # create list/dict if not present
-        if key not in self._log:
-            self._log[key] = [] if isinstance(value, list) else {}
-        # handle type mismatch
-        if type(self._log[key]) != type(value):
-            self._lock.release()
-            raise ValueError('Cannot extend a log of type {} with an object of type {}'.format(
-                type(self._log[key]), type(value)
-            ))
-        # handle lists:
-        if isinstance(value, list):
-            self._log[key].extend(value)
-        if isinstance(value, dict):
-            self._log[key].update(value)
-        # update size
-        self._log_size += _get_size(value)
-        # release lock
-        self._lock.release()
+        # what is not specific to a target (e.g., the monitor itself, the processes of the
+        # system) describes this machine, it goes to the logs of the local targets only
+        for target in self._local_targets:
+            target.extend_log(key, value)
 
     def is_done(self):
         return 0 < self.args.duration < self.uptime()
@@ -186,49 +192,31 @@ Log Notes:
             AppStatus.KILLING: 'kill',
             AppStatus.DONE: 'done'
         }[self.status]
-        stats['log_size'] = _sizeof_fmt(self._log_size)
+        progress = {target.get_target_name(): target.log_progress() for target in self.targets}
+        stats['log_size'] = _sizeof_fmt(sum(p['log_size'] for p in progress.values()))
+        stats['log_sections'] = {}
+        for p in progress.values():
+            for section, size in p['log_sections'].items():
+                stats['log_sections'][section] = stats['log_sections'].get(section, 0) + size
+        stats['log_pending'] = sum(p['log_pending'] for p in progress.values())
+        stats['log_memory'] = _sizeof_fmt(sum(p['log_memory'] for p in progress.values()))
+        stats['log_evicted'] = sum(p['log_evicted'] for p in progress.values())
+        if len(self.targets) > 1:
+            stats['targets'] = {
+                name: _sizeof_fmt(p['log_size']) for name, p in progress.items()
+            }
+        if self.sampler is not None:
+            stats['sampling'] = self.sampler.stats()
+        if self.profiler is not None:
+            stats['monitor_self'] = self.profiler.summary()
         return stats
 
-    def get_log(self):
-        self._lock.acquire()
-        # return a copy
-        log = copy.deepcopy(self._log)
-        # release lock
-        self._lock.release()
-        # ---
-        return log
-
-    def get_log_key(self):
-        return 'v{}__{}__{}__{}__{:d}'.format(
-            LOG_VERSION.replace('.', '_'),
-            self.args.group,
-            self.args.subgroup,
-            self.get_target_name(),
-            int(self._start_time)
-        )
-
-    def get_target_name(self):
-        target = socket.gethostname() if self.args.target.startswith(
-            'unix:') else self.args.target
-        target, *_ = target.split(':')
-        target = target.rstrip('.local')
-        return target.lower()
-
-    def _exception_handler(self, exception_type, exception, tback):
+    def exception_handler(self, exception_type, exception, tback):
         self.pool.stats.increase('tasks_failed')
         traceback.print_exception(
             exception_type, exception, tback, file=sys.stderr)
 
 
-def _base_url(args):
-    if args.target.startswith('unix:'):
-        return args.target
-    else:
-        hostname, port, *_ = (args.target + ':' +
-                              str(DEFAULT_DOCKER_TCP_PORT)).split(':')
-        return 'tcp://{:s}:{:s}'.format(args.target, port)
-
-
 def _sizeof_fmt(num, suffix='B'):
     for unit in ['', 'K', 'M', 'G', 'T', 'P', 'E', 'Z']:
         if abs(num) < 1024.0:
@@ -237,27 +225,6 @@ def _sizeof_fmt(num, suffix='B'):
     return "%.2f%s%s" % (num, 'Yi', suffix)
 
 
-def _get_size(obj, seen=None):
-    """Recursively finds size of objects"""
-    size = sys.getsizeof(obj)
-    if seen is None:
-        seen = set()
-    obj_id = id(obj)
-    if obj_id in seen:
-        return 0
-    # Important mark as seen *before* entering recursion to gracefully handle
-    # self-referential objects
-    seen.add(obj_id)
-    if isinstance(obj, dict):
-        size += sum([_get_size(v, seen) for v in obj.values()])
-        size += sum([_get_size(k, seen) for k in obj.keys()])
-    elif hasattr(obj, '__dict__'):
-        size += _get_size(obj.__dict__, seen)
-    elif hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes, bytearray)):
-        size += sum([_get_size(i, seen) for i in obj])
-    return size
-
-
 def _iso_now():
     return datetime.datetime.utcnow().replace(
         tzinfo=datetime.timezone.utc
@@ -0,0 +1,139 @@
+import json
+import asyncio
+
+from typing import Optional
+from urllib.parse import urlencode
+
+from .constants import \
+    ASYNC_DOCKER_MAX_CONNECTIONS, \
+    ASYNC_DOCKER_REQUEST_TIMEOUT_S
+
+
+class AsyncDockerError(Exception):
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncDockerClient(object):
+    """Minimal asyncio client for the Docker Engine API (GET requests returning JSON).
+
+    Speaks HTTP/1.1 directly over the unix socket (or TCP) of the Docker endpoint, one
+    connection per request, so that many requests can be in flight on a single thread.
+    """
+
+    def __init__(self, base_url: str):
+        if base_url.startswith('unix://'):
+            self._path = '/' + base_url[len('unix://'):].lstrip('/')
+            self._address = None
+        elif base_url.startswith('tcp://'):
+            host, port = base_url[len('tcp://'):].rsplit(':', 1)
+            self._path = None
+            self._address = (host, int(port))
+        else:
+            raise ValueError('Unsupported Docker endpoint {}'.format(base_url))
+        # created lazily, it has to belong to the loop that uses it
+        self._semaphore = None
+
+    async def get_json(self, path: str, params: Optional[dict] = None,
+                       timeout: float = ASYNC_DOCKER_REQUEST_TIMEOUT_S):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(ASYNC_DOCKER_MAX_CONNECTIONS)
+        if params:
+            path = '{}?{}'.format(path, urlencode(params))
+        async with self._semaphore:
+            try:
+                status, body = await asyncio.wait_for(self._get(path), timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                raise AsyncDockerError('GET {}: {}'.format(path, str(e) or type(e).__name__))
+        if status >= 400:
+            raise AsyncDockerError('GET {}: [{}] {}'.format(
+                path, status, body.decode('utf-8', errors='replace').strip()), status)
+        return json.loads(body)
+
+    async def stream_json(self, path: str, params: Optional[dict] = None,
+                          timeout: float = ASYNC_DOCKER_REQUEST_TIMEOUT_S):
+        """Yields the JSON documents of a streaming response (e.g., stats), one per line.
+
+        Streams are long-lived, they do not count against the limit of connections. An error
+        is raised if nothing is received for `timeout` seconds.
+        """
+        if params:
+            path = '{}?{}'.format(path, urlencode(params))
+        writer = None
+        try:
+            reader, writer, status, headers = await asyncio.wait_for(self._open(path), timeout)
+            if status >= 400:
+                body = await asyncio.wait_for(self._read_body(reader, headers), timeout)
+                raise AsyncDockerError('GET {}: [{}] {}'.format(
+                    path, status, body.decode('utf-8', errors='replace').strip()), status)
+            chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+            buffer = b''
+            while True:
+                data = await asyncio.wait_for(
+                    self._read_chunk(reader) if chunked else reader.read(65536), timeout)
+                if not data:
+                    return
+                *lines, buffer = (buffer + data).split(b'\n')
+                for line in lines:
+                    if line.strip():
+                        yield json.loads(line)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            raise AsyncDockerError('GET {}: {}'.format(path, str(e) or type(e).__name__))
+        finally:
+            if writer is not None:
+                writer.close()
+
+    async def _get(self, path: str):
+        reader, writer, status, headers = await self._open(path)
+        try:
+            return status, await self._read_body(reader, headers)
+        finally:
+            writer.close()
+
+    async def _open(self, path: str):
+        # sends the request, returns the connection, the status and the headers of the response
+        if self._path is not None:
+            reader, writer = await asyncio.open_unix_connection(self._path)
+        else:
+            reader, writer = await asyncio.open_connection(*self._address)
+        try:
+            writer.write('GET {} HTTP/1.1\r\nHost: docker\r\nConnection: close\r\n\r\n'.format(
+                path).encode('ascii'))
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer, status, headers
+
+    async def _read_body(self, reader, headers: dict) -> bytes:
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                chunk = await self._read_chunk(reader)
+                if not chunk:
+                    break
+                body += chunk
+            return bytes(body)
+        if 'content-length' in headers:
+            return await reader.readexactly(int(headers['content-length']))
+        return await reader.read()
+
+    @staticmethod
+    async def _read_chunk(reader) -> bytes:
+        # one chunk of a chunked transfer encoding, empty at the end of the body
+        size = int((await reader.readline()).split(b';')[0], 16)
+        if size == 0:
+            return b''
+        chunk = await reader.readexactly(size)
+        await reader.readline()
+        return chunk
@@ -0,0 +1,245 @@
+import sys
+import time
+import asyncio
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .pool import StatisticsCollector
+
+
+class AsyncPool:
+    """Drop-in replacement for Pool running the jobs on an asyncio event loop.
+
+    Jobs that set `ASYNC` (and implement `run_async`) are awaited on the loop thread, so any number of them
+    can wait on Docker at the same time. The others are run on a small thread pool, as they
+    would be by Pool.
+    """
+
+    def __init__(self, logger, thread_count, exception_handler, profiler=None):
+        self.logger = logger
+        self.thread_count = thread_count
+        self.exception_handler = exception_handler
+        self.stats = StatisticsCollector()
+        self.profiler = profiler
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        # jobs waiting for their next execution
+        self._timers = {}
+        self._running = 0
+        self._running_sync = 0
+        # jobs enqueued before the loop was started
+        self._backlog = []
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._all_tasks_done = threading.Condition(self._lock)
+        self._unfinished_tasks = 0
+        self._black_hole = False
+
+    """Start the event loop, or restart it if you've aborted"""
+
+    def run(self, block=False):
+        if block:
+            while self.alive():
+                time.sleep(1)
+        elif self.alive():
+            return False
+        self._stopped = False
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(self.thread_count, thread_name_prefix='thread')
+        self._thread = threading.Thread(target=self._run_loop, name='event-loop', daemon=True)
+        self._thread.start()
+        with self._lock:
+            backlog, self._backlog = self._backlog, []
+            for job in backlog:
+                self._loop.call_soon_threadsafe(self._schedule, job)
+        return True
+
+    def black_hole(self, val):
+        self._black_hole = val
+
+    """Add a task to the queue"""
+
+    def enqueue(self, job):
+        if self._black_hole:
+            self.logger.debug(
+                'Job [{:s}] went down the black hole.'.format(str(job))
+            )
+            return
+        with self._lock:
+            self._unfinished_tasks += 1
+            if not self._accepting():
+                self._backlog.append(job)
+                return
+            # under the lock, abort() cannot stop (and close) the loop in between
+            self._loop.call_soon_threadsafe(self._schedule, job)
+
+    """Schedule a queued job again, e.g., after its period changed"""
+
+    def reschedule(self, job):
+        with self._lock:
+            if self._accepting():
+                self._loop.call_soon_threadsafe(self._reschedule, job)
+
+    """Wait for completion of all the tasks in the queue"""
+
+    def join(self):
+        self.logger.debug('Joining the pool with {:d} uncompleted jobs'.format(
+            self._unfinished_tasks))
+        with self._lock:
+            while self._unfinished_tasks:
+                self._all_tasks_done.wait()
+
+    """Remove all jobs that are waiting and wait for those being executed"""
+
+    def terminate_all(self):
+        with self._lock:
+            backlog, self._backlog = self._backlog, []
+            self._mark_done(len(backlog))
+        if self._accepting():
+            asyncio.run_coroutine_threadsafe(self._clear(), self._loop).result()
+
+    """Stop the event loop once it is done with what it is currently doing"""
+
+    def abort(self, block=False):
+        self.terminate_all()
+        with self._lock:
+            if not self._accepting():
+                return
+            self._stopped = True
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait=block)
+        if block:
+            self._thread.join()
+
+    def __del__(self):
+        self.abort()
+
+    """Returns True if the event loop is running"""
+
+    def alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    """Returns True if no job is being executed"""
+
+    def idle(self):
+        return self._running == 0
+
+    """Returns True if not tasks are left to be completed"""
+
+    def done(self):
+        return self._unfinished_tasks == 0
+
+    def get_stats(self):
+        stats = self.stats.get_stats()
+        stats['jobs_idle'] = self.thread_count - self._running_sync if self.alive() else 0
+        stats['jobs_max'] = self.thread_count if self.alive() else 0
+        stats['jobs_running'] = self._running
+        stats['tasks_queued'] = len(self._timers)
+        return stats
+
+    def _accepting(self):
+        # the loop is running and was not told to stop
+        return self.alive() and not self._stopped
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    def _schedule(self, job):
+        # (on the loop) wait until the job is due
+        due = max(job.next_execution(), time.time())
+        self._timers[job] = self._loop.call_at(
+            self._loop.time() + (due - time.time()), self._start, job, due)
+
+    def _reschedule(self, job):
+        # (on the loop) only the jobs waiting to be due, running ones are scheduled when done
+        timer = self._timers.get(job)
+        if timer is None:
+            return
+        timer.cancel()
+        self._schedule(job)
+
+    def _start(self, job, due):
+        # (on the loop) the job is due
+        del self._timers[job]
+        if job.is_terminated():
+            self.logger.debug('Job [{:s}] was found terminated in the queue.'.format(str(job)))
+            self._task_done()
+            return
+        # keep track of how late we are with respect to the job's schedule
+        self.stats.observe('scheduling_lag', str(job), time.time() - due)
+        self._loop.create_task(self._execute(job))
+
+    async def _execute(self, job):
+        self._running += 1
+        try:
+            if job.is_async():
+                start = self.profiler.start() if self.profiler is not None else None
+                try:
+                    await job.execute_async()
+                finally:
+                    if start is not None:
+                        # CPU time includes the other coroutines that ran in the meantime
+                        self.profiler.stop(job, start)
+            else:
+                await self._loop.run_in_executor(self._executor, self._execute_sync, job)
+        except:
+            ex_type, ex, tb = sys.exc_info()
+            self.exception_handler(ex_type, ex, tb)
+        finally:
+            self._running -= 1
+            if not job.is_terminated():
+                # reset job and put back in the queue
+                job.reset()
+                self.enqueue(job)
+            else:
+                self.logger.debug(
+                    'Job [{:s}] was found terminated in the queue.'.format(str(job))
+                )
+            # task complete no matter what happened
+            self._task_done()
+
+    def _execute_sync(self, job):
+        # (on a thread of the executor)
+        with self._lock:
+            self._running_sync += 1
+        try:
+            if self.profiler is None:
+                return job.execute()
+            start = self.profiler.start()
+            try:
+                return job.execute()
+            finally:
+                self.profiler.stop(job, start)
+        finally:
+            with self._lock:
+                self._running_sync -= 1
+
+    async def _clear(self):
+        # (on the loop) drop the jobs that are waiting
+        for job, timer in list(self._timers.items()):
+            timer.cancel()
+            self.logger.debug(
+                'Job [{:s}] was found in the queue. Now terminated.'.format(str(job))
+            )
+        num = len(self._timers)
+        self._timers.clear()
+        with self._lock:
+            self._mark_done(num)
+
+    def _task_done(self):
+        with self._lock:
+            self._mark_done(1)
+
+    def _mark_done(self, num):
+        unfinished = self._unfinished_tasks - num
+        if unfinished < 0:
+            raise ValueError('task_done() called too many times')
+        self._unfinished_tasks = unfinished
+        if unfinished == 0:
+            self._all_tasks_done.notify_all()
@@ -0,0 +1,187 @@
+import os
+
+from typing import Dict, Optional
+
+from .constants import CGROUP_ROOT, PROC_ROOT
+
+
+# where Docker places the cgroup of a container, relative to the cgroup root (v2) or to each
+# controller's hierarchy (v1), for the cgroupfs and systemd drivers respectively
+CGROUP_CONTAINER_PATHS = [
+    'docker/{id}',
+    'system.slice/docker-{id}.scope'
+]
+
+
+class CgroupReader(object):
+    """Reads container stats straight from the cgroup filesystem (v1 or v2).
+
+    Stats are returned in the same shape as the Docker stats API, so that they can be fed to
+    the same calculations used for the samples returned by the Docker daemon.
+    """
+
+    def __init__(self, root: str = CGROUP_ROOT, proc_root: str = PROC_ROOT):
+        self._root = root
+        self._proc_root = proc_root
+        self._version = 2 if os.path.isfile(os.path.join(root, 'cgroup.controllers')) else 1
+        self._paths: Dict[str, Dict[str, str]] = {}
+        self._clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    @staticmethod
+    def is_available(root: str = CGROUP_ROOT) -> bool:
+        return os.path.isdir(root) and len(os.listdir(root)) > 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def stats(self, container_id: str) -> Optional[dict]:
+        paths = self._find(container_id)
+        if paths is None:
+            return None
+        try:
+            return self._stats_v2(paths) if self._version == 2 else self._stats_v1(paths)
+        except FileNotFoundError:
+            # the container is gone (or its processes are not visible), Docker is asked instead
+            self._paths.pop(container_id, None)
+            return None
+
+    def _find(self, container_id: str) -> Optional[Dict[str, str]]:
+        if container_id in self._paths:
+            return self._paths[container_id]
+        controllers = [''] if self._version == 2 else ['cpuacct', 'memory', 'blkio']
+        paths = {}
+        for controller in controllers:
+            for path in CGROUP_CONTAINER_PATHS:
+                path = os.path.join(self._root, controller, path.format(id=container_id))
+                if os.path.isdir(path):
+                    paths[controller] = path
+                    break
+            else:
+                return None
+        self._paths[container_id] = paths
+        return paths
+
+    def _stats_v2(self, paths: Dict[str, str]) -> dict:
+        path = paths['']
+        cpu = _read_keyed(os.path.join(path, 'cpu.stat'))
+        memory = _read_keyed(os.path.join(path, 'memory.stat'))
+        limit = _read_value(os.path.join(path, 'memory.max'))
+        io_r = io_w = 0
+        for line in _read_lines(os.path.join(path, 'io.stat')):
+            fields = dict(f.split('=', 1) for f in line.split()[1:] if '=' in f)
+            io_r += int(fields.get('rbytes', 0))
+            io_w += int(fields.get('wbytes', 0))
+        return self._docker_stats(
+            cpu_usage=cpu['usage_usec'] * 1000,
+            mem_usage=_read_value(os.path.join(path, 'memory.current')),
+            # on cgroup v2 Docker uses 'inactive_file' in place of 'cache'
+            mem_cache=memory.get('inactive_file', 0),
+            mem_limit=limit,
+            io_r=io_r,
+            io_w=io_w,
+            procs=os.path.join(path, 'cgroup.procs')
+        )
+
+    def _stats_v1(self, paths: Dict[str, str]) -> dict:
+        memory = _read_keyed(os.path.join(paths['memory'], 'memory.stat'))
+        io_r = io_w = 0
+        blkio = os.path.join(paths['blkio'], 'blkio.throttle.io_service_bytes_recursive')
+        for line in _read_lines(blkio):
+            fields = line.split()
+            if len(fields) == 3 and fields[1] == 'Read':
+                io_r += int(fields[2])
+            elif len(fields) == 3 and fields[1] == 'Write':
+                io_w += int(fields[2])
+        return self._docker_stats(
+            cpu_usage=_read_value(os.path.join(paths['cpuacct'], 'cpuacct.usage')),
+            mem_usage=_read_value(os.path.join(paths['memory'], 'memory.usage_in_bytes')),
+            mem_cache=memory.get('total_cache', memory.get('cache', 0)),
+            mem_limit=_read_value(os.path.join(paths['memory'], 'memory.limit_in_bytes')),
+            io_r=io_r,
+            io_w=io_w,
+            procs=os.path.join(paths['memory'], 'cgroup.procs')
+        )
+
+    def _docker_stats(self, cpu_usage, mem_usage, mem_cache, mem_limit, io_r, io_w, procs):
+        system_usage, online_cpus = self._system_cpu_usage()
+        # unlimited containers are limited by the host memory
+        mem_total = self._mem_total()
+        if mem_limit is None or mem_limit > mem_total:
+            mem_limit = mem_total
+        return {
+            'cpu_stats': {
+                'cpu_usage': {'total_usage': cpu_usage},
+                'system_cpu_usage': system_usage,
+                'online_cpus': online_cpus
+            },
+            'memory_stats': {
+                'usage': mem_usage,
+                'limit': mem_limit,
+                'stats': {'cache': mem_cache}
+            },
+            'blkio_stats': {
+                'io_service_bytes_recursive': [
+                    {'op': 'Read', 'value': io_r},
+                    {'op': 'Write', 'value': io_w}
+                ]
+            },
+            'networks': self._networks(procs)
+        }
+
+    def _system_cpu_usage(self):
+        # same as Docker: total time spent by all CPUs (in nanoseconds) and number of CPUs
+        usage, cpus = 0, 0
+        for line in _read_lines(os.path.join(self._proc_root, 'stat')):
+            if line.startswith('cpu '):
+                usage = sum(int(v) for v in line.split()[1:8])
+            elif line.startswith('cpu'):
+                cpus += 1
+            else:
+                break
+        return usage * (10 ** 9) // self._clock_ticks, cpus
+
+    def _mem_total(self) -> int:
+        meminfo = _read_keyed(os.path.join(self._proc_root, 'meminfo'), sep=':')
+        return meminfo.get('MemTotal', 0) * 1024
+
+    def _networks(self, procs: str) -> dict:
+        # network counters live in the network namespace of any process of the container.
+        # A missing file (e.g., the process is not in our PID namespace) is not an empty
+        # sample, it makes the caller fall back to Docker
+        pids = _read_lines(procs)
+        if not pids:
+            return {}
+        networks = {}
+        lines = _read_lines(os.path.join(self._proc_root, pids[0], 'net', 'dev'))
+        for line in lines[2:]:
+            iface, counters = line.split(':', 1)
+            iface, counters = iface.strip(), counters.split()
+            if iface == 'lo':
+                continue
+            networks[iface] = {
+                'rx_bytes': int(counters[0]),
+                'tx_bytes': int(counters[8])
+            }
+        return networks
+
+
+def _read_lines(path: str) -> list:
+    with open(path, 'rt') as fin:
+        return fin.read().splitlines()
+
+
+def _read_value(path: str) -> Optional[int]:
+    with open(path, 'rt') as fin:
+        value = fin.read().strip()
+    return None if value == 'max' else int(value)
+
+
+def _read_keyed(path: str, sep: str = None) -> Dict[str, int]:
+    values = {}
+    for line in _read_lines(path):
+        key, _, value = line.partition(sep) if sep else line.partition(' ')
+        value = value.split()
+        if value:
+            values[key.strip()] = int(value[0])
+    return values
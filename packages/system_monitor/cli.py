@@ -1,9 +1,16 @@
 import argparse
 
 from .constants import \
+    ENGINES,\
+    EXPORT_FORMATS,\
+    EXPORT_DEFAULT_DIR,\
+    ANALYSIS_TOP_PROCESSES,\
+    ANALYSIS_TIMELINE_STEP_S,\
+    LOG_API_COMPRESSIONS,\
     LOG_API_DEFAULT_DATABASE,\
     LOG_DEFAULT_SUBGROUP,\
     LOG_DEFAULT_GROUP,\
+    LOG_RETENTION_DEFAULT_ROWS,\
     DEFAULT_TARGET
 
 
@@ -14,8 +21,17 @@ def get_parser():
                         help="Specify a device type (e.g., duckiebot, watchtower)")
     parser.add_argument('-T',
                         '--target',
-                        default=DEFAULT_TARGET,
-                        help="Specify a Docker endpoint to monitor")
+                        default=None,
+                        help="Specify a Docker endpoint to monitor (default: {})".format(
+                            DEFAULT_TARGET))
+    parser.add_argument('--targets',
+                        default=[],
+                        nargs='+',
+                        help="Specify more Docker endpoints to monitor, each gets its own log")
+    parser.add_argument('--targets-file',
+                        default=None,
+                        type=str,
+                        help="File listing Docker endpoints to monitor, one per line")
     parser.add_argument('--app-id',
                         required=True,
                         type=str,
@@ -68,6 +84,103 @@ def get_parser():
                         action='store_true',
                         default=False,
                         help="Run in verbose mode")
+    parser.add_argument('--log-dir',
+                        default=None,
+                        type=str,
+                        help="Stream the log to segments on disk in this directory " +
+                             "instead of keeping it in memory")
+    parser.add_argument('--retention-rows',
+                        default=None,
+                        type=int,
+                        help=("Keep at most (about) this many rows per section in memory, " +
+                              "evicting the oldest (0 = unbounded, default: {} if the " +
+                              "duration is 0, unbounded otherwise)").format(
+                                  LOG_RETENTION_DEFAULT_ROWS))
+    parser.add_argument('--retention-downsample',
+                        default=0,
+                        type=float,
+                        help="Before evicting rows, keep one per container (and process) " +
+                             "every this many seconds (0 = just evict)")
+    parser.add_argument('--chunked-upload',
+                        default=False,
+                        action='store_true',
+                        help="Upload the log compressed and in parts, each retried on its own")
+    parser.add_argument('--compression',
+                        default='gzip',
+                        choices=LOG_API_COMPRESSIONS,
+                        help="Compression used for chunked uploads")
+    parser.add_argument('--publish-every',
+                        default=0,
+                        type=int,
+                        help="Push what was logged to the server every this many seconds " +
+                             "while monitoring, instead of all at once at the end (0 = disabled)")
+    parser.add_argument('--metrics-port',
+                        default=0,
+                        type=int,
+                        help="Serve the latest samples and the monitor stats on this port, " +
+                             "on /metrics (Prometheus) and /metrics.json (0 = disabled)")
+    parser.add_argument('--adaptive',
+                        default=False,
+                        action='store_true',
+                        help="Sample faster while containers are busy and slower while idle, " +
+                             "and throttle sampling when the monitor exceeds its CPU budget")
+    parser.add_argument('--profile',
+                        default=False,
+                        action='store_true',
+                        help="Measure the CPU and wall time taken by each job and log it " +
+                             "to the 'monitor_self' section")
+    parser.add_argument('--profile-memory',
+                        default=False,
+                        action='store_true',
+                        help="Also measure the memory allocated by each job (slower)")
+    parser.add_argument('--summary-only',
+                        default=False,
+                        action='store_true',
+                        help="Only keep (and upload) the rollups of the samples in the " +
+                             "'summary' and 'summary_windows' sections, drop the raw samples")
+    parser.add_argument('--dedup-configs',
+                        default=False,
+                        action='store_true',
+                        help="Store the parts shared by the container configurations once, in " +
+                             "the 'container_config_blobs' section (consumers must expand them)")
+    parser.add_argument('--engine',
+                        default='threads',
+                        choices=ENGINES,
+                        help="Run the jobs on a pool of threads, or on an asyncio event loop " +
+                             "(scales to many containers with a single thread)")
+    parser.add_argument('--export-format',
+                        default='json',
+                        choices=EXPORT_FORMATS,
+                        help="Format of the log stored with --no-upload: a JSON file, or a " +
+                             "directory with one memory-mappable NumPy array per column")
+    parser.add_argument('--export-dir',
+                        default=EXPORT_DEFAULT_DIR,
+                        type=str,
+                        help="Directory where the log is stored with --no-upload")
     parser.add_argument("--no-upload", dest="no_upload", action="store_true",
                         default=False, help="Do not upload the statistics to the Duckietown server.")
     return parser
+
+
+def get_analyze_parser():
+    parser = argparse.ArgumentParser(prog='system_monitor analyze',
+                                     description="Analyze a log recorded with --no-upload")
+    parser.add_argument('log',
+                        type=str,
+                        help="Path to the log, a JSON file or a directory (--export-format " +
+                             "columnar)")
+    parser.add_argument('-n',
+                        '--top',
+                        default=ANALYSIS_TOP_PROCESSES,
+                        type=int,
+                        help="Number of processes to list, by mean CPU usage")
+    parser.add_argument('--step',
+                        default=ANALYSIS_TIMELINE_STEP_S,
+                        type=float,
+                        help="Resolution of the timelines, in seconds")
+    parser.add_argument('-o',
+                        '--output',
+                        default=None,
+                        type=str,
+                        help="Write the full report (including the timelines) to this JSON file")
+    return parser
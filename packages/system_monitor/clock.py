@@ -0,0 +1,27 @@
+import time
+
+
+# wall time and monotonic time, read together once when the monitor starts
+ANCHOR_TIME = time.time()
+ANCHOR_MONOTONIC = time.monotonic()
+
+
+def now() -> float:
+    """Wall time (seconds since the epoch) derived from the monotonic clock.
+
+    All the samples taken by the monitor, from all of its targets, are stamped on this same
+    timeline, which never jumps (e.g., when NTP adjusts the system clock mid-run).
+    """
+    return ANCHOR_TIME + (time.monotonic() - ANCHOR_MONOTONIC)
+
+
+def from_wall(t: float) -> float:
+    """Places a wall time taken elsewhere (e.g., by the Docker daemon) on the timeline of `now`"""
+    return now() - (time.time() - t)
+
+
+def anchor() -> dict:
+    return {
+        'time': ANCHOR_TIME,
+        'monotonic': ANCHOR_MONOTONIC
+    }
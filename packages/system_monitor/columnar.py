@@ -0,0 +1,506 @@
+import sys
+import json
+import math
+
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+# Column kinds:
+#   'd'         float64
+#   'q'         int64
+#   's'         string, interned in the section's string table
+#   ('m', ...)  map of name -> {field: int64}, e.g., network interface -> {rx, tx}
+PROCESS_STATS_SCHEMA = (
+    ('container', 's'),
+    ('time', 'd'),
+    ('ppid', 'q'),
+    ('pid', 'q'),
+    ('pcpu', 'd'),
+    ('nthreads', 'q'),
+    ('cputime', 's'),
+    ('pmem', 'd'),
+    ('mem', 'd'),
+    ('command', 's')
+)
+
+COLUMNAR_SCHEMAS = {
+    'container_stats': (
+        ('container', 's'),
+        ('time', 'd'),
+        ('pcpu', 'd'),
+        ('io_r', 'q'),
+        ('io_w', 'q'),
+        ('mem', 'q'),
+        ('pmem', 'd'),
+        ('network', ('m', 'rx', 'tx'))
+    ),
+    'process_stats': PROCESS_STATS_SCHEMA,
+    'all_process_stats': PROCESS_STATS_SCHEMA
+}
+
+
+class StringTable(object):
+
+    def __init__(self):
+        self._strings: List[str] = []
+        self._index = {}
+        self._nbytes = 0
+        # length of each string once encoded to JSON (with quotes and escapes)
+        self._encoded = array('q')
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        idx = self._index.get(value)
+        if idx is None:
+            idx = len(self._strings)
+            self._strings.append(value)
+            self._index[value] = idx
+            self._nbytes += sys.getsizeof(value)
+            self._encoded.append(len(json.dumps(value)))
+        return idx
+
+    def lookup(self, idx: int) -> Optional[str]:
+        return None if idx < 0 else self._strings[idx]
+
+    def strings(self) -> List[str]:
+        return list(self._strings)
+
+    def encoded_lengths(self, indices) -> List[int]:
+        encoded = self._encoded
+        return [encoded[i] if i >= 0 else _NULL_LENGTH for i in indices]
+
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._strings)
+
+
+class ColumnarSection(object):
+    """List section stored as one typed array per column instead of one dict per row.
+
+    Rows are written out as they were logged before (see `JSON_FORMATS`), the few fields
+    outside of the schema (if any) are kept aside, per row.
+    """
+
+    def __init__(self, schema: tuple, formats: Optional[Dict[str, Callable]] = None):
+        self._schema = schema
+        self._formats = formats or {}
+        self._names = [name for name, _ in schema]
+        self._strings = StringTable()
+        self._columns = [_make_column(kind, self._strings) for _, kind in schema]
+        self._length = 0
+        # row index -> fields outside of the schema
+        self._extras: Dict[int, dict] = {}
+        # {"name": <value>, ...} without the values
+        self._row_overhead = len(json.dumps({name: None for name in self._names})) - \
+            _NULL_LENGTH * len(self._names)
+
+    @property
+    def schema(self) -> tuple:
+        return self._schema
+
+    @property
+    def formats(self) -> Dict[str, Callable]:
+        return self._formats
+
+    @property
+    def strings(self) -> StringTable:
+        return self._strings
+
+    @property
+    def extras(self) -> Dict[int, dict]:
+        return self._extras
+
+    def __len__(self):
+        return self._length
+
+    def extend(self, rows: list) -> List[int]:
+        # rows as returned by `normalize`, returns the length of the new rows encoded to JSON
+        start = self._length
+        num_names = len(self._names)
+        for row in rows:
+            for name, column in zip(self._names, self._columns):
+                column.append(row.get(name))
+            if len(row) > num_names:
+                self._extras[self._length] = {
+                    k: v for k, v in row.items() if k not in self._names
+                }
+            self._length += 1
+        return self.encoded_lengths(start)
+
+    def encoded_lengths(self, start: int = 0, stop: int = None) -> List[int]:
+        # same as the length of `json.dumps(row)` for each row, from the typed values
+        stop = self._length if stop is None else min(stop, self._length)
+        columns = [
+            column.encoded_lengths(start, stop) if name not in self._formats else
+            # numbers written as strings, quoted (digits never need escaping)
+            [len(value) + 2 for value in map(self._formats[name], column.values(start, stop))]
+            for name, column in zip(self._names, self._columns)
+        ]
+        overhead = self._row_overhead
+        lengths = [overhead + sum(lengths) for lengths in zip(*columns)]
+        for i, extras in self._extras.items():
+            if start <= i < stop:
+                lengths[i - start] += _extras_length(extras)
+        return lengths
+
+    def trim(self, num: int):
+        # drop the oldest rows
+        num = min(num, self._length)
+        for column in self._columns:
+            column.trim(num)
+        self._length -= num
+        if self._extras:
+            self._extras = {i - num: e for i, e in self._extras.items() if i >= num}
+
+    def select(self, indices: List[int]) -> 'ColumnarSection':
+        # new section with only the given rows, the strings no row uses anymore are dropped
+        section = ColumnarSection(self._schema, self._formats)
+        remap = {}
+        section._columns = [
+            column.select(indices, section._strings, remap) for column in self._columns
+        ]
+        section._length = len(indices)
+        if self._extras:
+            section._extras = {
+                j: self._extras[i] for j, i in enumerate(indices) if i in self._extras
+            }
+        return section
+
+    def copy(self) -> 'ColumnarSection':
+        return self.select(list(range(self._length)))
+
+    def nbytes(self) -> int:
+        return sum(column.nbytes() for column in self._columns) + self._strings.nbytes()
+
+    def buffers(self, name: str) -> tuple:
+        # the arrays backing a column (the map columns have offsets, keys, one per field)
+        return self._columns[self._names.index(name)].buffers()
+
+    def column(self, name: str) -> list:
+        # the values as stored
+        return self._columns[self._names.index(name)].values(0, self._length)
+
+    def to_columns(self, start: int = 0, stop: int = None, names: List[str] = None) -> dict:
+        # the values as written to the log
+        stop = self._length if stop is None else min(stop, self._length)
+        columns = {}
+        for name, column in zip(self._names, self._columns):
+            if names is not None and name not in names:
+                continue
+            values = column.values(start, stop)
+            if name in self._formats:
+                values = list(map(self._formats[name], values))
+            columns[name] = values
+        return columns
+
+    def to_rows(self, start: int = 0, stop: int = None) -> List[dict]:
+        stop = self._length if stop is None else min(stop, self._length)
+        columns = self.to_columns(start, stop)
+        names = list(columns.keys())
+        rows = [dict(zip(names, values)) for values in zip(*columns.values())]
+        for i, extras in self._extras.items():
+            if start <= i < stop:
+                rows[i - start].update(extras)
+        return rows
+
+    def iter_rows(self, chunk: int) -> Iterator[List[dict]]:
+        for start in range(0, self._length, chunk):
+            yield self.to_rows(start, start + chunk)
+
+
+class _NumericColumn(object):
+
+    def __init__(self, typecode: str):
+        self._data = array(typecode)
+
+    def append(self, value):
+        self._data.append(value)
+
+    def values(self, start: int, stop: int) -> list:
+        return self._data[start:stop].tolist()
+
+    def encoded_lengths(self, start: int, stop: int) -> List[int]:
+        # the JSON encoder writes numbers as their repr (but for inf and -inf)
+        values = self._data[start:stop].tolist()
+        if self._data.typecode == 'd' and any(map(math.isinf, values)):
+            return [_float_length(v) for v in values]
+        return list(map(len, map(repr, values)))
+
+    def trim(self, num: int):
+        del self._data[:num]
+
+    def select(self, indices: List[int], strings: StringTable, remap: dict) -> '_NumericColumn':
+        column = _NumericColumn(self._data.typecode)
+        data = self._data
+        column._data = array(data.typecode, [data[i] for i in indices])
+        return column
+
+    def nbytes(self) -> int:
+        return len(self._data) * self._data.itemsize
+
+    def buffers(self) -> tuple:
+        return self._data,
+
+
+class _StringColumn(object):
+
+    def __init__(self, strings: StringTable):
+        self._strings = strings
+        self._data = array('q')
+
+    def append(self, value):
+        self._data.append(self._strings.intern(value))
+
+    def values(self, start: int, stop: int) -> list:
+        lookup = self._strings.lookup
+        return [lookup(i) for i in self._data[start:stop]]
+
+    def encoded_lengths(self, start: int, stop: int) -> List[int]:
+        return self._strings.encoded_lengths(self._data[start:stop])
+
+    def trim(self, num: int):
+        del self._data[:num]
+
+    def select(self, indices: List[int], strings: StringTable, remap: dict) -> '_StringColumn':
+        column = _StringColumn(strings)
+        data = self._data
+        column._data = array('q', [
+            _remap(data[i], self._strings, strings, remap) for i in indices
+        ])
+        return column
+
+    def nbytes(self) -> int:
+        return len(self._data) * self._data.itemsize
+
+    def buffers(self) -> tuple:
+        return self._data,
+
+
+class _MapColumn(object):
+    # ragged column: row i owns the entries [offsets[i], offsets[i+1])
+
+    def __init__(self, strings: StringTable, fields: Tuple[str, ...]):
+        self._strings = strings
+        self._fields = fields
+        self._offsets = array('q', [0])
+        self._keys = array('q')
+        self._data = [array('q') for _ in fields]
+        # {"field": <value>, ...} without the values
+        self._entry_overhead = len(json.dumps({field: None for field in fields})) - \
+            _NULL_LENGTH * len(fields)
+
+    def append(self, value):
+        for key, entry in value.items():
+            self._keys.append(self._strings.intern(key))
+            for field, data in zip(self._fields, self._data):
+                data.append(entry[field])
+        self._offsets.append(len(self._keys))
+
+    def trim(self, num: int):
+        base = self._offsets[num]
+        self._offsets = array('q', [o - base for o in self._offsets[num:]])
+        del self._keys[:base]
+        for data in self._data:
+            del data[:base]
+
+    def select(self, indices: List[int], strings: StringTable, remap: dict) -> '_MapColumn':
+        column = _MapColumn(strings, self._fields)
+        offsets = self._offsets
+        for i in indices:
+            for j in range(offsets[i], offsets[i + 1]):
+                column._keys.append(_remap(self._keys[j], self._strings, strings, remap))
+                for data, selected in zip(self._data, column._data):
+                    selected.append(data[j])
+            column._offsets.append(len(column._keys))
+        return column
+
+    def nbytes(self) -> int:
+        return sum(len(a) * a.itemsize for a in self.buffers())
+
+    def buffers(self) -> tuple:
+        return (self._offsets, self._keys) + tuple(self._data)
+
+    def encoded_lengths(self, start: int, stop: int) -> List[int]:
+        offsets = self._offsets[start:stop + 1].tolist()
+        if len(offsets) < 2:
+            return []
+        first, last = offsets[0], offsets[-1]
+        # "key": {"field": <value>, ...} for each entry
+        entries = [
+            key + _KEY_SEP + self._entry_overhead + sum(values) for key, *values in zip(
+                self._strings.encoded_lengths(self._keys[first:last]),
+                *[map(len, map(repr, data[first:last].tolist())) for data in self._data]
+            )
+        ]
+        lengths = []
+        for i in range(len(offsets) - 1):
+            a, b = offsets[i] - first, offsets[i + 1] - first
+            # {entry, entry, ...}
+            lengths.append(2 + sum(entries[a:b]) + _ITEM_SEP * max(b - a - 1, 0))
+        return lengths
+
+    def values(self, start: int, stop: int) -> list:
+        lookup = self._strings.lookup
+        offsets = self._offsets[start:stop + 1].tolist()
+        keys = self._keys[offsets[0]:offsets[-1]].tolist() if offsets else []
+        data = [d[offsets[0]:offsets[-1]].tolist() for d in self._data] if offsets else []
+        base = offsets[0] if offsets else 0
+        out = []
+        for i in range(len(offsets) - 1):
+            a, b = offsets[i] - base, offsets[i + 1] - base
+            out.append({
+                lookup(keys[j]): {
+                    field: data[k][j] for k, field in enumerate(self._fields)
+                } for j in range(a, b)
+            })
+        return out
+
+
+# lengths of JSON tokens (with the default separators)
+_NULL_LENGTH = len('null')
+_ITEM_SEP = len(', ')
+_KEY_SEP = len(': ')
+
+
+def normalize(key: str, rows: list) -> list:
+    """Rows of a list section with the fields, in the order and of the types of its schema.
+
+    Missing numbers are 0, missing strings None, values that cannot be converted are 0,
+    fields outside of the schema are kept as they are. Both log backends store the normalized
+    rows (see `format_rows`), so that a section is the same whether the log is kept in memory
+    or on disk. Sections with no schema are left as they are.
+    """
+    casts = _SCHEMA_CASTS.get(key)
+    if casts is None:
+        return rows
+    normalized = []
+    for row in rows:
+        out = {name: cast(row.get(name)) for name, cast in casts}
+        if not row.keys() <= out.keys():
+            out.update((k, v) for k, v in row.items() if k not in out)
+        normalized.append(out)
+    return normalized
+
+
+def format_rows(key: str, rows: list) -> list:
+    """Normalized rows as they are written to the log (see `JSON_FORMATS`)"""
+    formats = JSON_FORMATS.get(key)
+    if not formats:
+        return rows
+    return [
+        {k: formats[k](v) if k in formats else v for k, v in row.items()} for row in rows
+    ]
+
+
+def _make_column(kind, strings: StringTable):
+    if kind in ('d', 'q'):
+        return _NumericColumn(kind)
+    if kind == 's':
+        return _StringColumn(strings)
+    if isinstance(kind, tuple) and kind[0] == 'm':
+        return _MapColumn(strings, kind[1:])
+    raise ValueError('Unknown column kind {}'.format(kind))
+
+
+def _remap(idx: int, old: StringTable, new: StringTable, remap: dict) -> int:
+    # index in the new string table of the string at `idx` in the old one
+    if idx < 0:
+        return idx
+    new_idx = remap.get(idx)
+    if new_idx is None:
+        new_idx = remap[idx] = new.intern(old.lookup(idx))
+    return new_idx
+
+
+def _to_int(value) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))
+
+
+def _extras_length(extras: dict) -> int:
+    # , "key": <value> for each field
+    return sum(_ITEM_SEP + len(json.dumps(k)) + _KEY_SEP + len(json.dumps(v))
+               for k, v in extras.items())
+
+
+def _float_length(value: float) -> int:
+    r = repr(value)
+    # the JSON encoder writes inf as Infinity
+    return len(r) if r[-1] != 'f' else len(json.dumps(value))
+
+
+def _as_float(value) -> float:
+    try:
+        return float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _as_int(value) -> int:
+    try:
+        return _to_int(value) if value is not None else 0
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+def _as_str(value) -> Optional[str]:
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _map_cast(fields: Tuple[str, ...]) -> Callable:
+
+    def _as_map(value) -> dict:
+        if not isinstance(value, dict):
+            return {}
+        return {
+            str(key): {field: _as_int(entry.get(field)) for field in fields}
+            for key, entry in value.items() if isinstance(entry, dict)
+        }
+
+    return _as_map
+
+
+def _cast(kind) -> Callable:
+    if kind == 'd':
+        return _as_float
+    if kind == 'q':
+        return _as_int
+    if kind == 's':
+        return _as_str
+    return _map_cast(kind[1:])
+
+
+def _ps_pcpu(value: float) -> str:
+    # as ps prints %CPU: one decimal, none from 100% on
+    return '{:.1f}'.format(value) if value < 99.95 else '{:d}'.format(int(value))
+
+
+def _ps_pmem(value: float) -> str:
+    # as ps prints %MEM
+    return '{:.1f}'.format(value)
+
+
+_SCHEMA_CASTS: Dict[str, List[Tuple[str, Callable]]] = {
+    key: [(name, _cast(kind)) for name, kind in schema]
+    for key, schema in COLUMNAR_SCHEMAS.items()
+}
+
+# columns not written to the log as they are stored: the numbers that docker top (and ps)
+# return are strings in the log, as they always were
+_PS_FORMATS = {
+    'ppid': str,
+    'pid': str,
+    'pcpu': _ps_pcpu,
+    'nthreads': str,
+    'pmem': _ps_pmem
+}
+JSON_FORMATS: Dict[str, Dict[str, Callable]] = {
+    'process_stats': _PS_FORMATS,
+    'all_process_stats': _PS_FORMATS
+}
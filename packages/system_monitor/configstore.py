@@ -0,0 +1,196 @@
+import json
+import hashlib
+import threading
+
+from typing import Dict, List, Tuple
+
+
+# parts of `docker inspect` that are stored once and referenced by hash
+CONFIG_BLOBS = {
+    'Env': ('Config', 'Env'),
+    'Config': ('Config',),
+    'HostConfig': ('HostConfig',),
+    'Mounts': ('Mounts',),
+    'NetworkSettings': ('NetworkSettings',)
+}
+# fields of the blobs that are different for every container (e.g., its short ID, its IP
+# addresses), they are kept with the configuration of the container ('*' is any key)
+CONFIG_VOLATILE = {
+    'Config': [
+        ('Hostname',)
+    ],
+    'NetworkSettings': [
+        ('SandboxID',),
+        ('SandboxKey',),
+        ('EndpointID',),
+        ('IPAddress',),
+        ('GlobalIPv6Address',),
+        ('LinkLocalIPv6Address',),
+        ('MacAddress',),
+        ('Ports',),
+        ('Networks', '*', 'EndpointID'),
+        ('Networks', '*', 'IPAddress'),
+        ('Networks', '*', 'GlobalIPv6Address'),
+        ('Networks', '*', 'MacAddress'),
+        ('Networks', '*', 'Aliases'),
+        ('Networks', '*', 'DNSNames')
+    ]
+}
+# sections of the log
+CONFIG_SECTION = 'container_config'
+BLOBS_SECTION = 'container_config_blobs'
+BLOBS_KEY = '$blobs'
+BASE_KEY = '$base'
+DIFF_KEY = '$diff'
+UNSET_KEY = '$unset'
+
+
+class ConfigStore(object):
+    """Deduplicates container configurations by content.
+
+    The heavy parts of a configuration (see `CONFIG_BLOBS`) are stored once under their hash
+    and referenced by the containers that share them, without the fields that are specific
+    to each container (see `CONFIG_VOLATILE`). Containers recreated with the name of a
+    container seen earlier in the run only store the differences with respect to it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blobs = set()
+        # container name -> (container ID, reduced configuration)
+        self._by_name: Dict[str, Tuple[str, dict]] = {}
+
+    def add(self, container_id: str, config: dict) -> Tuple[dict, Dict[str, object]]:
+        """Returns the entry to log for the container and the blobs that are new"""
+        reduced, blobs = _split(config)
+        with self._lock:
+            new_blobs = {h: b for h, b in blobs.items() if h not in self._blobs}
+            self._blobs.update(new_blobs.keys())
+            name = config.get('Name')
+            previous = self._by_name.get(name)
+            self._by_name[name] = (container_id, reduced)
+        if previous is None or previous[0] == container_id:
+            return reduced, new_blobs
+        # the container was recreated, only keep what changed
+        base_id, base = previous
+        changes, unset = _diff(base, reduced)
+        return {BASE_KEY: base_id, DIFF_KEY: changes, UNSET_KEY: unset}, new_blobs
+
+
+def expand(configs: Dict[str, dict], blobs: Dict[str, object]) -> Dict[str, dict]:
+    """Rebuilds the full configurations from the 'container_config' and
+    'container_config_blobs' sections of a log"""
+    reduced = {}
+
+    def _reduced(container_id):
+        if container_id not in reduced:
+            entry = configs[container_id]
+            if BASE_KEY in entry:
+                entry = _patch(_reduced(entry[BASE_KEY]), entry[DIFF_KEY], entry[UNSET_KEY])
+            reduced[container_id] = entry
+        return reduced[container_id]
+
+    return {container_id: _join(_reduced(container_id), blobs) for container_id in configs}
+
+
+def _hash(blob) -> str:
+    return hashlib.sha1(json.dumps(blob, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _split(config: dict) -> Tuple[dict, Dict[str, object]]:
+    reduced = json.loads(json.dumps(config))
+    refs, blobs = {}, {}
+    # nested blobs first (e.g., Env is inside Config)
+    for name, path in sorted(CONFIG_BLOBS.items(), key=lambda kv: -len(kv[1])):
+        parent = reduced
+        for key in path[:-1]:
+            parent = parent.get(key) if isinstance(parent, dict) else None
+        if not isinstance(parent, dict) or path[-1] not in parent:
+            continue
+        blob = parent.pop(path[-1])
+        # what is specific to the container stays in its configuration
+        volatile = _take(blob, CONFIG_VOLATILE.get(name, []))
+        if volatile:
+            parent[path[-1]] = volatile
+        h = _hash(blob)
+        refs[name] = h
+        blobs[h] = blob
+    reduced[BLOBS_KEY] = refs
+    return reduced, blobs
+
+
+def _join(reduced: dict, blobs: Dict[str, object]) -> dict:
+    config = json.loads(json.dumps(reduced))
+    refs = config.pop(BLOBS_KEY, {})
+    # outer blobs first (e.g., Env goes back inside Config)
+    for name, path in sorted(CONFIG_BLOBS.items(), key=lambda kv: len(kv[1])):
+        if name not in refs:
+            continue
+        parent = config
+        for key in path[:-1]:
+            parent = parent.setdefault(key, {})
+        blob = json.loads(json.dumps(blobs[refs[name]]))
+        # put back the fields specific to the container
+        if isinstance(blob, dict) and isinstance(parent.get(path[-1]), dict):
+            _merge(blob, parent[path[-1]])
+        parent[path[-1]] = blob
+    return config
+
+
+def _take(doc, paths: List[tuple]) -> dict:
+    # removes the fields at the given paths from `doc`, returns them in a document of their own
+    taken = {}
+    for path in paths:
+        for parents, value in _find(doc, path):
+            target = taken
+            for key in parents[:-1]:
+                target = target.setdefault(key, {})
+            target[parents[-1]] = value
+    return taken
+
+
+def _find(doc, path: tuple, prefix: tuple = ()):
+    # (removes and) yields the fields matching the path, with their actual path
+    if not isinstance(doc, dict) or not path:
+        return
+    key, rest = path[0], path[1:]
+    for k in (list(doc.keys()) if key == '*' else [key] if key in doc else []):
+        if rest:
+            yield from _find(doc[k], rest, prefix + (k,))
+        else:
+            yield prefix + (k,), doc.pop(k)
+
+
+def _diff(old: dict, new: dict, path: tuple = ()) -> Tuple[dict, List[list]]:
+    changes, unset = {}, []
+    for key in old:
+        if key not in new:
+            unset.append(list(path + (key,)))
+    for key, value in new.items():
+        if key in old and isinstance(value, dict) and isinstance(old[key], dict):
+            sub_changes, sub_unset = _diff(old[key], value, path + (key,))
+            if sub_changes:
+                changes[key] = sub_changes
+            unset.extend(sub_unset)
+        elif key not in old or old[key] != value:
+            changes[key] = value
+    return changes, unset
+
+
+def _patch(base: dict, changes: dict, unset: List[list]) -> dict:
+    doc = json.loads(json.dumps(base))
+    for path in unset:
+        parent = doc
+        for key in path[:-1]:
+            parent = parent[key]
+        parent.pop(path[-1], None)
+    _merge(doc, changes)
+    return doc
+
+
+def _merge(target: dict, patch: dict):
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
@@ -1,18 +1,32 @@
 import os
-import multiprocessing
 
 # App
 APP_NAME = 'system-monitor'
-WORKERS_NUM = multiprocessing.cpu_count()
+WORKERS_NUM = os.cpu_count() or 1
 DEFAULT_TARGET = "unix://var/run/docker.sock"
 WORKER_HEARTBEAT_HZ = 2
 APP_HEARTBEAT_HZ = 5
+ENGINES = ['threads', 'async']
 LOG_VERSION = '2.0'
 
+# Log storage
+LOG_SEGMENT_MAX_BYTES = 4 * 1024 * 1024
+LOG_WRITER_BUFFER_BYTES = 64 * 1024
+LOG_EXPORT_CHUNK_ROWS = 4096
+LOG_INGEST_FLUSH_EVERY_S = 0.5
+LOG_WATERMARK_VERSION_KEY = '$version'
+LOG_RETENTION_DEFAULT_ROWS = 100000
+LOG_RETENTION_EVICT_FRACTION = 0.25
+LOG_RETENTION_DOWNSAMPLED_FRACTION = 0.25
+LOG_RETENTION_ENTITY_KEYS = ('container', 'pid')
+
 # Jobs
 JOB_FETCH_CONTAINER_LIST = True
+JOB_WATCH_CONTAINER_EVENTS = True
 JOB_FETCH_CONTAINER_STATS = True
+JOB_FETCH_CONTAINER_STATS_FROM_CGROUP = True
 JOB_FETCH_CONTAINER_TOP = True
+JOB_FETCH_CONTAINER_TOP_FROM_PROC = True
 JOB_FETCH_CONTAINER_CONFIG = True
 JOB_FETCH_DEVICE_HEALTH = True
 JOB_FETCH_ENDPOINT_INFO = True
@@ -21,6 +35,62 @@ JOB_PUSH_TO_SERVER = True
 
 # Docker
 DEFAULT_DOCKER_TCP_PORT = 2375
+ASYNC_DOCKER_MAX_CONNECTIONS = 64
+ASYNC_DOCKER_REQUEST_TIMEOUT_S = 20
+
+# Host (used when monitoring the local Docker endpoint)
+CGROUP_ROOT = os.environ.get('CGROUP_ROOT', '/sys/fs/cgroup')
+PROC_ROOT = os.environ.get('PROC_ROOT', '/proc')
+PROCFS_READ_BUFFER_BYTES = 16 * 1024
+
+# HTTP
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 4
+HTTP_CONNECT_TIMEOUT_S = 3
+HTTP_READ_TIMEOUT_S = 10
+HTTP_BREAKER_FAILURES_N = 3
+HTTP_BREAKER_COOLDOWN_S = 5
+HTTP_BREAKER_MAX_COOLDOWN_S = 5 * 60
+HTTP_LATENCY_BUCKETS_S = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Metrics
+METRICS_BIND_ADDRESS = os.environ.get('METRICS_BIND_ADDRESS', '0.0.0.0')
+METRICS_PREFIX = 'system_monitor'
+
+# Adaptive sampling
+SAMPLING_CONTROL_EVERY_S = 2
+SAMPLING_MIN_PERIOD_S = 1
+SAMPLING_MIN_PERIOD_FACTOR = 0.2
+SAMPLING_MAX_PERIOD_FACTOR = 4.0
+SAMPLING_SPEEDUP = 0.5
+SAMPLING_SLOWDOWN = 1.25
+SAMPLING_ACTIVITY_HIGH = 1.0
+SAMPLING_ACTIVITY_LOW = 0.25
+SAMPLING_ACTIVITY_SMOOTHING = 0.5
+SAMPLING_TOLERANCES = {
+    'pcpu': 5.0,
+    'pmem': 1.0
+}
+SAMPLING_CPU_BUDGET_PCT = 10.0
+SAMPLING_MAX_THROTTLE = 8.0
+
+# Rollups
+ROLLUP_WINDOWS_S = [60]
+# closed windows kept until they are written to the log
+ROLLUP_WINDOWS_KEEP = 24 * 60
+ROLLUP_QUANTILES = [0.5, 0.95, 0.99]
+ROLLUP_SKETCH_ACCURACY = 0.01
+ROLLUP_METRICS = {
+    'container_stats': ['pcpu', 'pmem', 'mem', 'io_r', 'io_w'],
+    'process_stats': ['pcpu', 'pmem', 'mem'],
+    'all_process_stats': ['pcpu', 'pmem', 'mem'],
+    # all the numeric fields
+    'health': None
+}
+ROLLUP_WRITE_EVERY_S = 60
+
+# Job: Self Profile
+PROFILE_LOG_EVERY_S = 30
 
 # Job: Device Health
 DEFAULT_DEVICE_HEALTH_API_PORT = 8085
@@ -28,12 +98,19 @@ FETCH_NEW_DEVICE_STATS_EVERY_S = 5
 
 # Job: Containers List
 FETCH_NEW_CONTAINERS_EVERY_S = 10
+CHECK_CONTAINERS_CONSISTENCY_EVERY_S = 60
 
 # Job: Container Stats
 FETCH_NEW_CONTAINER_STATS_EVERY_S = 10
+CONTAINER_STATS_STREAMING = True
+# how long to wait for the first sample of a new stream, and for any sample after that
+CONTAINER_STATS_FIRST_SAMPLE_TIMEOUT_S = 5
+CONTAINER_STATS_STREAM_TIMEOUT_S = 30
 
 # Job: Process Stats
 FETCH_NEW_PROCESS_STATS_EVERY_S = 5
+# scans of /proc in a row with no process of the monitored containers before using docker top
+HOST_PROCESS_STATS_MAX_EMPTY_SCANS = 3
 
 # Job: System Process Stats
 FETCH_NEW_SYSTEM_PROCESS_STATS_EVERY_S = 30
@@ -50,9 +127,31 @@ LOG_API_URL = "{:s}://{:s}/web-api/{}/data/set/json".format(
     LOG_API_HOSTNAME,
     LOG_API_VERSION
 )
+LOG_API_CHUNK_URL = "{:s}://{:s}/web-api/{}/data/set/chunk".format(
+    LOG_API_PROTOCOL,
+    LOG_API_HOSTNAME,
+    LOG_API_VERSION
+)
 LOG_API_DEFAULT_DATABASE = 'db_log_default'
 LOG_DEFAULT_GROUP = 'default'
 LOG_DEFAULT_SUBGROUP = 'default'
 LOG_API_RETRY_EVERY_S = 5
 LOG_API_RETRY_N_TIMES = 3
 LOG_API_REQUEST_TIMEOUT_S = 20
+LOG_API_CHUNK_SIZE_BYTES = 1024 * 1024
+LOG_API_CHUNK_RETRY_N_TIMES = 3
+LOG_API_COMPRESSIONS = ['gzip', 'zlib', 'zstd', 'none']
+
+# Analysis (system_monitor analyze)
+ANALYSIS_TOP_PROCESSES = 10
+ANALYSIS_TIMELINE_STEP_S = 10
+ANALYSIS_PERCENTILE = 95
+
+# Export (--no-upload)
+EXPORT_FORMATS = ['json', 'columnar']
+EXPORT_DEFAULT_DIR = '/tmp'
+EXPORT_FORMAT_VERSION = 1
+# monotonic counters, delta-encoded with respect to the previous row of the same container
+EXPORT_COUNTER_COLUMNS = {
+    'container_stats': {'io_r': 'container', 'io_w': 'container'}
+}
@@ -0,0 +1,106 @@
+import os
+import json
+import shutil
+
+import numpy as np
+
+from .columnar import ColumnarSection
+from .constants import \
+    EXPORT_FORMAT_VERSION, \
+    EXPORT_COUNTER_COLUMNS
+
+# file with the layout of the export, the dict sections and the lists that are not columnar
+META_FILE = 'meta.json'
+STRINGS_FILE = 'strings.json'
+
+
+def export_log(log, path: str) -> str:
+    """Writes the log to the directory `path` in the binary columnar format.
+
+    Each column of the columnar sections is a `.npy` file (see `loader.py`), so that it can
+    be memory-mapped when loaded back:
+
+        <path>/meta.json                       layout, dict sections, other list sections
+        <path>/<section>/strings.json          string table of the section
+        <path>/<section>/<column>.npy          one array per column
+        <path>/<section>/<column>.<part>.npy   map columns: offsets, keys, one per field
+
+    Timestamps are delta-encoded (int64 microseconds), monotonic counters are delta-encoded
+    per container, strings are stored as int32 indices into the string table.
+    """
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    meta = {'version': EXPORT_FORMAT_VERSION, 'log': {}, 'sections': {}}
+    for key, section in log.iter_sections():
+        if not isinstance(section, ColumnarSection):
+            meta['log'][key] = section
+            continue
+        meta['sections'][key] = _export_section(key, section, os.path.join(tmp_path, key))
+    with open(os.path.join(tmp_path, META_FILE), 'wt') as fout:
+        json.dump(meta, fout)
+    # replace the previous export (if any) at once
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+    return path
+
+
+def _export_section(key: str, section: ColumnarSection, path: str) -> dict:
+    os.makedirs(path)
+    layout = {'rows': len(section), 'columns': []}
+    counters = EXPORT_COUNTER_COLUMNS.get(key, {})
+    for name, kind in section.schema:
+        buffers = [np.frombuffer(b, dtype=np.dtype(b.typecode)) if len(b) else
+                   np.zeros(0, dtype=np.dtype(b.typecode)) for b in section.buffers(name)]
+        column = {'name': name, 'kind': kind, 'encoding': 'plain'}
+        if kind == 'd' and name == 'time':
+            column['encoding'] = 'delta_us'
+            _save(path, name, _delta(np.round(buffers[0] * 1e6).astype(np.int64)))
+        elif kind in ('d', 'q') and name in counters:
+            group = counters[name]
+            column['encoding'] = 'delta_by:' + group
+            codes = np.frombuffer(section.buffers(group)[0], dtype=np.int64)
+            _save(path, name, _delta_by(buffers[0], codes))
+        elif kind in ('d', 'q'):
+            _save(path, name, buffers[0])
+        elif kind == 's':
+            _save(path, name, buffers[0].astype(np.int32))
+        else:
+            offsets, keys, *fields = buffers
+            _save(path, name + '.offsets', offsets)
+            _save(path, name + '.keys', keys.astype(np.int32))
+            for field, data in zip(kind[1:], fields):
+                _save(path, '{}.{}'.format(name, field), data)
+        layout['columns'].append(column)
+    if section.extras:
+        # fields outside of the schema, by row
+        layout['extras'] = {str(i): extras for i, extras in section.extras.items()}
+    with open(os.path.join(path, STRINGS_FILE), 'wt') as fout:
+        json.dump(section.strings.strings(), fout)
+    return layout
+
+
+def _save(path: str, name: str, data: np.ndarray):
+    np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(data))
+
+
+def _delta(values: np.ndarray) -> np.ndarray:
+    return np.diff(values, prepend=values.dtype.type(0))
+
+
+def _delta_by(values: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    # delta with respect to the previous value of the same group (e.g., container)
+    order = np.argsort(groups, kind='stable')
+    ordered = values[order]
+    deltas = _delta(ordered)
+    starts = _group_starts(groups[order])
+    deltas[starts] = ordered[starts]
+    out = np.empty_like(deltas)
+    out[order] = deltas
+    return out
+
+
+def _group_starts(sorted_groups: np.ndarray) -> np.ndarray:
+    if len(sorted_groups) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(np.diff(sorted_groups)) + 1))
@@ -0,0 +1,135 @@
+import time
+import threading
+import requests
+
+from typing import Dict
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+from .constants import \
+    HTTP_POOL_CONNECTIONS, \
+    HTTP_POOL_MAXSIZE, \
+    HTTP_CONNECT_TIMEOUT_S, \
+    HTTP_READ_TIMEOUT_S, \
+    HTTP_BREAKER_FAILURES_N, \
+    HTTP_BREAKER_COOLDOWN_S, \
+    HTTP_BREAKER_MAX_COOLDOWN_S, \
+    HTTP_LATENCY_BUCKETS_S
+
+
+class CircuitOpenError(requests.RequestException):
+    # the request was refused without contacting the endpoint
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__('Endpoint {} is down, retrying in {:.1f} secs'.format(endpoint, retry_in))
+        self.retry_in = retry_in
+
+
+class HttpClient(object):
+    """HTTP client shared by the jobs.
+
+    Connections are kept alive in a pool, requests always have a timeout, and each endpoint
+    has a circuit breaker so that an endpoint that is down is not contacted on every period.
+    The latency of each request is recorded in the pool stats (group 'http_latency').
+    """
+
+    def __init__(self, stats: 'StatisticsCollector'):
+        self._stats = stats
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                              pool_maxsize=HTTP_POOL_MAXSIZE)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        endpoint = _endpoint(url)
+        breaker = self._breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(endpoint, breaker.retry_in())
+        if timeout is None:
+            timeout = (HTTP_CONNECT_TIMEOUT_S, HTTP_READ_TIMEOUT_S)
+        start = time.time()
+        try:
+            r = self._session.request(method, url, timeout=timeout, **kwargs)
+        except requests.RequestException:
+            breaker.failure()
+            raise
+        finally:
+            self._stats.histogram(
+                'http_latency', endpoint, time.time() - start, HTTP_LATENCY_BUCKETS_S)
+        # server errors mean that the endpoint is in trouble, client errors do not
+        if r.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        return r
+
+    def close(self):
+        self._session.close()
+
+    def _breaker(self, endpoint: str) -> 'CircuitBreaker':
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker()
+            return self._breakers[endpoint]
+
+
+class CircuitBreaker(object):
+    # closed -> open (after N consecutive failures) -> half-open (one trial after the cooldown)
+    # the cooldown doubles every time the trial fails
+
+    def __init__(self, failures: int = HTTP_BREAKER_FAILURES_N,
+                 cooldown: float = HTTP_BREAKER_COOLDOWN_S,
+                 max_cooldown: float = HTTP_BREAKER_MAX_COOLDOWN_S):
+        self._lock = threading.Lock()
+        self._max_failures = failures
+        self._min_cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._failures = 0
+        self._cooldown = cooldown
+        self._open_until = None
+        self._trial = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._open_until is None:
+                return True
+            if self._trial or time.time() < self._open_until:
+                return False
+            # half-open, let one request through
+            self._trial = True
+            return True
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return max(self._open_until - time.time(), 0) if self._open_until else 0
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._cooldown = self._min_cooldown
+            self._open_until = None
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial:
+                self._cooldown = min(self._cooldown * 2, self._max_cooldown)
+            elif self._failures < self._max_failures:
+                return
+            self._open_until = time.time() + self._cooldown
+            self._trial = False
+
+
+def _endpoint(url: str) -> str:
+    parts = urlsplit(url)
+    return '{}://{}{}'.format(parts.scheme, parts.netloc, parts.path)
@@ -0,0 +1,81 @@
+import heapq
+import itertools
+import threading
+
+from collections import deque
+from typing import Callable, List
+
+from .constants import LOG_INGEST_FLUSH_EVERY_S
+
+
+class ShardedIngestor(object):
+    """Per-thread buffers of new log entries, drained into the log by a single consolidator.
+
+    Producers only append to their own shard (a deque, lock-free under the GIL), so workers
+    never wait on each other to log. Entries carry a global sequence number so that the
+    consolidator can hand them over in the order in which they were produced. A producer can
+    be preempted between taking its number and appending its entry, the entries after such a
+    gap in the sequence are held back until the missing one shows up.
+    """
+
+    def __init__(self, consume: Callable[[list], None]):
+        self._consume = consume
+        self._local = threading.local()
+        self._shards: List[deque] = []
+        self._shards_lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        self._sequence = itertools.count()
+        # sequence number of the next entry to hand over, entries drained after a gap
+        self._next = 0
+        self._held = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._consolidate_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def put(self, *entry):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = deque()
+            # this is the only time a producer takes a lock
+            with self._shards_lock:
+                self._shards.append(shard)
+        shard.append((next(self._sequence), entry))
+
+    def pending(self) -> int:
+        return sum(len(shard) for shard in list(self._shards)) + len(self._held)
+
+    def flush(self):
+        with self._drain_lock:
+            batches = [self._held] if self._held else []
+            for shard in list(self._shards):
+                batch = []
+                # only pop what is there now, producers keep appending on the other end
+                for _ in range(len(shard)):
+                    batch.append(shard.popleft())
+                if batch:
+                    batches.append(batch)
+            if not batches:
+                return
+            entries = list(heapq.merge(*batches, key=lambda e: e[0]))
+            # hand over up to the first missing number
+            ready = 0
+            for sequence, _ in entries:
+                if sequence != self._next:
+                    break
+                self._next += 1
+                ready += 1
+            self._held = entries[ready:]
+            if ready:
+                self._consume([entry for _, entry in entries[:ready]])
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+
+    def _consolidate_forever(self):
+        while not self._stop.wait(LOG_INGEST_FLUSH_EVERY_S):
+            self.flush()
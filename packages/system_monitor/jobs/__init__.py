@@ -1,7 +1,34 @@
-from .container import ContainerListJob, ContainerConfigJob, ContainerStatsJob
-from .health import DeviceHealthJob
-from .printer import PrinterJob
-from .process import ProcessStatsJob
-from .publisher import PublisherJob
-from .endpoint import EndpointInfoJob
-from .system import SystemProcessStatsJob
+import importlib
+
+# job -> module defining it, modules are imported on first access (PEP 562)
+_JOBS = {
+    'ContainerListJob': 'container',
+    'ContainerConfigJob': 'container',
+    'ContainerStatsJob': 'container',
+    'DeviceHealthJob': 'health',
+    'PrinterJob': 'printer',
+    'ProcessStatsJob': 'process',
+    'HostProcessStatsJob': 'process',
+    'PublisherJob': 'publisher',
+    'LivePublisherJob': 'publisher',
+    'EndpointInfoJob': 'endpoint',
+    'SystemProcessStatsJob': 'system',
+    'AdaptiveSamplingJob': 'sampling',
+    'SelfProfileJob': 'profiler',
+    'SummaryJob': 'summary'
+}
+
+__all__ = list(_JOBS)
+
+
+def __getattr__(name: str):
+    if name not in _JOBS:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + _JOBS[name], __name__), name)
+    # cache, next time the attribute is found without calling us
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
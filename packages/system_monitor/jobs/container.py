@@ -1,68 +1,122 @@
 import time
+import threading
 from docker import DockerClient
 from docker.models.containers import Container
-from docker.errors import APIError
+from docker.errors import APIError, NotFound
 from collections import defaultdict
+from typing import Optional
 
 from .jobs import Job
-from .process import ProcessStatsJob
+from system_monitor import clock
+from .process import ProcessStatsJob, HostProcessStatsJob
+from system_monitor.cgroup import CgroupReader
+from system_monitor.procfs import ProcScanner
+from system_monitor.configstore import ConfigStore, CONFIG_SECTION, BLOBS_SECTION
 from system_monitor.constants import \
     FETCH_NEW_CONTAINER_STATS_EVERY_S, \
+    CONTAINER_STATS_STREAMING, \
+    CONTAINER_STATS_FIRST_SAMPLE_TIMEOUT_S, \
+    CONTAINER_STATS_STREAM_TIMEOUT_S, \
     FETCH_NEW_CONTAINERS_EVERY_S, \
+    CHECK_CONTAINERS_CONSISTENCY_EVERY_S, \
+    JOB_WATCH_CONTAINER_EVENTS, \
     JOB_FETCH_CONTAINER_STATS, \
     JOB_FETCH_CONTAINER_TOP, \
     JOB_FETCH_CONTAINER_CONFIG
 
 
-PS_COLUMN_TO_KEY = {
-    'PPID': 'ppid',
-    'PID': 'pid',
-    '%CPU': 'pcpu',
-    'THCNT': 'nthreads',
-    'TIME': 'cputime',
-    '%MEM': 'pmem',
-    'SIZE': 'mem',
-    'CMD': 'command'
-}
-
-
 class ContainerStatsJob(Job):
+    ASYNC = True
 
-    def __init__(self, app: 'SystemMonitor', container: Container):
+    def __init__(self, app: 'SystemMonitor', container: Container,
+                 cgroups: Optional[CgroupReader] = None,
+                 streams: Optional['_StatsStreams'] = None):
         super().__init__(period=FETCH_NEW_CONTAINER_STATS_EVERY_S)
         self._app = app
         self._container = container
+        self._cgroups = cgroups
+        self._streams = streams
         self._previous_cpu = 0.0
         self._previous_system = 0.0
 
+    def container_id(self):
+        return self._container.id
+
     def run(self):
-        data = {
-            'container': self._container.id,
-            'time': time.time(),
-            'pcpu': 0.0,
-            'io_r': 0.0,
-            'io_w': 0.0,
-            'mem': 0.0,
-            'pmem': 0.0
-        }
+        now = clock.now()
         # check if the container is still running
         if self._container.status != 'running':
             self.terminate()
         # try to get a new reading
         try:
             # get another reading
-            stats = self._container.stats(stream=False)
-            # fill in the data
-            data['pcpu'] = self._calculate_cpu_percent(stats)
-            data['io_r'], data['io_w'] = self._calculate_blkio_bytes(stats)
-            data['mem'] = self._calculate_mem_bytes(stats)
-            data['pmem'] = self._calculate_mem_perc(stats)
-            data['network'] = self._calculate_network_bytes(stats)
+            stats = self._read_stats()
         except APIError:
             return
+        self._update(stats, now)
+
+    def terminate(self):
+        super(ContainerStatsJob, self).terminate()
+        # stop streaming
+        if self._streams is not None:
+            self._streams.close(self._container.id)
+
+    async def run_async(self):
+        # only used by the async engine, the threaded one does not need asyncio
+        from system_monitor.asyncdocker import AsyncDockerError
+        now = clock.now()
+        # check if the container is still running
+        if self._container.status != 'running':
+            self.terminate()
+        # try to get a new reading (one-shot, we keep our own previous sample)
+        stats = self._cgroups.stats(self._container.id) if self._cgroups is not None else None
+        if stats is None:
+            try:
+                stats = await self._app.docker_async.get_json(
+                    '/containers/{}/stats'.format(self._container.id),
+                    {'stream': 'false', 'one-shot': 'true'}
+                )
+            except AsyncDockerError:
+                return
+        self._update(stats, now)
+
+    def _update(self, stats: Optional[dict], now: float):
+        if stats is None:
+            return
+        data = {
+            'container': self._container.id,
+            'time': now,
+            'pcpu': 0.0,
+            'io_r': 0.0,
+            'io_w': 0.0,
+            'mem': 0.0,
+            'pmem': 0.0
+        }
+        # fill in the data
+        data['pcpu'] = self._calculate_cpu_percent(stats)
+        data['io_r'], data['io_w'] = self._calculate_blkio_bytes(stats)
+        data['mem'] = self._calculate_mem_bytes(stats)
+        data['pmem'] = self._calculate_mem_perc(stats)
+        data['network'] = self._calculate_network_bytes(stats)
+        # adapt the sampling rate (if needed)
+        if self._app.sampler is not None:
+            self._app.sampler.observe(self, pcpu=data['pcpu'], pmem=data['pmem'])
         # update log
         self._app.extend_log('container_stats', [data])
 
+    def _read_stats(self):
+        # read from the cgroup filesystem directly when possible
+        if self._cgroups is not None:
+            stats = self._cgroups.stats(self._container.id)
+            if stats is not None:
+                return stats
+        if self._streams is None:
+            return self._container.stats(stream=False)
+        # (re)open the stream if needed
+        self._streams.open(self._container.id)
+        # downsample the stream to our period by taking the latest sample
+        return self._streams.pop_latest(self._container.id)
+
     def _calculate_cpu_percent(self, stats):
         cpu_percent = 0.0
         try:
@@ -129,21 +183,141 @@ class ContainerStatsJob(Job):
             return mem_perc
 
 
+class _Stream(object):
+
+    def __init__(self):
+        self.latest = None
+        self.first = threading.Event()
+        self.closed = False
+        self.future = None
+
+
+class _StatsStreams(object):
+    """Long-lived stats connections to many containers, read by a single thread.
+
+    The connections are multiplexed on an event loop of their own, only the latest sample
+    of each container is kept.
+    """
+
+    def __init__(self, app: 'SystemMonitor', base_url: str):
+        self._app = app
+        self._base_url = base_url
+        self._lock = threading.Lock()
+        # container ID -> stream
+        self._streams = {}
+        self._loop = None
+        self._client = None
+        self._thread = None
+        self._stopped = False
+
+    def open(self, container_id: str):
+        # asyncio is only needed when streaming
+        import asyncio
+        with self._lock:
+            if self._stopped:
+                return
+            stream = self._streams.get(container_id)
+            if stream is not None and not stream.closed:
+                return
+            if self._loop is None:
+                self._start()
+            stream = _Stream()
+            self._streams[container_id] = stream
+            stream.future = asyncio.run_coroutine_threadsafe(
+                self._read(container_id, stream), self._loop)
+
+    def pop_latest(self, container_id: str,
+                   timeout: float = CONTAINER_STATS_FIRST_SAMPLE_TIMEOUT_S):
+        stream = self._streams.get(container_id)
+        if stream is None:
+            return None
+        # the first sample comes right after the stream opens, do not skip a period for it
+        stream.first.wait(timeout)
+        # swapping the reference is atomic, no need to lock
+        latest, stream.latest = stream.latest, None
+        return latest
+
+    def close(self, container_id: str):
+        with self._lock:
+            stream = self._streams.pop(container_id, None)
+            if stream is not None and not self._stopped:
+                # cancels the read, which closes the connection
+                stream.future.cancel()
+
+    def close_all(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._streams.clear()
+            if self._loop is not None:
+                # pending reads are cancelled when the loop stops
+                self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def _start(self):
+        import asyncio
+        from system_monitor.asyncdocker import AsyncDockerClient
+        self._loop = asyncio.new_event_loop()
+        self._client = AsyncDockerClient(self._base_url)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        import asyncio
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_forever()
+        finally:
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+
+    async def _read(self, container_id: str, stream: _Stream):
+        from system_monitor.asyncdocker import AsyncDockerError
+        try:
+            async for stats in self._client.stream_json(
+                    '/containers/{}/stats'.format(container_id), {'stream': 'true'},
+                    timeout=CONTAINER_STATS_STREAM_TIMEOUT_S):
+                stream.latest = stats
+                stream.first.set()
+        except AsyncDockerError as e:
+            self._app.logger.error('{}:Container[{}]:Stream error {}'.format(
+                type(self).__name__, container_id, str(e)
+            ))
+        finally:
+            stream.closed = True
+            # nobody should wait for a sample that will not come
+            stream.first.set()
+
+
 class ContainerConfigJob(Job):
 
-    def __init__(self, app: 'SystemMonitor', client: DockerClient, container_id: str):
+    def __init__(self, app: 'SystemMonitor', client: DockerClient, container_id: str,
+                 store: Optional[ConfigStore] = None):
         super().__init__(period=FETCH_NEW_CONTAINER_STATS_EVERY_S)
         self._app = app
         self._client = client
         self._container_id = container_id
+        self._store = store
+
+    def container_id(self):
+        return self._container_id
 
     def run(self):
         # try to get the container configuration
         try:
             config = self._client.api.inspect_container(self._container_id)
+            # deduplicate against the configurations seen so far
+            if self._store is not None:
+                config, blobs = self._store.add(self._container_id, config)
+                if blobs:
+                    self._app.extend_log(BLOBS_SECTION, blobs)
             # update log
             self._app.extend_log(
-                'container_config',
+                CONFIG_SECTION,
                 {self._container_id: config}
             )
             # once it succeded, we no longer need to perform this job again
@@ -154,60 +328,187 @@ class ContainerConfigJob(Job):
 
 class ContainerListJob(Job):
 
-    def __init__(self, app: 'SystemMonitor', client: DockerClient):
-        super().__init__(period=FETCH_NEW_CONTAINERS_EVERY_S)
+    def __init__(self, app: 'SystemMonitor', client: DockerClient,
+                 cgroups: Optional[CgroupReader] = None, procs: Optional[ProcScanner] = None):
+        super().__init__(
+            period=CHECK_CONTAINERS_CONSISTENCY_EVERY_S if JOB_WATCH_CONTAINER_EVENTS
+            else FETCH_NEW_CONTAINERS_EVERY_S
+        )
         self._app = app
         self._client = client
+        self._cgroups = cgroups
+        self._config_store = ConfigStore() if app.args.dedup_configs else None
+        self._lock = threading.Lock()
         self._container_to_job = defaultdict(lambda: [])
-        self._containers_seen = set()
+        # container ID -> container
+        self._containers_seen = {}
+        self._events = None
+        self._events_thread = None
+        # stats of all containers are streamed by a single thread
+        self._stats_streams = _StatsStreams(app, app.base_url()) \
+            if JOB_FETCH_CONTAINER_STATS and CONTAINER_STATS_STREAMING else None
+        # processes of all containers are sampled at once from the host (when possible)
+        self._host_process_job = None
+        self._host_process_job_started = False
+        if JOB_FETCH_CONTAINER_TOP and procs is not None:
+            self._host_process_job = HostProcessStatsJob(
+                self._app, procs, self.containers, self._sample_processes_from_docker)
+
+    def containers(self):
+        with self._lock:
+            return set(self._containers_seen)
 
     def run(self):
+        # start sampling processes from the host (only once)
+        if self._host_process_job is not None and not self._host_process_job_started:
+            self._app.pool.enqueue(self._host_process_job)
+            self._host_process_job_started = True
+        # start listening for events (only once)
+        if JOB_WATCH_CONTAINER_EVENTS and self._events_thread is None:
+            # the stream exists before the thread, so that terminate() can always close it
+            try:
+                self._events = self._open_events()
+            except Exception as e:
+                # the thread tries again
+                self._app.logger.error('{}:Events:Error {}'.format(type(self).__name__, str(e)))
+            self._events_thread = threading.Thread(target=self._watch_events, daemon=True)
+            self._events_thread.start()
+        # (periodic) full list, when listening to events this is only a consistency check
         data = {
             'containers': {},
             'events': []
         }
-        now = time.time()
+        now = clock.now()
         containers = self._client.containers.list()
         containers_keys = set([c.id for c in containers])
-        # remove old containers
-        for container_id in list(self._containers_seen):
-            if container_id not in containers_keys:
-                data['events'].append({
-                    'time': now,
-                    'type': 'container/remove',
-                    'id': container_id
-                })
-                # deactivate corresponding jobs
-                for j in self._container_to_job[container_id]:
-                    j.terminate()
-                # remove container
-                self._containers_seen.remove(container_id)
-                del self._container_to_job[container_id]
-        for container in containers:
+        with self._lock:
+            # remove old containers
+            for container_id in list(self._containers_seen):
+                if container_id not in containers_keys:
+                    self._remove_container(container_id, now, data)
             # add new containers
-            if container.id not in self._containers_seen:
-                data['events'].append({
-                    'time': now,
-                    'type': 'container/add',
-                    'id': container.id
-                })
-                data['containers'][container.id] = container.name
-                # spawn new jobs
-                if JOB_FETCH_CONTAINER_STATS:
-                    job = ContainerStatsJob(self._app, container)
-                    self._container_to_job[container.id].append(job)
-                if JOB_FETCH_CONTAINER_TOP:
-                    job = ProcessStatsJob(self._app, container)
-                    self._container_to_job[container.id].append(job)
-                if JOB_FETCH_CONTAINER_CONFIG:
-                    job = ContainerConfigJob(self._app, self._client, container.id)
-                    self._container_to_job[container.id].append(job)
-                # start jobs
-                for job in self._container_to_job[container.id]:
-                    self._app.pool.enqueue(job)
-                # add container to list of seen
-                self._containers_seen.add(container.id)
+            for container in containers:
+                if container.id not in self._containers_seen:
+                    self._add_container(container, now, data)
         # update log
+        self._update_log(data)
+
+    def terminate(self):
+        super(ContainerListJob, self).terminate()
+        if self._host_process_job is not None:
+            self._host_process_job.terminate()
+        # stop streaming stats
+        if self._stats_streams is not None:
+            self._stats_streams.close_all()
+        # stop listening for events
+        events = self._events
+        if events is not None:
+            events.close()
+
+    def _open_events(self):
+        return self._client.events(
+            decode=True,
+            filters={'type': 'container', 'event': ['start', 'die', 'destroy']}
+        )
+
+    def _watch_events(self):
+        while not self.is_terminated():
+            try:
+                if self._events is None:
+                    self._events = self._open_events()
+                    # terminate() may have missed the new stream
+                    if self.is_terminated():
+                        self._events.close()
+                        return
+                for event in self._events:
+                    if self.is_terminated():
+                        return
+                    self._on_event(event)
+            except Exception as e:
+                if self.is_terminated():
+                    return
+                self._app.logger.error('{}:Events:Error {}'.format(type(self).__name__, str(e)))
+                time.sleep(CHECK_CONTAINERS_CONSISTENCY_EVERY_S / 10)
+            # reconnect
+            self._events = None
+
+    def _on_event(self, event: dict):
+        data = {
+            'containers': {},
+            'events': []
+        }
+        action = event.get('Action', event.get('status'))
+        container_id = event.get('id', event.get('Actor', {}).get('ID'))
+        # use the exact time of the event, on the same timeline as the samples
+        if 'timeNano' in event:
+            now = clock.from_wall(event['timeNano'] / 1e9)
+        elif 'time' in event:
+            now = clock.from_wall(event['time'])
+        else:
+            now = clock.now()
+        if action == 'start':
+            try:
+                container = self._client.containers.get(container_id)
+            except NotFound:
+                # the container is already gone
+                return
+            with self._lock:
+                if container.id not in self._containers_seen:
+                    self._add_container(container, now, data)
+        elif action in ['die', 'destroy']:
+            with self._lock:
+                if container_id in self._containers_seen:
+                    self._remove_container(container_id, now, data)
+        # update log (if anything changed)
+        if data['events']:
+            self._update_log(data)
+
+    def _add_container(self, container: Container, now: float, data: dict):
+        data['events'].append({
+            'time': now,
+            'type': 'container/add',
+            'id': container.id
+        })
+        data['containers'][container.id] = container.name
+        # spawn new jobs
+        if JOB_FETCH_CONTAINER_STATS:
+            job = ContainerStatsJob(self._app, container, self._cgroups,
+                                    self._stats_streams)
+            self._container_to_job[container.id].append(job)
+        if JOB_FETCH_CONTAINER_TOP and self._host_process_job is None:
+            job = ProcessStatsJob(self._app, container)
+            self._container_to_job[container.id].append(job)
+        if JOB_FETCH_CONTAINER_CONFIG:
+            job = ContainerConfigJob(self._app, self._client, container.id, self._config_store)
+            self._container_to_job[container.id].append(job)
+        # start jobs
+        for job in self._container_to_job[container.id]:
+            self._app.pool.enqueue(job)
+        # add container to list of seen
+        self._containers_seen[container.id] = container
+
+    def _remove_container(self, container_id: str, now: float, data: dict):
+        data['events'].append({
+            'time': now,
+            'type': 'container/remove',
+            'id': container_id
+        })
+        # deactivate corresponding jobs
+        for j in self._container_to_job[container_id]:
+            j.terminate()
+        # remove container
+        del self._containers_seen[container_id]
+        del self._container_to_job[container_id]
+
+    def _sample_processes_from_docker(self):
+        # the processes cannot be read from /proc, use docker top for each container instead
+        with self._lock:
+            self._host_process_job = None
+            for container_id, container in self._containers_seen.items():
+                job = ProcessStatsJob(self._app, container)
+                self._container_to_job[container_id].append(job)
+                self._app.pool.enqueue(job)
+
+    def _update_log(self, data: dict):
         for k, v in data.items():
             self._app.extend_log(k, v)
-
@@ -1,7 +1,8 @@
-import time
 import requests
 
 from .jobs import Job
+from system_monitor import clock
+from system_monitor.httpclient import CircuitOpenError
 from system_monitor.constants import \
     FETCH_NEW_DEVICE_STATS_EVERY_S, \
     DEFAULT_DEVICE_HEALTH_API_PORT
@@ -17,13 +18,16 @@ class DeviceHealthJob(Job):
     def run(self):
         try:
             # contact device health API
-            r = requests.get(self._url)
+            r = self._app.http.get(self._url)
             data = r.json()
-            data['time'] = time.time()
-            # send the data to the log
-            self._app.extend_log('health', [data])
-        except:
+        except CircuitOpenError:
             return
+        except (requests.RequestException, ValueError) as e:
+            self._app.logger.debug('Device health API: {}'.format(e))
+            return
+        data['time'] = clock.now()
+        # send the data to the log
+        self._app.extend_log('health', [data])
 
 
 def _device_health_url(target: str):
@@ -2,6 +2,9 @@ import time
 
 
 class Job(object):
+    # the async engine awaits the jobs that set this (and implement run_async), and runs
+    # the others in threads
+    ASYNC = False
 
     def __init__(self, period: int, ghost: bool = False):
         self._period = period
@@ -12,8 +15,23 @@ class Job(object):
     def is_executable(self):
         if self.is_terminated():
             return False
-        elapsed_since_last = time.time() - self._last_executed
-        return elapsed_since_last >= self._period
+        return time.time() >= self.next_execution()
+
+    @property
+    def period(self):
+        return self._period
+
+    @period.setter
+    def period(self, period):
+        # takes effect when the job is scheduled again (see `reschedule` of the pools)
+        self._period = period
+
+    def next_execution(self):
+        return self._last_executed + self._period
+
+    def container_id(self):
+        # container the job samples (if any)
+        return None
 
     def is_ghost(self):
         return self._ghost
@@ -25,12 +43,22 @@ class Job(object):
         self.run()
         self._last_executed = time.time()
 
+    async def execute_async(self):
+        await self.run_async()
+        self._last_executed = time.time()
+
+    def is_async(self):
+        return self.ASYNC
+
     def terminate(self):
         self._terminated = True
 
     def run(self):
         pass
 
+    async def run_async(self):
+        pass
+
     def reset(self):
         pass
 
@@ -1,58 +1,126 @@
-import time
 import copy
 from docker.models.containers import Container
 from docker.errors import APIError
+from typing import Callable, Set
 
 from .jobs import Job
-from system_monitor.constants import FETCH_NEW_PROCESS_STATS_EVERY_S
+from system_monitor import clock
+from system_monitor.procfs import ProcScanner, PS_COLUMN_TO_KEY
+from system_monitor.sampling import total
+from system_monitor.constants import \
+    FETCH_NEW_PROCESS_STATS_EVERY_S, \
+    HOST_PROCESS_STATS_MAX_EMPTY_SCANS
 
 
-PS_COLUMN_TO_KEY = {
-    'PPID': 'ppid',
-    'PID': 'pid',
-    '%CPU': 'pcpu',
-    'THCNT': 'nthreads',
-    'TIME': 'cputime',
-    '%MEM': 'pmem',
-    'SIZE': 'mem',
-    'CMD': 'command'
-}
+PS_ARGS = '-o ppid,pid,pcpu,thcount,cputime,pmem,size,cmd'
 
 
 class ProcessStatsJob(Job):
+    ASYNC = True
 
     def __init__(self, app: 'SystemMonitor', container: Container):
         super().__init__(period=FETCH_NEW_PROCESS_STATS_EVERY_S)
         self._app = app
         self._container = container
 
+    def container_id(self):
+        return self._container.id
+
     def run(self):
-        data = []
-        template = {
-            'container': self._container.id,
-            'time': time.time()
-        }
+        now = clock.now()
         # check if the container is still running
         if self._container.status != 'running':
             self.terminate()
         # try to get a new reading
         try:
-            stats = self._container.top(
-                ps_args='-o ppid,pid,pcpu,thcount,cputime,pmem,size,cmd'
-            )
-            if not stats['Processes'] or not stats['Titles']:
-                return
-            for process in stats['Processes']:
-                # fix size KB -> B
-                process[-2] = int(process[-2]) / 1000
-                # fill in the data
-                pdata = copy.copy(template)
-                for ps_key, value in zip(stats['Titles'], process):
-                    key = PS_COLUMN_TO_KEY[ps_key]
-                    pdata[key] = value
-                # add process
-                data.append(pdata)
+            stats = self._container.top(ps_args=PS_ARGS)
         except APIError:
             return
+        self._update(stats, now)
+
+    async def run_async(self):
+        # only used by the async engine, the threaded one does not need asyncio
+        from system_monitor.asyncdocker import AsyncDockerError
+        now = clock.now()
+        # check if the container is still running
+        if self._container.status != 'running':
+            self.terminate()
+        # try to get a new reading
+        try:
+            stats = await self._app.docker_async.get_json(
+                '/containers/{}/top'.format(self._container.id), {'ps_args': PS_ARGS})
+        except AsyncDockerError:
+            return
+        self._update(stats, now)
+
+    def _update(self, stats: dict, now: float):
+        data = []
+        template = {
+            'container': self._container.id,
+            'time': now
+        }
+        if not stats['Processes'] or not stats['Titles']:
+            return
+        for process in stats['Processes']:
+            # fix size KB -> B
+            process[-2] = int(process[-2]) / 1000
+            # fill in the data
+            pdata = copy.copy(template)
+            for ps_key, value in zip(stats['Titles'], process):
+                key = PS_COLUMN_TO_KEY[ps_key]
+                pdata[key] = value
+            # add process
+            data.append(pdata)
+        # adapt the sampling rate (if needed)
+        if self._app.sampler is not None:
+            self._app.sampler.observe(self, pcpu=total(data, 'pcpu'), pmem=total(data, 'pmem'))
+        # update log
+        self._app.extend_log('process_stats', data)
+
+
+class HostProcessStatsJob(Job):
+    """Samples the processes of all the monitored containers with a single walk of /proc.
+
+    If none of the processes of the monitored containers can be found in /proc (e.g., the
+    PID namespace is not the host's after all), the job stops and calls `fallback`.
+    """
+
+    def __init__(self, app: 'SystemMonitor', scanner: ProcScanner,
+                 containers: Callable[[], Set[str]], fallback: Callable[[], None]):
+        super().__init__(period=FETCH_NEW_PROCESS_STATS_EVERY_S)
+        self._app = app
+        self._scanner = scanner
+        self._containers = containers
+        self._fallback = fallback
+        self._empty_scans = 0
+
+    def run(self):
+        data = []
+        now = clock.now()
+        monitored = self._containers()
+        # map processes to containers
+        pid_to_container = {}
+        for container_id, pids in self._scanner.containers().items():
+            if container_id in monitored:
+                pid_to_container.update({pid: container_id for pid in pids})
+        # running containers have at least one process, we should see it
+        if monitored and not pid_to_container:
+            self._empty_scans += 1
+            if self._empty_scans >= HOST_PROCESS_STATS_MAX_EMPTY_SCANS:
+                self._app.logger.warning(
+                    'No process of the monitored containers found in /proc, '
+                    'reading processes from Docker')
+                self.terminate()
+                self._fallback()
+            return
+        self._empty_scans = 0
+        # sample all the processes at once
+        for process in self._scanner.scan(pid_to_container.keys()):
+            process['container'] = pid_to_container[process['pid']]
+            process['time'] = now
+            data.append(process)
+        # adapt the sampling rate (if needed)
+        if self._app.sampler is not None:
+            self._app.sampler.observe(self, pcpu=total(data, 'pcpu'), pmem=total(data, 'pmem'))
         # update log
         self._app.extend_log('process_stats', data)
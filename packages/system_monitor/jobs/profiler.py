@@ -0,0 +1,13 @@
+from .jobs import Job
+from system_monitor.constants import PROFILE_LOG_EVERY_S
+
+
+class SelfProfileJob(Job):
+
+    def __init__(self, app: 'SystemMonitor', profiler: 'SelfProfiler'):
+        super().__init__(period=PROFILE_LOG_EVERY_S, ghost=True)
+        self._app = app
+        self._profiler = profiler
+
+    def run(self):
+        self._app.extend_log('monitor_self', self._profiler.rows())
@@ -1,13 +1,20 @@
 import sys
-import json
+import time
+import zlib
+import hashlib
 import requests
 import os
 
-from typing import Dict
+from typing import Iterator
+from urllib.parse import urlencode, quote_plus
 
 from .jobs import Job
+from system_monitor.httpclient import CircuitOpenError
 from system_monitor.constants import \
     LOG_API_URL, \
+    LOG_API_CHUNK_URL, \
+    LOG_API_CHUNK_SIZE_BYTES, \
+    LOG_API_CHUNK_RETRY_N_TIMES, \
     LOG_API_RETRY_EVERY_S, \
     LOG_API_RETRY_N_TIMES, \
     LOG_API_REQUEST_TIMEOUT_S
@@ -15,16 +22,28 @@ from system_monitor.constants import \
 
 class PublisherJob(Job):
 
-    def __init__(self, app: 'SystemMonitor', log_key: str, log: Dict, no_upload: bool):
+    def __init__(self, app: 'SystemMonitor', log_key: str, log: 'MemoryLog', no_upload: bool):
         super().__init__(period=LOG_API_RETRY_EVERY_S)
         self._app = app
         self._log_key = log_key
         self._data = log
         self._trial = 0
         self._no_upload = no_upload
-        self._file_path = os.path.join("/tmp", log_key+".json")
+        self._export_format = app.args.export_format
+        self._export_dir = app.args.export_dir
+        # chunked upload (resumes from the first part not acknowledged by the server)
+        self._chunked = app.args.chunked_upload
+        self._compression = app.args.compression
+        self._next_part = 0
+        # body of the single POST, kept across trials (its length is computed once)
+        self._body = None
 
     def run(self):
+        if self._no_upload:
+            # stored once, there is nothing to retry
+            self._store()
+            self.terminate()
+            return
         if self._trial >= LOG_API_RETRY_N_TIMES:
             msg = 'We tried pushing the log to the cloud {} times. Giving up.'.format(
                 self._trial)
@@ -34,46 +53,239 @@ class PublisherJob(Job):
         self._app.logger.info('Pushing to the server [trial {:d}/{:d}]...'.format(
             self._trial+1, LOG_API_RETRY_N_TIMES
         ))
-        if self._no_upload:
-            with open(self._file_path, "w") as write_file:
-                json.dump(self._data, write_file)
-            self._app.logger.info(f"Data stored in {self._file_path}.")
+        try:
+            if self._push(self._data):
+                # stop job
+                self.terminate()
+        except CircuitOpenError as e:
+            # the server was not contacted, this is not a trial
+            self._app.logger.warning(str(e))
             return
+        except:
+            ex_type, ex, _ = sys.exc_info()
+            self._app.logger.error('{}: {}'.format(ex_type, ex))
+            # traceback.print_exception(ex_type, ex, tb, file=sys.stderr)
+        self._trial += 1
+
+    def _store(self):
+        if self._export_format == 'columnar':
+            # numpy is only needed to export
+            from system_monitor.export import export_log
+            path = export_log(self._data, os.path.join(self._export_dir, self._log_key))
+        else:
+            path = os.path.join(self._export_dir, self._log_key + ".json")
+            with open(path, "w") as write_file:
+                for chunk in self._data.iter_json():
+                    write_file.write(chunk)
+        self._app.logger.info(f"Data stored in {path}.")
+
+    def _fields(self) -> dict:
+        return {
+            'app_id': self._app.args.app_id,
+            'app_secret': self._app.args.app_secret,
+            'database': self._app.args.database,
+            'key': self._log_key
+        }
+
+    def _push(self, data) -> bool:
+        if self._chunked:
+            return self._push_chunked(data)
+        # contact log API (the body is encoded and sent one section at a time, with a
+        # Content-Length, the endpoint does not take chunked transfer encoding)
+        if self._body is None or self._body.data is not data:
+            self._body = _FormBody(self._fields(), 'value', data)
+        r = self._app.http.post(
+            LOG_API_URL,
+            data=self._body,
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+            timeout=LOG_API_REQUEST_TIMEOUT_S
+        )
+        # print(json.dumps(data, indent=4))
+        return self._check_response(r)
 
+    def _push_chunked(self, data) -> bool:
+        # the encoding is deterministic, so parts are regenerated identical on each trial
+        compressor = _Compressor(self._compression)
+        parts = _iter_parts(data.iter_json(), compressor, LOG_API_CHUNK_SIZE_BYTES)
+        for part, (payload, last) in enumerate(parts):
+            if part < self._next_part:
+                # already acknowledged by the server
+                continue
+            for attempt in range(LOG_API_CHUNK_RETRY_N_TIMES):
+                if self._push_part(part, payload, last):
+                    break
+                time.sleep(LOG_API_RETRY_EVERY_S / LOG_API_CHUNK_RETRY_N_TIMES)
+            else:
+                self._app.logger.error('Part {:d} could not be pushed, will resume from it'.format(
+                    part))
+                return False
+            self._next_part = part + 1
+        self._app.logger.info('Pushed {:d} parts'.format(self._next_part))
+        return True
+
+    def _push_part(self, part: int, payload: bytes, last: bool) -> bool:
+        data = {
+            **self._fields(),
+            'part': part,
+            'last': int(last),
+            'encoding': self._compression,
+            'checksum': hashlib.sha256(payload).hexdigest()
+        }
         try:
-            # create request body
-            data = {
-                'app_id': self._app.args.app_id,
-                'app_secret': self._app.args.app_secret,
-                'database': self._app.args.database,
-                'key': self._log_key,
-                'value': json.dumps(self._data)
-            }
-            # contact log API
-            r = requests.post(
-                LOG_API_URL,
+            r = self._app.http.post(
+                LOG_API_CHUNK_URL,
                 data=data,
+                files={'value': ('{}.{:06d}'.format(self._log_key, part), payload)},
                 timeout=LOG_API_REQUEST_TIMEOUT_S
             )
-            # print(json.dumps(data, indent=4))
-
-            def server_msg(r): return 'The server says: [{}] {}'.format(
-                r['code'], r['message'] or r['status'])
-            # try to interpret the error message from the server
-            try:
-                data = r.json()
-                if data['code'] != 200:
-                    self._app.logger.error(server_msg(data))
-                else:
-                    self._app.logger.info(server_msg(data))
-            except:
-                # print the response in plain
-                self._app.logger.error(r.text)
-            # stop job
+        except CircuitOpenError:
+            # retrying the part would not contact the server either
+            raise
+        except requests.RequestException as e:
+            self._app.logger.error('Part {:d}: {}'.format(part, e))
+            return False
+        return self._check_response(r, quiet=not last)
+
+    def _check_response(self, r, quiet: bool = False) -> bool:
+        def server_msg(r): return 'The server says: [{}] {}'.format(
+            r['code'], r['message'] or r['status'])
+        # try to interpret the error message from the server
+        try:
+            data = r.json()
+            if data['code'] != 200:
+                self._app.logger.error(server_msg(data))
+                return False
+            if not quiet:
+                self._app.logger.info(server_msg(data))
+            return True
+        except:
+            # print the response in plain
+            self._app.logger.error(r.text)
+            return False
+
+
+class LivePublisherJob(PublisherJob):
+    """Pushes what was logged since the last acknowledged push, while the monitor runs.
+
+    Each push is appended by the server to the log with the given key, in order of sequence
+    number. A push is retried (with the same content) until the server acknowledges it, only
+    then the pushed data is trimmed from the local log.
+    """
+
+    def __init__(self, app: 'SystemMonitor', log_key: str, period: int):
+        super().__init__(app, log_key, None, no_upload=False)
+        self._period = period
+        self._final = False
+        self._sequence = 0
+        self._watermark = {}
+        # view being pushed, kept until acknowledged
+        self._pending = None
+
+    def finalize(self):
+        # push what is left, retrying as the end-of-run publisher would
+        self._final = True
+        self._period = LOG_API_RETRY_EVERY_S
+        self._trial = 0
+
+    def run(self):
+        if self._final and self._trial >= LOG_API_RETRY_N_TIMES:
+            msg = 'We tried pushing the log to the cloud {} times. Giving up.'.format(
+                self._trial)
+            self._app.logger.info(msg)
             self.terminate()
+            return
+        if self._pending is None:
+            self._pending = self._app.log_since(self._watermark)
+            self._next_part = 0
+        if self._pending.is_empty():
+            self._pending = None
+            if self._final:
+                self.terminate()
+            return
+        try:
+            if self._push(self._pending):
+                self._app.trim_log(self._pending.watermark)
+                self._watermark = self._pending.watermark
+                self._pending = None
+                self._sequence += 1
+                if self._final:
+                    self.terminate()
+        except CircuitOpenError as e:
+            # the server was not contacted, this is not a trial
+            self._app.logger.warning(str(e))
+            return
         except:
             ex_type, ex, _ = sys.exc_info()
             self._app.logger.error('{}: {}'.format(ex_type, ex))
-            # traceback.print_exception(ex_type, ex, tb, file=sys.stderr)
-        finally:
+        if self._final:
             self._trial += 1
+
+    def _fields(self) -> dict:
+        return {
+            **super()._fields(),
+            'append': 1,
+            'sequence': self._sequence
+        }
+
+
+class _Compressor(object):
+
+    def __init__(self, compression: str):
+        if compression == 'gzip':
+            self._compressor = zlib.compressobj(wbits=31)
+        elif compression == 'zlib':
+            self._compressor = zlib.compressobj()
+        elif compression == 'zstd':
+            # optional dependency
+            import zstandard
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+        elif compression == 'none':
+            self._compressor = None
+        else:
+            raise ValueError('Unknown compression {}'.format(compression))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) if self._compressor else data
+
+    def flush(self) -> bytes:
+        return self._compressor.flush() if self._compressor else b''
+
+
+def _iter_parts(chunks: Iterator[str], compressor: _Compressor, size: int):
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += compressor.compress(chunk.encode('utf-8'))
+        while len(buffer) > size:
+            yield bytes(buffer[:size]), False
+            del buffer[:size]
+    buffer += compressor.flush()
+    while len(buffer) > size:
+        yield bytes(buffer[:size]), False
+        del buffer[:size]
+    yield bytes(buffer), True
+
+
+class _FormBody(object):
+    # form-encoded body streamed from a (frozen) log, with its length known upfront
+
+    def __init__(self, fields: dict, key: str, data):
+        self.data = data
+        self._fields = fields
+        self._key = key
+        self._length = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        return _form_body(self._fields, self._key, self.data.iter_json())
+
+    def __len__(self) -> int:
+        # the escaped length is not the length of the JSON, the body is encoded (not kept)
+        # once to measure it
+        if self._length is None:
+            self._length = sum(len(chunk) for chunk in self)
+        return self._length
+
+
+def _form_body(fields: dict, key: str, value: Iterator[str]) -> Iterator[bytes]:
+    yield (urlencode(fields) + '&' + quote_plus(key) + '=').encode('utf-8')
+    for chunk in value:
+        yield quote_plus(chunk).encode('utf-8')
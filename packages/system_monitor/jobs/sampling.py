@@ -0,0 +1,13 @@
+from .jobs import Job
+from system_monitor.constants import SAMPLING_CONTROL_EVERY_S
+
+
+class AdaptiveSamplingJob(Job):
+
+    def __init__(self, app: 'SystemMonitor', sampler: 'AdaptiveSampler'):
+        super().__init__(period=SAMPLING_CONTROL_EVERY_S, ghost=True)
+        self._app = app
+        self._sampler = sampler
+
+    def run(self):
+        self._sampler.control()
@@ -0,0 +1,12 @@
+from .jobs import Job
+from system_monitor.constants import ROLLUP_WRITE_EVERY_S
+
+
+class SummaryJob(Job):
+
+    def __init__(self, app: 'SystemMonitor'):
+        super().__init__(period=ROLLUP_WRITE_EVERY_S, ghost=True)
+        self._app = app
+
+    def run(self):
+        self._app.write_summary()
@@ -1,53 +1,29 @@
-import time
-import subprocess
-
 from .jobs import Job
+from system_monitor import clock
+from system_monitor.procfs import ProcScanner
+from system_monitor.sampling import total
 from system_monitor.constants import FETCH_NEW_SYSTEM_PROCESS_STATS_EVERY_S
 
 
-PS_COLUMN_TO_KEY = {
-    'PPID': 'ppid',
-    'PID': 'pid',
-    '%CPU': 'pcpu',
-    'THCNT': 'nthreads',
-    'TIME': 'cputime',
-    '%MEM': 'pmem',
-    'SIZE': 'mem',
-    'CMD': 'command'
-}
-
-
 class SystemProcessStatsJob(Job):
 
     def __init__(self, app: 'SystemMonitor'):
         super().__init__(period=FETCH_NEW_SYSTEM_PROCESS_STATS_EVERY_S)
         self._app = app
+        self._scanner = ProcScanner()
 
     def run(self):
-        data = []
         template = {
             'container': None,
-            'time': time.time()
+            'time': clock.now()
         }
-        # try to get a new reading
-        output = subprocess.check_output([
-            'ps', '-o', 'ppid,pid,pcpu,thcount,cputime,pmem,size,pgrp,cmd', '-axww'
-        ]).decode('utf-8').splitlines(keepends=False)
-        header = [h for h in ' '.join(output[0].strip().split()).split() if h]
-        raw_data = map(lambda s: s.strip().split(None, len(header) - 1), output[1:])
-        processes = [dict(zip(header, row)) for row in raw_data]
-        for process in processes:
-            # fix size KB -> B
-            process['SIZE'] = int(process['SIZE']) / 1000
-            # keep only non-kernel processes
-            if process['PGRP'] == '0':
-                continue
-            del process['PGRP']
-            # translate fields
-            process = {PS_COLUMN_TO_KEY[k]: v for k, v in process.items()}
+        # try to get a new reading (kernel processes are skipped by the scanner)
+        data = self._scanner.scan()
+        for process in data:
             # fill in the data
             process.update(template)
-            # add process
-            data.append(process)
+        # adapt the sampling rate (if needed)
+        if self._app.sampler is not None:
+            self._app.sampler.observe(self, pcpu=total(data, 'pcpu'), pmem=total(data, 'pmem'))
         # update log
         self._app.extend_log('all_process_stats', data)
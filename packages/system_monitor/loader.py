@@ -0,0 +1,194 @@
+import os
+import json
+
+import numpy as np
+
+from typing import Dict, Iterator, List
+
+from .export import META_FILE, STRINGS_FILE, _group_starts
+from .columnar import JSON_FORMATS
+from .configstore import CONFIG_SECTION, BLOBS_SECTION, expand
+
+
+class ExportedLog(object):
+    """Log exported in the binary columnar format (see `export.py`).
+
+    Plain columns are memory-mapped (nothing is read until used), delta-encoded ones are
+    decoded on first access. The log can be converted back to the v2 JSON schema.
+
+        log = ExportedLog('/tmp/<key>')
+        pcpu = log.column('container_stats', 'pcpu')
+        rows = log.get_log()['container_stats']
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        with open(os.path.join(path, META_FILE), 'rt') as fin:
+            meta = json.load(fin)
+        self.version = meta['version']
+        # dict sections and the list sections that are not columnar
+        self._log: dict = meta['log']
+        self._layouts: Dict[str, dict] = meta['sections']
+        self._strings: Dict[str, List[str]] = {}
+        self._decoded: Dict[tuple, np.ndarray] = {}
+
+    @property
+    def general(self) -> dict:
+        return self._log.get('general', {})
+
+    def sections(self) -> List[str]:
+        return list(self._log.keys()) + list(self._layouts.keys())
+
+    def columnar_sections(self) -> List[str]:
+        return list(self._layouts.keys())
+
+    def section(self, key: str, default=None):
+        # a section that is not columnar (e.g., 'containers', 'events'), as in the JSON log
+        return self._log.get(key, default)
+
+    def num_rows(self, section: str) -> int:
+        return self._layouts[section]['rows']
+
+    def column_names(self, section: str) -> List[str]:
+        return [column['name'] for column in self._layouts[section]['columns']]
+
+    def strings(self, section: str) -> List[str]:
+        if section not in self._strings:
+            with open(os.path.join(self._path, section, STRINGS_FILE), 'rt') as fin:
+                self._strings[section] = json.load(fin)
+        return self._strings[section]
+
+    def column(self, section: str, name: str, decode_strings: bool = False):
+        """Values of a numeric column, or indices into `strings(section)` for a string column.
+
+        Times are in seconds. Map columns are returned as a dict of arrays: `offsets` (row i
+        owns the entries `offsets[i]:offsets[i+1]`), `keys` and one array per field.
+        """
+        column = self._layout(section, name)
+        kind, encoding = column['kind'], column['encoding']
+        if isinstance(kind, list):
+            parts = ['offsets', 'keys'] + kind[1:]
+            return {part: self._load(section, '{}.{}'.format(name, part)) for part in parts}
+        if encoding == 'plain':
+            values = self._load(section, name)
+        elif (section, name) in self._decoded:
+            values = self._decoded[(section, name)]
+        else:
+            values = self._decoded[(section, name)] = self._decode(section, name, encoding)
+        if kind == 's' and decode_strings:
+            return _lookup(self.strings(section), values)
+        return values
+
+    def get_log(self) -> dict:
+        """The whole log in the v2 JSON schema, with the container configurations expanded"""
+        log = dict(self._log)
+        if BLOBS_SECTION in log:
+            log[CONFIG_SECTION] = expand(log.get(CONFIG_SECTION, {}), log.pop(BLOBS_SECTION))
+        for section in self._layouts:
+            log[section] = list(self.iter_rows(section))
+        return log
+
+    def iter_rows(self, section: str, chunk: int = 65536) -> Iterator[dict]:
+        # as the rows were written to the JSON log
+        names = self.column_names(section)
+        num = self.num_rows(section)
+        formats = JSON_FORMATS.get(section, {})
+        columns = [self._column_values(section, name) for name in names]
+        extras = {int(i): e for i, e in self._layouts[section].get('extras', {}).items()}
+        for start in range(0, num, chunk):
+            stop = min(start + chunk, num)
+            values = [
+                column(start, stop) if name not in formats else
+                list(map(formats[name], column(start, stop)))
+                for name, column in zip(names, columns)
+            ]
+            for i, row in enumerate(zip(*values), start):
+                row = dict(zip(names, row))
+                if i in extras:
+                    row.update(extras[i])
+                yield row
+
+    def iter_json(self) -> Iterator[str]:
+        # same output as the log would have been exported as JSON
+        for i, (key, value) in enumerate(self._log.items()):
+            yield '{}{}: {}'.format('{' if i == 0 else ', ', json.dumps(key), json.dumps(value))
+        for j, section in enumerate(self._layouts):
+            yield '{}{}: ['.format('{' if not self._log and j == 0 else ', ', json.dumps(section))
+            for k, row in enumerate(self.iter_rows(section)):
+                yield ('' if k == 0 else ', ') + json.dumps(row)
+            yield ']'
+        yield '}' if self._log or self._layouts else '{}'
+
+    def to_json(self, path: str):
+        with open(path, 'wt') as fout:
+            for chunk in self.iter_json():
+                fout.write(chunk)
+
+    def _layout(self, section: str, name: str) -> dict:
+        for column in self._layouts[section]['columns']:
+            if column['name'] == name:
+                return column
+        raise KeyError('Column {} not found in section {}'.format(name, section))
+
+    def _load(self, section: str, name: str) -> np.ndarray:
+        # zero-copy, pages are read from disk as they are accessed
+        return np.load(os.path.join(self._path, section, name + '.npy'), mmap_mode='r')
+
+    def _decode(self, section: str, name: str, encoding: str) -> np.ndarray:
+        deltas = self._load(section, name)
+        if encoding == 'delta_us':
+            return np.cumsum(deltas) / 1e6
+        if encoding.startswith('delta_by:'):
+            return _undelta_by(deltas, self._load(section, encoding[len('delta_by:'):]))
+        raise ValueError('Unknown encoding {}'.format(encoding))
+
+    def _column_values(self, section: str, name: str):
+        # function (start, stop) -> list of JSON values of the column
+        column = self._layout(section, name)
+        kind = column['kind']
+        if isinstance(kind, list):
+            parts = self.column(section, name)
+            strings = self.strings(section)
+            fields = kind[1:]
+
+            def _maps(start, stop):
+                offsets = parts['offsets'][start:stop + 1].tolist()
+                keys = parts['keys'][offsets[0]:offsets[-1]].tolist()
+                data = [parts[f][offsets[0]:offsets[-1]].tolist() for f in fields]
+                base = offsets[0]
+                return [{
+                    strings[keys[j - base]]: {f: data[k][j - base] for k, f in enumerate(fields)}
+                    for j in range(offsets[i], offsets[i + 1])
+                } for i in range(stop - start)]
+            return _maps
+        values = self.column(section, name)
+        if kind == 's':
+            strings = self.strings(section)
+            return lambda start, stop: [
+                strings[i] if i >= 0 else None for i in values[start:stop].tolist()
+            ]
+        return lambda start, stop: values[start:stop].tolist()
+
+
+def load(path: str) -> ExportedLog:
+    return ExportedLog(path)
+
+
+def _lookup(strings: List[str], indices: np.ndarray) -> np.ndarray:
+    table = np.array(strings + [None], dtype=object)
+    # -1 (None) picks the last entry
+    return table[np.asarray(indices)]
+
+
+def _undelta_by(deltas: np.ndarray, groups: np.ndarray) -> np.ndarray:
+    # inverse of `export._delta_by`: cumulative sum within each group
+    order = np.argsort(groups, kind='stable')
+    ordered = np.cumsum(deltas[order])
+    starts = _group_starts(np.asarray(groups)[order])
+    if len(starts):
+        # remove what the previous groups added up to
+        before = np.concatenate(([0], ordered[starts[1:] - 1]))
+        ordered -= np.repeat(before, np.diff(np.append(starts, len(ordered))))
+    values = np.empty_like(ordered)
+    values[order] = ordered
+    return values
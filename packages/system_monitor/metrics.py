@@ -0,0 +1,205 @@
+import json
+import threading
+
+from typing import Callable, Dict, Optional, Tuple
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .constants import METRICS_BIND_ADDRESS, METRICS_PREFIX
+
+
+class MetricsSnapshot(object):
+    """Latest samples of all the targets, updated as entries are consolidated into the logs.
+
+    Scrapes render from here and never touch the logs (or their locks). The rendered output
+    is cached until the next update. Every series is labeled with the target it comes from.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = 0
+        # (target, container) -> latest sample
+        self._containers: Dict[Tuple[str, str], dict] = {}
+        # (target, container) -> pid -> latest sample (container None is the host)
+        self._processes: Dict[Tuple[str, Optional[str]], Dict[int, dict]] = {}
+        # target -> latest health sample
+        self._health: Dict[str, dict] = {}
+        self._cache: Dict[str, tuple] = {}
+
+    def update(self, target: str, key: str, value):
+        if key == 'container_stats':
+            with self._lock:
+                for row in value:
+                    self._containers[(target, row.get('container'))] = row
+                self._version += 1
+        elif key in ('process_stats', 'all_process_stats'):
+            # each batch is a complete listing of the processes of its container(s)
+            batch = {}
+            for row in value:
+                batch.setdefault((target, row.get('container')), {})[row.get('pid')] = row
+            with self._lock:
+                self._processes.update(batch)
+                self._version += 1
+        elif key == 'health' and value:
+            with self._lock:
+                self._health[target] = value[-1]
+                self._version += 1
+        elif key == 'events':
+            # forget the containers that are gone
+            removed = [e.get('id') for e in value if e.get('type') == 'container/remove']
+            if removed:
+                with self._lock:
+                    for container in removed:
+                        self._containers.pop((target, container), None)
+                        self._processes.pop((target, container), None)
+                    self._version += 1
+
+    def to_json(self, stats: dict) -> str:
+        return json.dumps({
+            'containers': self._cached('containers', lambda: [
+                {'target': target, **row} for (target, _), row in self._containers.items()
+            ]),
+            'processes': self._cached('processes', lambda: [
+                {'target': target, **row}
+                for (target, _), rows in self._processes.items() for row in rows.values()
+            ]),
+            'health': self._cached('health', lambda: dict(self._health)),
+            'stats': stats
+        })
+
+    def to_prometheus(self, stats: dict) -> str:
+        return self._cached('prometheus', self._render_samples) + _render_stats(stats)
+
+    def _cached(self, name: str, render: Callable):
+        with self._lock:
+            version, value = self._cache.get(name, (None, None))
+            if version != self._version:
+                value = render()
+                self._cache[name] = (self._version, value)
+            return value
+
+    def _render_samples(self) -> str:
+        lines = []
+        for field in ('pcpu', 'pmem', 'mem', 'io_r', 'io_w'):
+            name = '{}_container_{}'.format(METRICS_PREFIX, field)
+            lines.append('# TYPE {} gauge'.format(name))
+            for (target, container), row in self._containers.items():
+                labels = {'target': target, 'container': container}
+                lines.append(_sample(name, labels, row.get(field)))
+        for field in ('rx', 'tx'):
+            name = '{}_container_network_{}_bytes'.format(METRICS_PREFIX, field)
+            lines.append('# TYPE {} gauge'.format(name))
+            for (target, container), row in self._containers.items():
+                for iface, counters in (row.get('network') or {}).items():
+                    labels = {'target': target, 'container': container, 'interface': iface}
+                    lines.append(_sample(name, labels, counters.get(field)))
+        for field in ('pcpu', 'pmem', 'mem', 'nthreads'):
+            name = '{}_process_{}'.format(METRICS_PREFIX, field)
+            lines.append('# TYPE {} gauge'.format(name))
+            for (target, container), rows in self._processes.items():
+                for pid, row in rows.items():
+                    labels = {'target': target, 'container': container or '', 'pid': pid,
+                              'command': row.get('command')}
+                    lines.append(_sample(name, labels, row.get(field)))
+        name = '{}_health'.format(METRICS_PREFIX)
+        lines.append('# TYPE {} gauge'.format(name))
+        for target, health in self._health.items():
+            for key, value in _flatten(health):
+                lines.append(_sample(name, {'target': target, 'key': key}, value))
+        return '\n'.join(line for line in lines if line) + '\n'
+
+
+class MetricsServer(object):
+    """Serves a MetricsSnapshot on /metrics (Prometheus text format) and /metrics.json"""
+
+    def __init__(self, port: int, snapshot: MetricsSnapshot, stats: Callable[[], dict]):
+        self._snapshot = snapshot
+        self._stats = stats
+        self._server = ThreadingHTTPServer((METRICS_BIND_ADDRESS, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = server._snapshot.to_prometheus(server._stats())
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = server._snapshot.to_json(server._stats())
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                # do not print every scrape
+                pass
+
+        return _Handler
+
+
+def _render_stats(stats: dict) -> str:
+    lines = []
+    for group, value in stats.items():
+        name = '{}_{}'.format(METRICS_PREFIX, group)
+        if isinstance(value, bool) or not isinstance(value, (int, float, dict)):
+            continue
+        if not isinstance(value, dict):
+            lines.append('# TYPE {} gauge'.format(name))
+            lines.append(_sample(name, {}, value))
+            continue
+        for key, s in value.items():
+            if not isinstance(s, dict):
+                continue
+            if 'buckets' in s:
+                for le, count in s['buckets'].items():
+                    lines.append(_sample(name + '_bucket', {'key': key, 'le': le}, count))
+                lines.append(_sample(name + '_sum', {'key': key}, s['sum']))
+                lines.append(_sample(name + '_count', {'key': key}, s['count']))
+            else:
+                for field in ('count', 'mean', 'max'):
+                    lines.append(_sample('{}_{}'.format(name, field), {'key': key}, s.get(field)))
+    return '\n'.join(line for line in lines if line) + '\n'
+
+
+def _sample(name: str, labels: dict, value) -> Optional[str]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if not labels:
+        return '{} {}'.format(name, value)
+    labels = ','.join('{}="{}"'.format(k, _escape(v)) for k, v in labels.items())
+    return '{}{{{}}} {}'.format(name, labels, value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _flatten(data: dict, prefix: str = ''):
+    for key, value in data.items():
+        key = '{}{}'.format(prefix, key)
+        if isinstance(value, dict):
+            yield from _flatten(value, key + '_')
+        else:
+            yield key, value
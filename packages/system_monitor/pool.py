@@ -1,8 +1,11 @@
 import sys
 import time
+import heapq
+import bisect
+import itertools
 
 from queue import Queue, Empty
-from threading import Thread, Event, Semaphore
+from threading import Thread, Event, Semaphore, Lock, Condition
 from collections import defaultdict
 from copy import copy
 
@@ -23,6 +26,7 @@ class Worker(Thread):
         self.idle = idle
         self.exception_handler = pool.exception_handler
         self.stats = pool.stats
+        self.profiler = pool.profiler
         self.daemon = True
         self.start()
 
@@ -32,24 +36,20 @@ class Worker(Thread):
         # keep running until told to abort
         while not self.abort.is_set():
             try:
-                # get a task and raise immediately if none available
-                job = self.queue.get(block=False)
-                if not job.is_executable():
-                    if not job.is_terminated():
-                        self.pool.enqueue(job)
-                    else:
-                        self.logger.debug(
-                            'Job [{:s}] was found terminated in the queue.'.format(str(job))
-                        )
+                # block until a job is due (or the heartbeat expires)
+                job, due = self.queue.get(timeout=1.0 / WORKER_HEARTBEAT_HZ)
+                if job.is_terminated():
+                    self.logger.debug(
+                        'Job [{:s}] was found terminated in the queue.'.format(str(job))
+                    )
                     self.queue.task_done()
-                    time.sleep(1.0 / WORKER_HEARTBEAT_HZ)
                     continue
-                # job = self.queue.get(block=False)
                 self.idle.clear()
+                # keep track of how late we are with respect to the job's schedule
+                self.stats.observe('scheduling_lag', str(job), time.time() - due)
             except Empty:
                 # no work to do
                 self.idle.set()
-                time.sleep(1.0 / WORKER_HEARTBEAT_HZ)
                 continue
             except:
                 ex_type, ex, tb = sys.exc_info()
@@ -59,7 +59,14 @@ class Worker(Thread):
 
             try:
                 # the function may raise
-                result = job.execute()
+                if self.profiler is None:
+                    result = job.execute()
+                else:
+                    start = self.profiler.start()
+                    try:
+                        result = job.execute()
+                    finally:
+                        self.profiler.stop(job, start)
                 if result is not None:
                     self.results.put(result)
             except:
@@ -78,16 +85,111 @@ class Worker(Thread):
                 self.queue.task_done()
 
 
+class Scheduler:
+    """Queue of jobs ordered by their next due time"""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._lock = Lock()
+        self._job_due = Condition(self._lock)
+        self._all_tasks_done = Condition(self._lock)
+        self._unfinished_tasks = 0
+
+    """Schedule a job for its next execution"""
+
+    def put(self, job):
+        # jobs that are overdue (e.g., new jobs) are due now
+        due = max(job.next_execution(), time.time())
+        with self._lock:
+            heapq.heappush(self._heap, (due, next(self._counter), job))
+            self._unfinished_tasks += 1
+            self._job_due.notify()
+
+    """Move a scheduled job to a new due time, returns False if the job is not in the queue"""
+
+    def reschedule(self, job, due):
+        due = max(due, time.time())
+        with self._lock:
+            for i, (_, count, scheduled) in enumerate(self._heap):
+                if scheduled is job:
+                    self._heap[i] = (due, count, job)
+                    heapq.heapify(self._heap)
+                    self._job_due.notify()
+                    return True
+        return False
+
+    """Wait for the earliest job to be due and return it together with its due time"""
+
+    def get(self, timeout):
+        deadline = time.time() + timeout
+        with self._lock:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    due, _, job = heapq.heappop(self._heap)
+                    # more jobs might be due, let another worker pick them up
+                    if self._heap and self._heap[0][0] <= now:
+                        self._job_due.notify()
+                    return job, due
+                if now >= deadline:
+                    raise Empty
+                wait = deadline - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                self._job_due.wait(wait)
+
+    """Remove and return all the scheduled jobs"""
+
+    def clear(self):
+        with self._lock:
+            jobs = [job for _, _, job in self._heap]
+            self._heap = []
+            self._mark_done(len(jobs))
+        return jobs
+
+    """Wake up all the workers waiting for a job"""
+
+    def wakeup(self):
+        with self._lock:
+            self._job_due.notify_all()
+
+    def task_done(self):
+        with self._lock:
+            self._mark_done(1)
+
+    def join(self):
+        with self._lock:
+            while self._unfinished_tasks:
+                self._all_tasks_done.wait()
+
+    def qsize(self):
+        with self._lock:
+            return len(self._heap)
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def _mark_done(self, num):
+        unfinished = self._unfinished_tasks - num
+        if unfinished < 0:
+            raise ValueError('task_done() called too many times')
+        self._unfinished_tasks = unfinished
+        if unfinished == 0:
+            self._all_tasks_done.notify_all()
+
+
 class Pool:
     """Pool of threads consuming tasks from a queue"""
 
-    def __init__(self, logger, thread_count, exception_handler):
+    def __init__(self, logger, thread_count, exception_handler, profiler=None):
         self.logger = logger
-        self.queue = Queue()
+        self.queue = Scheduler()
         self.resultQueue = Queue()
         self.thread_count = thread_count
         self.exception_handler = exception_handler
         self.stats = StatisticsCollector()
+        self.profiler = profiler
         self.aborts = []
         self.idles = []
         self.threads = []
@@ -133,6 +235,11 @@ class Pool:
             return
         self.queue.put(job)
 
+    """Schedule a queued job again, e.g., after its period changed"""
+
+    def reschedule(self, job):
+        self.queue.reschedule(job, job.next_execution())
+
     """Wait for completion of all the tasks in the queue"""
 
     def join(self):
@@ -143,18 +250,12 @@ class Pool:
 
     def terminate_all(self):
         # clear the queue
-        while not self.done():
-            try:
-                job = self.queue.get(False)
-                self.queue.task_done()
-                self.logger.debug(
-                    'Job [{:s}] was found in the queue. Now terminated.'.format(
-                        str(job)
-                    )
+        for job in self.queue.clear():
+            self.logger.debug(
+                'Job [{:s}] was found in the queue. Now terminated.'.format(
+                    str(job)
                 )
-            except:
-                pass
-            time.sleep(0.1)
+            )
 
     """Tell each worker that its done working"""
 
@@ -162,6 +263,7 @@ class Pool:
         # tell the threads to stop after they are done with what they are currently doing
         for a in self.aborts:
             a.set()
+        self.queue.wakeup()
         # clear the queue
         self.terminate_all()
         # wait for them to finish if requested
@@ -218,6 +320,8 @@ class StatisticsCollector():
     def __init__(self):
         self.lock = Semaphore(1)
         self.data = defaultdict(lambda: 0)
+        self.samples = defaultdict(dict)
+        self.histograms = defaultdict(dict)
 
     def set(self, key, value):
         self.lock.acquire()
@@ -234,8 +338,50 @@ class StatisticsCollector():
         self.data[key] -= 1
         self.lock.release()
 
+    def observe(self, group, key, value):
+        self.lock.acquire()
+        samples = self.samples[group]
+        if key not in samples:
+            samples[key] = {'count': 0, 'total': 0.0, 'max': value}
+        samples[key]['count'] += 1
+        samples[key]['total'] += value
+        samples[key]['max'] = max(samples[key]['max'], value)
+        self.lock.release()
+
+    def histogram(self, group, key, value, buckets):
+        self.lock.acquire()
+        histograms = self.histograms[group]
+        if key not in histograms:
+            histograms[key] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1),
+                               'count': 0, 'total': 0.0}
+        h = histograms[key]
+        h['counts'][bisect.bisect_left(h['buckets'], value)] += 1
+        h['count'] += 1
+        h['total'] += value
+        self.lock.release()
+
     def get_stats(self):
         self.lock.acquire()
         stats = copy(self.data)
+        for group, samples in self.samples.items():
+            stats[group] = {
+                key: {
+                    'count': s['count'],
+                    'mean': s['total'] / s['count'],
+                    'max': s['max']
+                } for key, s in samples.items()
+            }
+        for group, histograms in self.histograms.items():
+            # cumulative counts, i.e., number of values <= each bucket
+            stats[group] = {
+                key: {
+                    'count': h['count'],
+                    'sum': h['total'],
+                    'buckets': dict(zip(
+                        [str(b) for b in h['buckets']] + ['+Inf'],
+                        itertools.accumulate(h['counts'])
+                    ))
+                } for key, h in histograms.items()
+            }
         self.lock.release()
         return stats
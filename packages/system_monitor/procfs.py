@@ -0,0 +1,183 @@
+import os
+import re
+import time
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .constants import PROC_ROOT, PROCFS_READ_BUFFER_BYTES
+
+
+PS_COLUMN_TO_KEY = {
+    'PPID': 'ppid',
+    'PID': 'pid',
+    '%CPU': 'pcpu',
+    'THCNT': 'nthreads',
+    'TIME': 'cputime',
+    '%MEM': 'pmem',
+    'SIZE': 'mem',
+    'CMD': 'command'
+}
+
+# fields of /proc/<pid>/stat (after the command name)
+_STAT_PPID = 1
+_STAT_PGRP = 2
+_STAT_UTIME = 11
+_STAT_STIME = 12
+_STAT_NUM_THREADS = 17
+_STAT_STARTTIME = 19
+_STAT_RSS = 21
+# fields of /proc/<pid>/statm
+_STATM_DATA = 5
+# Docker container ID in /proc/<pid>/cgroup (cgroupfs and systemd drivers)
+_CONTAINER_ID_RE = re.compile(rb'docker[-/]([0-9a-f]{64})')
+# inode of the host's (initial) PID namespace, fixed by the kernel (PROC_PID_INIT_INO)
+_HOST_PID_NAMESPACE_INODE = 0xEFFFFFFC
+
+
+class ProcScanner(object):
+    """Samples processes from /proc, the same way `ps` does but without forking.
+
+    All files are read into the same (reused) buffer. Unlike `ps`, which reports the average
+    CPU usage over the lifetime of a process, %CPU is computed over the time elapsed since
+    the previous scan.
+    """
+
+    def __init__(self, root: str = PROC_ROOT):
+        self._root = root
+        self._buffer = bytearray(PROCFS_READ_BUFFER_BYTES)
+        self._clock_ticks = os.sysconf('SC_CLK_TCK')
+        self._page_size = os.sysconf('SC_PAGE_SIZE')
+        self._mem_total = self._read_mem_total()
+        # pid -> (starttime, cpu ticks) at the previous scan
+        self._previous: Dict[int, Tuple[int, int]] = {}
+        self._previous_time = None
+
+    def pids(self) -> List[int]:
+        return [int(p) for p in os.listdir(self._root) if p.isdigit()]
+
+    def scan(self, pids: Optional[Iterable[int]] = None) -> List[dict]:
+        now = time.monotonic()
+        uptime = self._read_uptime()
+        elapsed = now - self._previous_time if self._previous_time is not None else None
+        processes = []
+        current = {}
+        for pid in (self.pids() if pids is None else pids):
+            try:
+                process = self._sample(pid, uptime, elapsed, current)
+            except (FileNotFoundError, ProcessLookupError, ValueError, IndexError):
+                # the process is gone (or was replaced) while we were reading it
+                continue
+            if process is not None:
+                processes.append(process)
+        self._previous = current
+        self._previous_time = now
+        return processes
+
+    def container_id(self, pid: int) -> Optional[str]:
+        match = _CONTAINER_ID_RE.search(self.read(pid, 'cgroup'))
+        return match.group(1).decode('ascii') if match else None
+
+    def containers(self, pids: Optional[Iterable[int]] = None) -> Dict[str, List[int]]:
+        # group the processes by the container they belong to
+        containers = {}
+        for pid in (self.pids() if pids is None else pids):
+            try:
+                container_id = self.container_id(pid)
+            except (FileNotFoundError, ProcessLookupError):
+                continue
+            if container_id is not None:
+                containers.setdefault(container_id, []).append(pid)
+        return containers
+
+    def is_host_namespace(self) -> bool:
+        return is_host_namespace(self._root)
+
+    def read(self, pid: int, name: str) -> bytes:
+        return self._read(os.path.join(self._root, str(pid), name))
+
+    def _sample(self, pid: int, uptime: float, elapsed: Optional[float],
+                current: Dict[int, Tuple[int, int]]) -> Optional[dict]:
+        stat = self.read(pid, 'stat')
+        # the command name can contain spaces and parentheses
+        fields = stat[stat.rindex(b')') + 2:].split()
+        # skip kernel threads
+        if int(fields[_STAT_PGRP]) == 0:
+            return None
+        ticks = int(fields[_STAT_UTIME]) + int(fields[_STAT_STIME])
+        starttime = int(fields[_STAT_STARTTIME])
+        current[pid] = (starttime, ticks)
+        # %CPU since the previous scan (or since the process started, for new processes)
+        previous = self._previous.get(pid)
+        if elapsed and previous is not None and previous[0] == starttime:
+            pcpu = (ticks - previous[1]) / self._clock_ticks / elapsed * 100.0
+        else:
+            lifetime = uptime - starttime / self._clock_ticks
+            pcpu = ticks / self._clock_ticks / lifetime * 100.0 if lifetime > 0 else 0.0
+        rss = int(fields[_STAT_RSS]) * self._page_size
+        # same as ps: SIZE is data + stack in KB
+        size = int(self.read(pid, 'statm').split()[_STATM_DATA]) * self._page_size // 1024
+        command = self.read(pid, 'cmdline').rstrip(b'\0').replace(b'\0', b' ')
+        if not command:
+            command = b'[' + stat[stat.index(b'(') + 1:stat.rindex(b')')] + b']'
+        return {
+            PS_COLUMN_TO_KEY['PPID']: int(fields[_STAT_PPID]),
+            PS_COLUMN_TO_KEY['PID']: pid,
+            PS_COLUMN_TO_KEY['%CPU']: round(pcpu, 1),
+            PS_COLUMN_TO_KEY['THCNT']: int(fields[_STAT_NUM_THREADS]),
+            PS_COLUMN_TO_KEY['TIME']: _format_cputime(ticks // self._clock_ticks),
+            PS_COLUMN_TO_KEY['%MEM']: round(rss / self._mem_total * 100.0, 1),
+            # fix size KB -> B (as done for the output of ps)
+            PS_COLUMN_TO_KEY['SIZE']: size / 1000,
+            PS_COLUMN_TO_KEY['CMD']: command.decode('utf-8', errors='replace')
+        }
+
+    def _read(self, path: str) -> bytes:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            size = 0
+            while True:
+                view = memoryview(self._buffer)[size:]
+                n = os.readv(fd, [view])
+                view.release()
+                if n == 0:
+                    break
+                size += n
+                # grow the buffer when full
+                if size == len(self._buffer):
+                    self._buffer.extend(bytearray(len(self._buffer)))
+            return bytes(memoryview(self._buffer)[:size])
+        finally:
+            os.close(fd)
+
+    def _read_uptime(self) -> float:
+        return float(self._read(os.path.join(self._root, 'uptime')).split()[0])
+
+    def _read_mem_total(self) -> int:
+        for line in self._read(os.path.join(self._root, 'meminfo')).splitlines():
+            if line.startswith(b'MemTotal:'):
+                return int(line.split()[1]) * 1024
+        return 1
+
+
+def is_host_namespace(root: str = PROC_ROOT) -> bool:
+    # we can see the processes of the other containers only from the host's PID namespace.
+    # The cgroup of PID 1 does not tell, it is '/' in a private cgroup namespace too.
+    # Reading the namespace of PID 1 needs privileges, ours is the same when /proc is ours.
+    for pid in ('1', 'self'):
+        try:
+            inode = os.stat(os.path.join(root, pid, 'ns', 'pid')).st_ino
+        except PermissionError:
+            continue
+        except FileNotFoundError:
+            return False
+        return inode == _HOST_PID_NAMESPACE_INODE
+    return False
+
+
+def _format_cputime(seconds: int) -> str:
+    # same as ps: [DD-]HH:MM:SS
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    cputime = '{:02d}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+    return '{:d}-{}'.format(days, cputime) if days else cputime
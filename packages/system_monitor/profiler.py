@@ -0,0 +1,88 @@
+import time
+import threading
+import tracemalloc
+
+from typing import Dict
+
+from . import clock
+
+
+class SelfProfiler(object):
+    """Measures what each job execution costs the monitor.
+
+    Thread CPU time and wall time are measured for every execution and aggregated per job
+    class and per container. Memory allocations are measured with tracemalloc (only if
+    enabled, as tracing slows down every allocation). The traced memory is process-wide, so
+    the allocations of jobs running concurrently on other workers are mixed in.
+    """
+
+    def __init__(self, trace_memory: bool = False):
+        self._lock = threading.Lock()
+        self._trace_memory = trace_memory
+        self._jobs: Dict[str, '_Cost'] = {}
+        self._containers: Dict[str, '_Cost'] = {}
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start(self) -> tuple:
+        memory = tracemalloc.get_traced_memory()[0] if self._trace_memory else 0
+        return time.thread_time(), time.perf_counter(), memory
+
+    def stop(self, job: 'Job', start: tuple):
+        cpu = time.thread_time() - start[0]
+        wall = time.perf_counter() - start[1]
+        memory = tracemalloc.get_traced_memory()[0] - start[2] if self._trace_memory else 0
+        container = job.container_id()
+        with self._lock:
+            self._cost(self._jobs, str(job)).add(cpu, wall, memory)
+            if container is not None:
+                self._cost(self._containers, container).add(cpu, wall, memory)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {name: cost.to_dict() for name, cost in self._jobs.items()}
+
+    def rows(self) -> list:
+        now = clock.now()
+        with self._lock:
+            return [
+                {'time': now, 'scope': scope, 'name': name, **cost.to_dict()}
+                for scope, costs in (('job', self._jobs), ('container', self._containers))
+                for name, cost in costs.items()
+            ]
+
+    def close(self):
+        if self._trace_memory:
+            tracemalloc.stop()
+
+    @staticmethod
+    def _cost(costs: Dict[str, '_Cost'], name: str) -> '_Cost':
+        if name not in costs:
+            costs[name] = _Cost()
+        return costs[name]
+
+
+class _Cost(object):
+
+    def __init__(self):
+        self.count = 0
+        self.cpu = 0.0
+        self.wall = 0.0
+        self.wall_max = 0.0
+        self.memory = 0
+
+    def add(self, cpu: float, wall: float, memory: int):
+        self.count += 1
+        self.cpu += cpu
+        self.wall += wall
+        self.wall_max = max(self.wall_max, wall)
+        self.memory += memory
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'cpu': self.cpu,
+            'wall': self.wall,
+            'wall_max': self.wall_max,
+            'memory': self.memory
+        }
@@ -0,0 +1,244 @@
+import math
+import threading
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from .sampling import total
+from .constants import \
+    ROLLUP_WINDOWS_S, \
+    ROLLUP_WINDOWS_KEEP, \
+    ROLLUP_QUANTILES, \
+    ROLLUP_SKETCH_ACCURACY, \
+    ROLLUP_METRICS
+
+# layout of the rows of the `summary` section, also written to the section as '$fields', and
+# fields of the rows of the `summary_windows` section
+ROLLUP_FIELDS = ['start', 'count', 'min', 'max', 'mean'] + \
+                ['p{:d}'.format(int(q * 100)) for q in ROLLUP_QUANTILES]
+
+
+class QuantileSketch(object):
+    """Streaming quantiles with bounded relative error (logarithmic buckets, as in DDSketch).
+
+    A value `x > 0` is counted in bucket `ceil(log_gamma(x))`, and every value in a bucket
+    is within `accuracy` (relative) of the value the bucket reports. The number of buckets
+    only depends on the range of the values, not on how many there are.
+    """
+
+    _MIN_VALUE = 1e-9
+
+    def __init__(self, accuracy: float = ROLLUP_SKETCH_ACCURACY):
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._positive: Dict[int, int] = {}
+        self._negative: Dict[int, int] = {}
+        self._zeros = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value > self._MIN_VALUE:
+            idx = self._index(value)
+            self._positive[idx] = self._positive.get(idx, 0) + 1
+        elif value < -self._MIN_VALUE:
+            idx = self._index(-value)
+            self._negative[idx] = self._negative.get(idx, 0) + 1
+        else:
+            self._zeros += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        # from the most negative value up
+        for idx in sorted(self._negative, reverse=True):
+            seen += self._negative[idx]
+            if seen > rank:
+                return -self._value(idx)
+        seen += self._zeros
+        if seen > rank:
+            return 0.0
+        for idx in sorted(self._positive):
+            seen += self._positive[idx]
+            if seen > rank:
+                return self._value(idx)
+        return self._value(max(self._positive))
+
+    def _index(self, value: float) -> int:
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _value(self, idx: int) -> float:
+        # midpoint (in relative terms) of the bucket
+        return 2 * self._gamma ** idx / (self._gamma + 1)
+
+
+class _Aggregate(object):
+
+    def __init__(self, start: float):
+        self.start = start
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+        self.sketch = QuantileSketch()
+
+    def add(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add(value)
+
+    def row(self) -> list:
+        return [_round(self.start), self.count, _round(self.min), _round(self.max),
+                _round(self.sum / self.count)] + \
+               [_round(self.sketch.quantile(q)) for q in ROLLUP_QUANTILES]
+
+
+class _Metric(object):
+    """Aggregates of one metric over the whole run and over tumbling windows"""
+
+    def __init__(self, start: float):
+        self.run = _Aggregate(start)
+        # window length -> windows closed since they were last taken, current window
+        self.closed: Dict[int, deque] = {w: deque(maxlen=ROLLUP_WINDOWS_KEEP)
+                                         for w in ROLLUP_WINDOWS_S}
+        self.current: Dict[int, _Aggregate] = {}
+
+    def add(self, t: float, value: float):
+        self.run.add(value)
+        for window in ROLLUP_WINDOWS_S:
+            start = t - t % window
+            current = self.current.get(window)
+            if current is None or start > current.start:
+                if current is not None:
+                    self.closed[window].append(current.row())
+                current = self.current[window] = _Aggregate(start)
+            # late samples (older than the current window) are only counted in the run
+            if start == current.start:
+                current.add(value)
+
+    def summary(self) -> dict:
+        # the whole run and the current windows (still open)
+        windows = {str(w): self.current[w].row() for w in ROLLUP_WINDOWS_S if w in self.current}
+        return {'run': self.run.row(), 'windows': windows}
+
+    def take_closed(self) -> Iterable[tuple]:
+        # (window length, row) of the windows closed since the last time
+        for window in ROLLUP_WINDOWS_S:
+            closed = self.closed[window]
+            while closed:
+                yield window, closed.popleft()
+
+
+class Rollups(object):
+    """Rolling aggregates of the samples, per container (or device) and metric.
+
+    Fed with the entries as they are consolidated into the log. The summary has one entry
+    per `<section>/<entity>` with, for each metric, one row (see `ROLLUP_FIELDS`) for the
+    whole run and one for the current window of each length (see `ROLLUP_WINDOWS_S`). The
+    windows that closed are taken once, as rows of their own (see `closed_windows`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (section, entity) -> metric -> aggregates
+        self._entities: Dict[tuple, Dict[str, _Metric]] = {}
+        self._changed = set()
+
+    def observe(self, key: str, value):
+        if key not in ROLLUP_METRICS or not isinstance(value, list):
+            return
+        samples = list(_samples(key, value))
+        if not samples:
+            return
+        with self._lock:
+            for entity, t, values in samples:
+                if t is None:
+                    continue
+                metrics = self._entities.setdefault((key, entity), {})
+                for metric, v in values.items():
+                    if metric not in metrics:
+                        metrics[metric] = _Metric(t)
+                    metrics[metric].add(t, v)
+                self._changed.add((key, entity))
+
+    def summary(self, changed_only: bool = False) -> dict:
+        with self._lock:
+            entities = self._changed if changed_only else self._entities.keys()
+            summary = {
+                '{}/{}'.format(section, entity): {
+                    metric: m.summary() for metric, m in self._entities[(section, entity)].items()
+                } for section, entity in entities
+            }
+            self._changed = set()
+        if summary:
+            summary['$fields'] = ROLLUP_FIELDS
+        return summary
+
+    def closed_windows(self) -> List[dict]:
+        # the windows closed since the last time, each is returned once
+        rows = []
+        with self._lock:
+            for (section, entity), metrics in self._entities.items():
+                for metric, m in metrics.items():
+                    for window, row in m.take_closed():
+                        rows.append({
+                            'entity': '{}/{}'.format(section, entity),
+                            'metric': metric,
+                            'window': window,
+                            **dict(zip(ROLLUP_FIELDS, row))
+                        })
+        return rows
+
+    def __len__(self):
+        return len(self._entities)
+
+
+def _samples(key: str, rows: list) -> Iterable[tuple]:
+    # (entity, time, {metric: value}) for each sample in the rows
+    metrics = ROLLUP_METRICS[key]
+    if key == 'container_stats':
+        for row in rows:
+            yield row.get('container'), row.get('time'), _numbers(row, metrics)
+    elif key in ('process_stats', 'all_process_stats'):
+        # a batch lists all the processes of its container(s), roll up their totals
+        containers = {}
+        for row in rows:
+            containers.setdefault(row.get('container') or 'host', []).append(row)
+        for container, processes in containers.items():
+            values = {metric: total(processes, metric) for metric in metrics}
+            values['nproc'] = float(len(processes))
+            yield container, processes[0].get('time'), values
+    elif key == 'health':
+        for row in rows:
+            yield 'device', row.get('time'), _numbers(_flatten(row), metrics)
+
+
+def _numbers(row: dict, metrics: Optional[list]) -> dict:
+    values = {}
+    for metric in (metrics if metrics is not None else row.keys()):
+        value = row.get(metric)
+        if isinstance(value, bool) or metric == 'time':
+            continue
+        try:
+            values[metric] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return values
+
+
+def _flatten(data: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, '{}{}.'.format(prefix, key)))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 4)
@@ -0,0 +1,124 @@
+import time
+import threading
+import weakref
+
+from typing import Callable, Dict, Optional
+
+from .constants import \
+    SAMPLING_MIN_PERIOD_S, \
+    SAMPLING_MIN_PERIOD_FACTOR, \
+    SAMPLING_MAX_PERIOD_FACTOR, \
+    SAMPLING_SPEEDUP, \
+    SAMPLING_SLOWDOWN, \
+    SAMPLING_ACTIVITY_HIGH, \
+    SAMPLING_ACTIVITY_LOW, \
+    SAMPLING_ACTIVITY_SMOOTHING, \
+    SAMPLING_TOLERANCES, \
+    SAMPLING_CPU_BUDGET_PCT, \
+    SAMPLING_MAX_THROTTLE
+
+
+class AdaptiveSampler(object):
+    """Adapts the period of the sampling jobs to what they observe.
+
+    A job samples faster (down to a fraction of its base period) while the values it reports
+    change by more than their tolerance (see `SAMPLING_TOLERANCES`), and slower (up to a
+    multiple of its base period) while they are flat. On top of that, all periods are
+    stretched by a global throttle while the monitor itself uses more CPU than its budget.
+
+    Jobs whose period shrinks while they wait in the queue are handed to `reschedule`.
+    """
+
+    def __init__(self, reschedule: Optional[Callable[['Job'], None]] = None):
+        self._reschedule = reschedule
+        self._lock = threading.Lock()
+        # job -> state, jobs are forgotten when they are garbage collected
+        self._jobs = weakref.WeakKeyDictionary()
+        self._throttle = 1.0
+        self._cpu = 0.0
+        self._last_cpu_time = None
+
+    def observe(self, job: 'Job', **values):
+        with self._lock:
+            state = self._jobs.get(job)
+            if state is None:
+                state = self._jobs[job] = _JobState(job.period)
+            state.update(values)
+            # (the job is running) the new period is used when it is scheduled again
+            self._apply(job, state)
+
+    def control(self):
+        # measure our own CPU usage (percent of one CPU) since the previous call
+        now = (time.monotonic(), time.process_time())
+        if self._last_cpu_time is not None:
+            wall, cpu = now[0] - self._last_cpu_time[0], now[1] - self._last_cpu_time[1]
+            self._cpu = cpu / wall * 100.0 if wall > 0 else 0.0
+        self._last_cpu_time = now
+        with self._lock:
+            if self._cpu > SAMPLING_CPU_BUDGET_PCT:
+                self._throttle = min(self._throttle * SAMPLING_SLOWDOWN, SAMPLING_MAX_THROTTLE)
+            elif self._cpu < SAMPLING_CPU_BUDGET_PCT / 2:
+                self._throttle = max(self._throttle / SAMPLING_SLOWDOWN, 1.0)
+            for job, state in list(self._jobs.items()):
+                self._apply(job, state, queued=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            factors = [state.factor for state in self._jobs.values()]
+            return {
+                'cpu': round(self._cpu, 1),
+                'throttle': round(self._throttle, 2),
+                'jobs': len(factors),
+                'faster': sum(1 for f in factors if f < 1.0),
+                'slower': sum(1 for f in factors if f > 1.0)
+            }
+
+    def _apply(self, job: 'Job', state: '_JobState', queued: bool = False):
+        period = max(state.base_period * state.factor * self._throttle, SAMPLING_MIN_PERIOD_S)
+        shorter = period < job.period
+        job.period = period
+        # a queued job would otherwise wait for the end of its old (longer) period
+        if queued and shorter and self._reschedule is not None:
+            self._reschedule(job)
+
+
+class _JobState(object):
+
+    def __init__(self, base_period: float):
+        self.base_period = base_period
+        self.factor = 1.0
+        self._previous: Dict[str, float] = {}
+        self._activity = None
+
+    def update(self, values: dict):
+        # largest change (in units of tolerance) among the observed values
+        changes = []
+        for key, value in values.items():
+            if value is None:
+                continue
+            previous = self._previous.get(key)
+            self._previous[key] = value
+            if previous is not None:
+                changes.append(abs(value - previous) / SAMPLING_TOLERANCES.get(key, 1.0))
+        if not changes:
+            return
+        change = max(changes)
+        if self._activity is None:
+            self._activity = change
+        else:
+            self._activity += SAMPLING_ACTIVITY_SMOOTHING * (change - self._activity)
+        if self._activity > SAMPLING_ACTIVITY_HIGH:
+            self.factor = max(self.factor * SAMPLING_SPEEDUP, SAMPLING_MIN_PERIOD_FACTOR)
+        elif self._activity < SAMPLING_ACTIVITY_LOW:
+            self.factor = min(self.factor * SAMPLING_SLOWDOWN, SAMPLING_MAX_PERIOD_FACTOR)
+
+
+def total(rows: list, key: str) -> float:
+    # sum of a numeric field over rows (e.g., the %CPU of all the processes of a container)
+    value = 0.0
+    for row in rows:
+        try:
+            value += float(row.get(key) or 0)
+        except (TypeError, ValueError):
+            pass
+    return value
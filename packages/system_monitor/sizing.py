@@ -0,0 +1,87 @@
+import json
+
+from typing import Dict, Iterable, List, Union
+
+
+# the JSON encoder's default separators are ', ' and ': '
+_ITEM_SEP = 2
+_KEY_SEP = 2
+_BRACKETS = 2
+
+
+class LogSize(object):
+    """Size in bytes of the log once serialized to JSON, kept up to date one row at a time"""
+
+    def __init__(self):
+        self._sections: Dict[str, '_SectionSize'] = {}
+        self._total = _BRACKETS
+
+    def add(self, key: str, lengths: Union[List[int], Dict[str, int]]):
+        # `lengths`: encoded length of each row added to a list section, or of each entry
+        # set in a dict section (see `encoded_lengths`)
+        if key not in self._sections:
+            self._sections[key] = _SectionSize(key, isinstance(lengths, dict))
+            self._total += self._sections[key].size + (_ITEM_SEP if len(self._sections) > 1 else 0)
+        section = self._sections[key]
+        before = section.size
+        if isinstance(lengths, dict):
+            for k, length in lengths.items():
+                section.set_entry(k, length)
+        else:
+            section.add_entries(len(lengths), sum(lengths))
+        self._total += section.size - before
+
+    def remove(self, key: str, num: int, length: int):
+        # `num` rows of encoded length `length` (in total) were dropped from a list section
+        section = self._sections[key]
+        before = section.size
+        section.remove_entries(num, length)
+        self._total += section.size - before
+
+    def total(self) -> int:
+        return self._total
+
+    def sections(self) -> Dict[str, int]:
+        return {key: section.size for key, section in self._sections.items()}
+
+
+class _SectionSize(object):
+
+    def __init__(self, key: str, keyed: bool):
+        # "key": [] or "key": {}
+        self.size = len(json.dumps(key)) + _KEY_SEP + _BRACKETS
+        self._entries = {} if keyed else None
+        self._count = 0
+
+    def add_entries(self, num: int, length: int):
+        if num == 0:
+            return
+        self.size += length + _ITEM_SEP * (num if self._count else num - 1)
+        self._count += num
+
+    def remove_entries(self, num: int, length: int):
+        num = min(num, self._count)
+        self.size -= length + _ITEM_SEP * (num if num < self._count else num - 1)
+        self._count -= num
+
+    def set_entry(self, key: str, length: int):
+        # "k": v
+        length += len(json.dumps(key)) + _KEY_SEP
+        if key in self._entries:
+            self.size += length - self._entries[key]
+        else:
+            self.size += length + (_ITEM_SEP if self._count else 0)
+            self._count += 1
+        self._entries[key] = length
+
+
+def encode(value: Union[Iterable, Dict]) -> Union[List[str], Dict[str, str]]:
+    if isinstance(value, dict):
+        return {k: json.dumps(v) for k, v in value.items()}
+    return [json.dumps(row) for row in value]
+
+
+def encoded_lengths(encoded: Union[List[str], Dict[str, str]]) -> Union[List[int], Dict[str, int]]:
+    if isinstance(encoded, dict):
+        return {k: len(v) for k, v in encoded.items()}
+    return [len(row) for row in encoded]
@@ -0,0 +1,528 @@
+import os
+import copy
+import json
+import threading
+
+from array import array
+from queue import Queue
+from typing import Iterable, Iterator, Union, Dict, List, Optional, Tuple
+
+from .columnar import ColumnarSection, COLUMNAR_SCHEMAS, JSON_FORMATS, normalize, format_rows
+from .sizing import encode, encoded_lengths
+from .constants import \
+    LOG_WATERMARK_VERSION_KEY as VERSION_KEY, \
+    LOG_SEGMENT_MAX_BYTES, \
+    LOG_WRITER_BUFFER_BYTES, \
+    LOG_EXPORT_CHUNK_ROWS, \
+    LOG_RETENTION_EVICT_FRACTION, \
+    LOG_RETENTION_DOWNSAMPLED_FRACTION, \
+    LOG_RETENTION_ENTITY_KEYS
+
+# encoded length of the rows added to a list section, or of the entries set in a dict section
+_Lengths = Union[List[int], Dict[str, int]]
+# number and encoded length of the rows evicted from a list section
+_Evicted = Optional[Tuple[int, int]]
+
+
+class MemoryLog(object):
+    """Log kept in memory as a tree of dicts and lists.
+
+    List sections with a known schema (see `COLUMNAR_SCHEMAS`) are stored column-wise.
+
+    With `max_rows`, each list section is a ring buffer of (about) that many rows: when full,
+    its oldest rows are evicted, a quarter of the budget at a time. With `downsample_s`, the
+    evicted rows are first thinned to one per container (and process) every `downsample_s`
+    seconds, and kept at the head of the section within a share of the budget.
+    """
+
+    def __init__(self, general: dict, max_rows: int = 0, downsample_s: float = 0):
+        self._log: Dict[str, Union[dict, list, ColumnarSection]] = {
+            'general': general
+        }
+        self._versions = _Versions()
+        self._versions.touch('general', general.keys())
+        # absolute index of the first row still in memory, for each list section
+        self._offsets: Dict[str, int] = {}
+        self._max_rows = max_rows
+        self._downsample_s = downsample_s
+        # encoded length of each row of the list sections (columnar ones only when bounded)
+        self._lengths: Dict[str, array] = {}
+        # encoded length of the list sections that are not columnar, kept up to date
+        self._encoded: Dict[str, int] = {}
+        # number of downsampled rows at the head of each list section
+        self._downsampled: Dict[str, int] = {}
+        # number of rows evicted from each list section
+        self.evicted: Dict[str, int] = {}
+
+    def extend(self, key: str, value: Union[Iterable, Dict]) -> Tuple[_Lengths, _Evicted]:
+        """Returns the encoded length of what was added (rows, or entries for dict sections)
+        and, if rows had to be evicted to make room, their number and encoded length"""
+        # create list/dict if not present
+        if key not in self._log:
+            if isinstance(value, list):
+                self._log[key] = ColumnarSection(COLUMNAR_SCHEMAS[key], JSON_FORMATS.get(key)) \
+                    if key in COLUMNAR_SCHEMAS else []
+            else:
+                self._log[key] = {}
+        # handle type mismatch
+        section = self._log[key]
+        section_type = list if isinstance(section, ColumnarSection) else type(section)
+        if section_type != type(value):
+            raise ValueError('Cannot extend a log of type {} with an object of type {}'.format(
+                section_type, type(value)
+            ))
+        # handle lists:
+        if isinstance(value, list):
+            self._offsets.setdefault(key, 0)
+            if isinstance(section, ColumnarSection):
+                # the lengths are computed from what the section stores
+                lengths = section.extend(value)
+            else:
+                section.extend(value)
+                lengths = encoded_lengths(encode(value))
+                self._encoded[key] = self._encoded.get(key, 0) + sum(lengths)
+            if self._max_rows or not isinstance(section, ColumnarSection):
+                self._lengths.setdefault(key, array('q')).extend(lengths)
+            if self._max_rows and len(section) > self._max_rows:
+                return lengths, self._evict(key)
+            return lengths, None
+        # handle dicts
+        section.update(value)
+        self._versions.touch(key, value.keys())
+        return encoded_lengths(encode(value)), None
+
+    def get_log(self) -> dict:
+        return {
+            key: value.to_rows() if isinstance(value, ColumnarSection) else copy.deepcopy(value)
+            for key, value in self._log.items()
+        }
+
+    def snapshot(self) -> 'MemoryLog':
+        # a copy that can be read (e.g., published) without the lock while this log grows
+        snapshot = MemoryLog(self._log['general'])
+        snapshot._log = {
+            key: section.copy() if isinstance(section, ColumnarSection) else copy.deepcopy(section)
+            for key, section in self._log.items()
+        }
+        return snapshot
+
+    def since(self, watermark: dict) -> 'LogView':
+        log, new_watermark = {}, {VERSION_KEY: self._versions.current}
+        for key, section in self._log.items():
+            if isinstance(section, dict):
+                log[key] = {
+                    k: copy.deepcopy(section[k])
+                    for k in self._versions.changed(key, watermark.get(VERSION_KEY, 0))
+                }
+                continue
+            start = max(watermark.get(key, 0) - self._offsets[key], 0)
+            log[key] = section.to_rows(start) if isinstance(section, ColumnarSection) \
+                else copy.deepcopy(section[start:])
+            new_watermark[key] = self._offsets[key] + len(section)
+        return LogView(log, new_watermark)
+
+    def trim(self, watermark: dict):
+        for key, section in self._log.items():
+            if isinstance(section, dict):
+                for k in self._versions.forget(key, watermark.get(VERSION_KEY, 0)):
+                    del section[k]
+                continue
+            num = min(max(watermark.get(key, 0) - self._offsets[key], 0), len(section))
+            if isinstance(section, ColumnarSection):
+                section.trim(num)
+            else:
+                del section[:num]
+            if key in self._encoded:
+                self._encoded[key] -= sum(self._lengths[key][:num])
+            if key in self._lengths:
+                del self._lengths[key][:num]
+            self._downsampled[key] = max(self._downsampled.get(key, 0) - num, 0)
+            self._offsets[key] += num
+
+    def iter_sections(self) -> Iterator[Tuple[str, Union[dict, list, ColumnarSection]]]:
+        # the sections as they are stored (not copied, hold the lock while iterating)
+        yield from list(self._log.items())
+
+    def memory_usage(self) -> Dict[str, int]:
+        # bytes taken by each list section (encoded length for those that are not columnar),
+        # from counters, the rows are never walked
+        return {
+            key: section.nbytes() if isinstance(section, ColumnarSection)
+            else self._encoded.get(key, 0)
+            for key, section in self._log.items() if not isinstance(section, dict)
+        }
+
+    def iter_json(self) -> Iterator[str]:
+        # one section at a time, so that we never hold the whole encoded log in memory
+        for i, (key, value) in enumerate(list(self._log.items())):
+            prefix = '{}{}: '.format('{' if i == 0 else ', ', json.dumps(key))
+            if not isinstance(value, ColumnarSection):
+                yield prefix + json.dumps(value)
+                continue
+            # columnar sections are exported in bulk, a chunk of rows at a time
+            yield prefix + '['
+            for j, rows in enumerate(value.iter_rows(LOG_EXPORT_CHUNK_ROWS)):
+                yield ('' if j == 0 else ', ') + json.dumps(rows)[1:-1]
+            yield ']'
+        yield '}'
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _evict(self, key: str) -> Tuple[int, int]:
+        section, lengths = self._log[key], self._lengths[key]
+        num = len(section)
+        head = self._downsampled.get(key, 0)
+        # raw rows leaving the ring
+        stop = min(head + max(int(self._max_rows * LOG_RETENTION_EVICT_FRACTION), 1), num)
+        downsampled = []
+        if self._downsample_s > 0:
+            # the downsampled rows have their own share of the budget, the oldest go first
+            downsampled = list(range(head)) + self._thin(key, head, stop)
+            budget = int(self._max_rows * LOG_RETENTION_DOWNSAMPLED_FRACTION)
+            downsampled = downsampled[max(len(downsampled) - budget, 0):]
+        keep = downsampled + list(range(stop, num))
+        kept_lengths = array('q', [lengths[i] for i in keep])
+        evicted = num - len(keep), sum(lengths) - sum(kept_lengths)
+        if isinstance(section, ColumnarSection):
+            self._log[key] = section.select(keep)
+        else:
+            self._log[key] = [section[i] for i in keep]
+            self._encoded[key] -= evicted[1]
+        self._lengths[key] = kept_lengths
+        self._downsampled[key] = len(downsampled)
+        # the rows after the evicted ones keep their (absolute) index
+        self._offsets[key] += evicted[0]
+        self.evicted[key] = self.evicted.get(key, 0) + evicted[0]
+        return evicted
+
+    def _thin(self, key: str, start: int, stop: int) -> List[int]:
+        # indices of the first row of each entity in each period of `downsample_s` seconds
+        section = self._log[key]
+        names = ('time',) + LOG_RETENTION_ENTITY_KEYS
+        if isinstance(section, ColumnarSection):
+            columns = section.to_columns(start, stop, names)
+        else:
+            rows = section[start:stop]
+            columns = {name: [row.get(name) for row in rows] for name in names}
+        missing = [None] * (stop - start)
+        times = columns.get('time', missing)
+        entities = zip(*[columns.get(name, missing) for name in LOG_RETENTION_ENTITY_KEYS])
+        kept, seen = [], set()
+        for i, (t, entity) in enumerate(zip(times, entities)):
+            if t is None:
+                continue
+            bucket = (entity, int(t // self._downsample_s))
+            if bucket not in seen:
+                seen.add(bucket)
+                kept.append(start + i)
+        return kept
+
+
+class SegmentedLog(object):
+    """Log streamed to disk as append-only segments of newline-delimited JSON.
+
+    List sections (samples) are written row by row to `<directory>/<section>/<n>.ndjson`
+    by a writer thread, dict sections (keyed by container, bounded in size) stay in memory.
+    """
+
+    def __init__(self, general: dict, directory: str):
+        self._directory = directory
+        self._dicts: Dict[str, dict] = {
+            'general': general
+        }
+        self._versions = _Versions()
+        self._versions.touch('general', general.keys())
+        self._lists: Dict[str, '_SectionWriter'] = {}
+        # nothing is evicted, the samples are on disk
+        self.evicted: Dict[str, int] = {}
+        self._queue = Queue()
+        os.makedirs(self._directory, exist_ok=True)
+        self._writer = threading.Thread(target=self._write_forever, daemon=True)
+        self._writer.start()
+
+    def extend(self, key: str, value: Union[Iterable, Dict]) -> Tuple[_Lengths, _Evicted]:
+        # handle type mismatch
+        current = dict if key in self._dicts else list if key in self._lists else type(value)
+        if current != type(value):
+            raise ValueError('Cannot extend a log of type {} with an object of type {}'.format(
+                current, type(value)
+            ))
+        # the lengths are those of the lines written to disk
+        encoded = encode(format_rows(key, value) if isinstance(value, list) else value)
+        # handle dicts
+        if isinstance(value, dict):
+            self._dicts.setdefault(key, {}).update(value)
+            self._versions.touch(key, value.keys())
+            return encoded_lengths(encoded), None
+        # handle lists:
+        if key not in self._lists:
+            self._lists[key] = _SectionWriter(os.path.join(self._directory, key))
+        self._queue.put((self._lists[key], encoded))
+        return encoded_lengths(encoded), None
+
+    def get_log(self) -> dict:
+        # all the rows are read back from disk, `iter_json` or a snapshot should be used instead
+        self.flush()
+        return _get_log(self._dicts, self._segments())
+
+    def snapshot(self) -> 'SegmentedSnapshot':
+        # the segments written so far are closed, the new rows go to new segments
+        self.flush()
+        return SegmentedSnapshot(copy.deepcopy(self._dicts), {
+            key: section.seal() for key, section in list(self._lists.items())
+        })
+
+    def since(self, watermark: dict) -> 'LogView':
+        self.flush()
+        log, new_watermark = {}, {VERSION_KEY: self._versions.current}
+        for key, section in self._dicts.items():
+            log[key] = {
+                k: copy.deepcopy(section[k])
+                for k in self._versions.changed(key, watermark.get(VERSION_KEY, 0))
+            }
+        for key, section in self._lists.items():
+            log[key] = [json.loads(row) for row in section.rows(watermark.get(key, 0))]
+            new_watermark[key] = section.num_rows()
+        return LogView(log, new_watermark)
+
+    def trim(self, watermark: dict):
+        for key, section in self._dicts.items():
+            for k in self._versions.forget(key, watermark.get(VERSION_KEY, 0)):
+                del section[k]
+        for key, section in self._lists.items():
+            section.trim(watermark.get(key, 0))
+
+    def iter_sections(self) -> Iterator[Tuple[str, Union[dict, list, ColumnarSection]]]:
+        self.flush()
+        yield from _iter_sections(self._dicts, self._segments())
+
+    def memory_usage(self) -> Dict[str, int]:
+        # the list sections are on disk
+        return {}
+
+    def iter_json(self) -> Iterator[str]:
+        self.flush()
+        yield from _iter_json(self._dicts, self._segments())
+
+    def flush(self):
+        # wait for the writer to consume the queue, then push the buffers to disk
+        self._queue.join()
+        for section in list(self._lists.values()):
+            section.flush()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        for section in list(self._lists.values()):
+            section.close()
+
+    def _segments(self) -> Dict[str, Iterator[list]]:
+        # the segments of each list section, read lazily
+        return {key: section.segments() for key, section in list(self._lists.items())}
+
+    def _write_forever(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            section, lines = item
+            try:
+                section.write(lines)
+            finally:
+                self._queue.task_done()
+
+
+class _SectionWriter(object):
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._num_segments = 0
+        # segments before this one were trimmed
+        self._first_segment = 0
+        self._segment_rows = []
+        self._file = None
+        self._file_size = 0
+        os.makedirs(self._directory, exist_ok=True)
+
+    def write(self, lines: list):
+        with self._lock:
+            for line in lines:
+                line += '\n'
+                # rotate segment when full
+                if self._file is None or self._file_size >= LOG_SEGMENT_MAX_BYTES:
+                    self._open_segment()
+                self._file.write(line)
+                self._file_size += len(line)
+                self._segment_rows[-1] += 1
+
+    def segments(self) -> Iterator[list]:
+        yield from _read_segments(
+            [self._segment_path(i) for i in range(self._first_segment, self._num_segments)])
+
+    def seal(self) -> List[str]:
+        # close the segment being written (the next rows open a new one), returns the paths
+        # of all the segments, which are not written anymore
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            return [self._segment_path(i) for i in range(self._first_segment, self._num_segments)]
+
+    def num_rows(self) -> int:
+        return sum(self._segment_rows)
+
+    def rows(self, start: int) -> Iterator[str]:
+        # rows from the given absolute index on
+        first = sum(self._segment_rows[:self._first_segment])
+        for segment in self.segments():
+            if first + len(segment) > start:
+                yield from segment[max(start - first, 0):]
+            first += len(segment)
+
+    def trim(self, until: int):
+        # drop the segments (other than the one being written) that only contain rows before `until`
+        with self._lock:
+            last = sum(self._segment_rows[:self._first_segment + 1])
+            while self._first_segment < self._num_segments - 1 and last <= until:
+                os.remove(self._segment_path(self._first_segment))
+                self._first_segment += 1
+                last += self._segment_rows[self._first_segment]
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open_segment(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._segment_path(self._num_segments), 'wt',
+                          buffering=LOG_WRITER_BUFFER_BYTES)
+        self._file_size = 0
+        self._num_segments += 1
+        self._segment_rows.append(0)
+
+    def _segment_path(self, i: int) -> str:
+        return os.path.join(self._directory, '{:06d}.ndjson'.format(i))
+
+
+class SegmentedSnapshot(object):
+    """What a segmented log stored at some point: its dict sections and its closed segments"""
+
+    def __init__(self, dicts: Dict[str, dict], segments: Dict[str, List[str]]):
+        self._dicts = dicts
+        self._segments = segments
+
+    def get_log(self) -> dict:
+        return _get_log(self._dicts, self._read())
+
+    def iter_sections(self) -> Iterator[Tuple[str, Union[dict, list, ColumnarSection]]]:
+        yield from _iter_sections(self._dicts, self._read())
+
+    def iter_json(self) -> Iterator[str]:
+        yield from _iter_json(self._dicts, self._read())
+
+    def _read(self) -> Dict[str, Iterator[list]]:
+        return {key: _read_segments(paths) for key, paths in self._segments.items()}
+
+
+class LogView(object):
+    """Portion of a log, e.g., what was logged since a watermark"""
+
+    def __init__(self, log: dict, watermark: dict):
+        self._log = {key: value for key, value in log.items() if value}
+        self.watermark = watermark
+
+    def is_empty(self) -> bool:
+        return len(self._log) == 0
+
+    def get_log(self) -> dict:
+        return self._log
+
+    def iter_json(self) -> Iterator[str]:
+        for i, (key, value) in enumerate(self._log.items()):
+            yield '{}{}: {}'.format('{' if i == 0 else ', ', json.dumps(key), json.dumps(value))
+        yield '{}' if not self._log else '}'
+
+
+class _Versions(object):
+    # version of each entry of the dict sections, to tell what changed after a watermark
+
+    def __init__(self):
+        self.current = 0
+        self._versions: Dict[str, Dict[str, int]] = {}
+
+    def touch(self, key: str, entries: Iterable[str]):
+        versions = self._versions.setdefault(key, {})
+        for entry in entries:
+            self.current += 1
+            versions[entry] = self.current
+
+    def changed(self, key: str, since: int) -> list:
+        return [e for e, v in self._versions.get(key, {}).items() if v > since]
+
+    def forget(self, key: str, until: int) -> list:
+        versions = self._versions.get(key, {})
+        entries = [e for e, v in versions.items() if v <= until]
+        for entry in entries:
+            del versions[entry]
+        return entries
+
+
+def _read_segments(paths: List[str]) -> Iterator[list]:
+    # the lines of each segment, one segment at a time
+    for path in paths:
+        with open(path, 'rt') as fin:
+            yield fin.read().splitlines()
+
+
+def _get_log(dicts: Dict[str, dict], segments: Dict[str, Iterator[list]]) -> dict:
+    log = copy.deepcopy(dicts)
+    for key, lines in segments.items():
+        log[key] = [json.loads(row) for segment in lines for row in segment]
+    return log
+
+
+def _iter_sections(dicts: Dict[str, dict], segments: Dict[str, Iterator[list]]) \
+        -> Iterator[Tuple[str, Union[dict, list, ColumnarSection]]]:
+    # list sections are read back from disk one at a time, column-wise when possible
+    yield from list(dicts.items())
+    for key, lines in segments.items():
+        if key not in COLUMNAR_SCHEMAS:
+            yield key, [json.loads(row) for segment in lines for row in segment]
+            continue
+        value = ColumnarSection(COLUMNAR_SCHEMAS[key], JSON_FORMATS.get(key))
+        for segment in lines:
+            value.extend(normalize(key, [json.loads(row) for row in segment]))
+        yield key, value
+
+
+def _iter_json(dicts: Dict[str, dict], segments: Dict[str, Iterator[list]]) -> Iterator[str]:
+    # the lines on disk are already encoded, they are joined as they are
+    i = 0
+    for key, value in dicts.items():
+        yield '{}{}: {}'.format('{' if i == 0 else ', ', json.dumps(key), json.dumps(value))
+        i += 1
+    for key, lines in segments.items():
+        yield '{}{}: ['.format('{' if i == 0 else ', ', json.dumps(key))
+        j = 0
+        for segment in lines:
+            if segment:
+                yield ('' if j == 0 else ', ') + ', '.join(segment)
+                j += 1
+        yield ']'
+        i += 1
+    yield '}'
@@ -0,0 +1,333 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import docker
+
+from typing import Iterable, Union, Dict, Optional
+
+from .cgroup import CgroupReader
+from .procfs import ProcScanner, is_host_namespace
+from .storage import MemoryLog, SegmentedLog
+from .columnar import normalize
+from .sizing import LogSize, encode, encoded_lengths
+from .ingest import ShardedIngestor
+from .rollups import Rollups
+from . import clock
+from .jobs import \
+    ContainerListJob, \
+    DeviceHealthJob, \
+    PublisherJob, \
+    LivePublisherJob, \
+    EndpointInfoJob, \
+    SummaryJob
+from .constants import \
+    DEFAULT_TARGET, \
+    DEFAULT_DOCKER_TCP_PORT, \
+    JOB_FETCH_CONTAINER_LIST, \
+    JOB_FETCH_CONTAINER_STATS_FROM_CGROUP, \
+    JOB_FETCH_CONTAINER_TOP_FROM_PROC, \
+    JOB_FETCH_DEVICE_HEALTH, \
+    JOB_PUSH_TO_SERVER, \
+    JOB_FETCH_ENDPOINT_INFO, \
+    ROLLUP_METRICS, \
+    LOG_RETENTION_DEFAULT_ROWS, \
+    LOG_VERSION
+
+
+class MonitorTarget(object):
+    """One monitored Docker endpoint, with its own log.
+
+    Exposes the same interface as the app to the jobs of the target, while sharing the pool,
+    the HTTP client, the sampler and the clock of the app with all the other targets.
+    """
+
+    def __init__(self, app: 'SystemMonitor', target: str):
+        self._app = app
+        self.args = argparse.Namespace(**{**vars(app.args), 'target': target})
+        self._lock = threading.Semaphore(1)
+        # ---
+        general = {
+            'time': app.start_time,
+            'time_iso': app.start_time_iso,
+            'version': LOG_VERSION,
+            'group': self.args.group,
+            'subgroup': self.args.subgroup,
+            'type': self.args.type.lower(),
+            'target': self.get_target_name(),
+            'duration': self.args.duration,
+            'system': self.args.system and self.is_local(),
+            'notes': self.args.notes,
+            'no_upload': self.args.no_upload,
+            'summary_only': self.args.summary_only,
+            'clock': clock.anchor()
+        }
+        if self.args.log_dir:
+            log_dir = os.path.join(self.args.log_dir, self.get_log_key())
+            self._log = SegmentedLog(general, log_dir)
+        else:
+            self._log = MemoryLog(general, self.retention_rows(), self.args.retention_downsample)
+        self._log_size = LogSize()
+        self._log_size.add('general', encoded_lengths(encode(general)))
+        # counters of the log, replaced (never changed) by whoever holds the lock
+        self._progress = {}
+        self._publish_progress()
+        self._log_types = {'general': dict}
+        # new log entries are buffered per worker and consolidated into the log in batches
+        self._ingest = ShardedIngestor(self._consolidate_log)
+        self._ingest.start()
+        # aggregates of the samples, written to the 'summary' and 'summary_windows' sections
+        self._rollups = Rollups()
+        # Docker client used by the jobs awaited by the async engine
+        self.docker_async = None
+        if self.args.engine == 'async':
+            from .asyncdocker import AsyncDockerClient
+            self.docker_async = AsyncDockerClient(self.base_url())
+        self._container_list_job = None
+        self._live_publisher_job = None
+
+    # shared with the app
+
+    @property
+    def logger(self):
+        return self._app.logger
+
+    @property
+    def pool(self):
+        return self._app.pool
+
+    @property
+    def http(self):
+        return self._app.http
+
+    @property
+    def sampler(self):
+        return self._app.sampler
+
+    def name(self):
+        return self._app.name()
+
+    def uptime(self):
+        return self._app.uptime()
+
+    def get_progress(self):
+        return self._app.get_progress()
+
+    # jobs
+
+    def start(self):
+        # initialize docker client
+        client = docker.DockerClient(base_url=self.base_url())
+        # create endpoint info job
+        if JOB_FETCH_ENDPOINT_INFO:
+            self.pool.enqueue(EndpointInfoJob(self, client))
+        # create container updater job
+        if JOB_FETCH_CONTAINER_LIST:
+            self._container_list_job = ContainerListJob(
+                self, client, self._cgroup_reader(), self._proc_scanner())
+            self.pool.enqueue(self._container_list_job)
+        # create device health job
+        if JOB_FETCH_DEVICE_HEALTH:
+            self.pool.enqueue(DeviceHealthJob(self, self.args.target))
+        # create summary job
+        self.pool.enqueue(SummaryJob(self))
+        # create live publisher job (if needed)
+        if JOB_PUSH_TO_SERVER and self.args.publish_every > 0 and not self.args.no_upload:
+            self._live_publisher_job = LivePublisherJob(
+                self, self.get_log_key(), self.args.publish_every)
+            self.pool.enqueue(self._live_publisher_job)
+
+    def stop(self):
+        # stop listening for new containers
+        if self._container_list_job is not None:
+            self._container_list_job.terminate()
+
+    def publish(self):
+        self.write_summary()
+        self._ingest.flush()
+        if self._live_publisher_job is not None:
+            # only what was not pushed yet is left
+            self._live_publisher_job.finalize()
+            self.pool.enqueue(self._live_publisher_job)
+        else:
+            self._lock.acquire()
+            # the publisher reads a frozen copy, the log could still be extended
+            log = self._log.snapshot()
+            # release lock
+            self._lock.release()
+            self.pool.enqueue(PublisherJob(self, self.get_log_key(), log, self.args.no_upload))
+
+    def close(self):
+        self._ingest.stop()
+        self._log.close()
+
+    # log
+
+    def extend_log(self, key: str, value: Union[Iterable, Dict]):
+        # handle type mismatch (setdefault is atomic, no need to lock)
+        log_type = self._log_types.setdefault(key, type(value))
+        if log_type != type(value):
+            raise ValueError('Cannot extend a log of type {} with an object of type {}'.format(
+                log_type, type(value)
+            ))
+        # the samples are stored (and published) with the types of their schema, by all backends
+        if isinstance(value, list):
+            value = normalize(key, value)
+        # hand over to the consolidator
+        self._ingest.put(key, value)
+
+    def _consolidate_log(self, entries: list):
+        wait_start = time.time()
+        self._lock.acquire()
+        hold_start = time.time()
+        target = self.get_target_name()
+        for key, value in entries:
+            try:
+                # only the rollups of the samples are kept in summary-only mode
+                if not (self.args.summary_only and key in ROLLUP_METRICS):
+                    # the log tells the size of what it stores, as it will be written out
+                    lengths, evicted = self._log.extend(key, value)
+                    self._log_size.add(key, lengths)
+                    if evicted:
+                        self._log_size.remove(key, *evicted)
+                if self._app.metrics is not None:
+                    self._app.metrics.update(target, key, value)
+            except:
+                self._app.exception_handler(*sys.exc_info())
+        self._publish_progress()
+        hold_end = time.time()
+        # release lock
+        self._lock.release()
+        # update the rollups (they have their own lock)
+        for key, value in entries:
+            try:
+                self._rollups.observe(key, value)
+            except:
+                self._app.exception_handler(*sys.exc_info())
+        self.pool.stats.observe('lock_wait', 'extend_log', hold_start - wait_start)
+        self.pool.stats.observe('lock_hold', 'extend_log', hold_end - hold_start)
+        self.pool.stats.observe('ingest_batch', 'extend_log', len(entries))
+
+    def write_summary(self):
+        # the windows closed since the last time are appended, only once
+        windows = self._rollups.closed_windows()
+        if windows:
+            self.extend_log('summary_windows', windows)
+        # only the entries that changed since the last time
+        summary = self._rollups.summary(changed_only=True)
+        if summary:
+            self.extend_log('summary', summary)
+
+    def log_progress(self) -> dict:
+        # the latest published counters, scrapes never wait for the consolidator
+        progress = dict(self._progress)
+        progress['log_pending'] = self._ingest.pending()
+        return progress
+
+    def _publish_progress(self):
+        # (under the lock) a consistent snapshot of the counters, the log is never walked
+        self._progress = {
+            'log_size': self._log_size.total(),
+            'log_sections': self._log_size.sections(),
+            'log_memory': sum(self._log.memory_usage().values()),
+            'log_evicted': sum(self._log.evicted.values())
+        }
+
+    def get_log(self):
+        self._ingest.flush()
+        self._lock.acquire()
+        # return a copy
+        log = self._log.get_log()
+        # release lock
+        self._lock.release()
+        # ---
+        return log
+
+    def log_since(self, watermark: dict):
+        self._ingest.flush()
+        self._lock.acquire()
+        # what was logged after the watermark
+        view = self._log.since(watermark)
+        # release lock
+        self._lock.release()
+        # ---
+        return view
+
+    def trim_log(self, watermark: dict):
+        self._lock.acquire()
+        # drop what was logged up to the watermark
+        self._log.trim(watermark)
+        self._publish_progress()
+        # release lock
+        self._lock.release()
+
+    def retention_rows(self) -> int:
+        # runs with no end are bounded by default
+        if self.args.retention_rows is not None:
+            return self.args.retention_rows
+        return LOG_RETENTION_DEFAULT_ROWS if self.args.duration <= 0 else 0
+
+    def get_log_key(self):
+        return 'v{}__{}__{}__{}__{:d}'.format(
+            LOG_VERSION.replace('.', '_'),
+            self.args.group,
+            self.args.subgroup,
+            self.get_target_name(),
+            int(self._app.start_time)
+        )
+
+    def is_local(self) -> bool:
+        # the endpoint runs on this machine
+        return self.args.target.startswith('unix:')
+
+    def get_target_name(self):
+        target = socket.gethostname() if self.is_local() else self.args.target
+        target, *_ = target.split(':')
+        target = target.rstrip('.local')
+        return target.lower()
+
+    def base_url(self):
+        if self.is_local():
+            return self.args.target
+        else:
+            hostname, port, *_ = (self.args.target + ':' +
+                                  str(DEFAULT_DOCKER_TCP_PORT)).split(':')
+            return 'tcp://{:s}:{:s}'.format(self.args.target, port)
+
+    def _cgroup_reader(self) -> Optional[CgroupReader]:
+        # the cgroup filesystem is only reachable when monitoring the local endpoint
+        if not JOB_FETCH_CONTAINER_STATS_FROM_CGROUP or not self.is_local():
+            return None
+        if not CgroupReader.is_available():
+            self.logger.warning('Cgroup filesystem not available, reading stats from Docker')
+            return None
+        # the network counters are read from /proc/<pid>/net/dev of the processes
+        if not is_host_namespace():
+            self.logger.warning('Not in the host PID namespace, reading stats from Docker')
+            return None
+        return CgroupReader()
+
+    def _proc_scanner(self) -> Optional[ProcScanner]:
+        # the processes of the containers are only visible from the host's PID namespace
+        if not JOB_FETCH_CONTAINER_TOP_FROM_PROC or not self.is_local():
+            return None
+        scanner = ProcScanner()
+        if not scanner.is_host_namespace():
+            self.logger.warning('Not in the host PID namespace, reading processes from Docker')
+            return None
+        return scanner
+
+
+def read_targets(args) -> list:
+    """Targets from --target, --targets and --targets-file (one per line, # for comments)"""
+    targets = ([args.target] if args.target else []) + list(args.targets or [])
+    if args.targets_file:
+        with open(args.targets_file, 'rt') as fin:
+            for line in fin:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    targets.append(line)
+    # drop duplicates, keep the order
+    return list(dict.fromkeys(targets)) or [DEFAULT_TARGET]
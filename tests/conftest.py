@@ -0,0 +1,55 @@
+import os
+import sys
+
+# the package is not installed, the image runs it from the packages directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'packages'))
+
+
+import random
+
+import pytest
+
+
+def _recorded_batches(seed: int = 0):
+    # (key, value) as the jobs log them during a short run
+    from system_monitor.columnar import normalize
+    rng = random.Random(seed)
+    start = 1700000000.0 + rng.random()
+    counters = {}
+    for i in range(120):
+        t = start + i * 2.5 + rng.random() / 10
+        rows = []
+        for c in range(3):
+            container = '{:064x}'.format(c)
+            io_r, rx = counters.get(container, (0, 0))
+            io_r, rx = io_r + rng.randrange(1 << 20), rx + rng.randrange(1 << 16)
+            counters[container] = (io_r, rx)
+            rows.append({
+                'container': container, 'time': t, 'pcpu': rng.random() * 100 * (c + 1),
+                'io_r': io_r, 'io_w': 0, 'mem': float(rng.randrange(1 << 30)),
+                'pmem': rng.random(), 'network': {'eth0': {'rx': rx, 'tx': rng.randrange(99)}}
+            })
+        # a field that is not in the schema
+        rows[0]['restarts'] = i // 30
+        yield 'container_stats', normalize('container_stats', rows)
+        yield 'process_stats', normalize('process_stats', [{
+            'container': '{:064x}'.format(p % 2), 'time': t, 'ppid': '1', 'pid': str(100 + p),
+            'pcpu': rng.choice(['0.0', '12.5', '99.9', '150']), 'nthreads': str(p + 1),
+            'cputime': '00:00:{:02d}'.format(i % 60), 'pmem': '{:.1f}'.format(rng.random()),
+            'mem': float(rng.randrange(1 << 20)) / 1000,
+            'command': ['python3 -m app', 'nginx: worker "x"', '[kworker/0:1]', 'café'][p]
+        } for p in range(4)])
+        if i % 40 == 0:
+            yield 'events', [{'time': t, 'type': 'container/add', 'id': '{:064x}'.format(i)}]
+            yield 'containers', {'{:064x}'.format(c): 'name-{}'.format(c) for c in range(3)}
+            yield 'health', [{'time': t, 'temperature': 40.5 + i, 'throttled': False}]
+
+
+@pytest.fixture
+def recorded_log():
+    """A memory log filled as during a short run"""
+    from system_monitor.storage import MemoryLog
+    log = MemoryLog({'time': 1700000000.0, 'version': '2.0', 'target': 'host', 'duration': 300})
+    for key, value in _recorded_batches():
+        log.extend(key, value)
+    return log
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from system_monitor.analysis import main  # noqa: E402
+from system_monitor.cli import get_analyze_parser  # noqa: E402
+from system_monitor.export import export_log  # noqa: E402
+
+
+def _analyze(path: str, output: str, *args) -> dict:
+    main(get_analyze_parser().parse_args([path, '-o', output] + list(args)))
+    with open(output, 'rt') as fin:
+        return json.load(fin)
+
+
+def _assert_close(a, b, path='report'):
+    # the export keeps timestamps in microseconds, rates can differ in the last digits
+    assert type(a) == type(b), path
+    if isinstance(a, dict):
+        assert a.keys() == b.keys(), path
+        for key in a:
+            _assert_close(a[key], b[key], '{}.{}'.format(path, key))
+    elif isinstance(a, list):
+        assert len(a) == len(b), path
+        for i, (x, y) in enumerate(zip(a, b)):
+            _assert_close(x, y, '{}[{}]'.format(path, i))
+    elif isinstance(a, float):
+        assert a == pytest.approx(b, rel=1e-6, abs=1e-6), path
+    else:
+        assert a == b, path
+
+
+@pytest.mark.parametrize('args', [[], ['--top', '2', '--step', '30']])
+def test_same_report_from_json_and_columnar(recorded_log, tmp_path, args, capsys):
+    json_path = str(tmp_path / 'log.json')
+    with open(json_path, 'wt') as fout:
+        for chunk in recorded_log.iter_json():
+            fout.write(chunk)
+    columnar_path = export_log(recorded_log, str(tmp_path / 'log'))
+    from_json = _analyze(json_path, str(tmp_path / 'json.out'), *args)
+    json_text = capsys.readouterr().out
+    from_columnar = _analyze(columnar_path, str(tmp_path / 'columnar.out'), *args)
+    assert from_json['containers'] and from_json['processes'] and from_json['timeline']
+    _assert_close(from_json, from_columnar)
+    # and the same printed report
+    assert json_text == capsys.readouterr().out
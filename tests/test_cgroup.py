@@ -0,0 +1,145 @@
+import os
+
+import pytest
+
+from system_monitor.cgroup import CgroupReader
+from system_monitor.jobs.container import ContainerStatsJob
+
+CONTAINER_ID = 'c' * 64
+PID = 42
+NET_DEV = """Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo:     100       1    0    0    0     0          0         0      100       1    0    0    0     0       0          0
+  eth0:    1500      10    0    0    0     0          0         0     2500      20    0    0    0     0       0          0
+"""
+
+
+def _write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wt') as fout:
+        fout.write(content)
+
+
+@pytest.fixture
+def proc(tmp_path) -> str:
+    root = str(tmp_path / 'proc')
+    _write(os.path.join(root, 'stat'), 'cpu  1 2 3 4 5 6 7 0 0 0\n'
+                                       'cpu0 1 1 1 1 1 1 1 0 0 0\n'
+                                       'cpu1 0 1 2 3 4 5 6 0 0 0\n'
+                                       'intr 0\n')
+    _write(os.path.join(root, 'meminfo'), 'MemTotal:        1000 kB\nMemFree:  10 kB\n')
+    _write(os.path.join(root, str(PID), 'net', 'dev'), NET_DEV)
+    return root
+
+
+@pytest.fixture
+def cgroup_v2(tmp_path) -> str:
+    root = str(tmp_path / 'cgroup_v2')
+    path = os.path.join(root, 'system.slice', 'docker-{}.scope'.format(CONTAINER_ID))
+    _write(os.path.join(root, 'cgroup.controllers'), 'cpu io memory\n')
+    _write(os.path.join(path, 'cpu.stat'), 'usage_usec 2000\nuser_usec 1500\nsystem_usec 500\n')
+    _write(os.path.join(path, 'memory.stat'), 'anon 300\ninactive_file 100\n')
+    _write(os.path.join(path, 'memory.max'), 'max\n')
+    _write(os.path.join(path, 'memory.current'), '1000\n')
+    _write(os.path.join(path, 'io.stat'), '8:0 rbytes=10 wbytes=20 rios=1 wios=2\n'
+                                          '8:16 rbytes=1 wbytes=2 rios=1 wios=1\n')
+    _write(os.path.join(path, 'cgroup.procs'), '{}\n43\n'.format(PID))
+    return root
+
+
+@pytest.fixture
+def cgroup_v1(tmp_path) -> str:
+    root = str(tmp_path / 'cgroup_v1')
+
+    def path(controller):
+        return os.path.join(root, controller, 'docker', CONTAINER_ID)
+
+    _write(os.path.join(path('cpuacct'), 'cpuacct.usage'), '2000000\n')
+    _write(os.path.join(path('memory'), 'memory.stat'), 'cache 10\ntotal_cache 50\n')
+    _write(os.path.join(path('memory'), 'memory.usage_in_bytes'), '1000\n')
+    _write(os.path.join(path('memory'), 'memory.limit_in_bytes'), '512000\n')
+    _write(os.path.join(path('memory'), 'cgroup.procs'), '{}\n'.format(PID))
+    _write(os.path.join(path('blkio'), 'blkio.throttle.io_service_bytes_recursive'),
+           '8:0 Read 10\n8:0 Write 20\n8:0 Total 30\nTotal 30\n')
+    return root
+
+
+def _system_cpu_usage(reader: CgroupReader) -> int:
+    return 28 * (10 ** 9) // reader._clock_ticks
+
+
+def test_v2_stats(cgroup_v2, proc):
+    reader = CgroupReader(cgroup_v2, proc)
+    assert reader.version == 2
+    assert reader.stats(CONTAINER_ID) == {
+        'cpu_stats': {
+            'cpu_usage': {'total_usage': 2000 * 1000},
+            'system_cpu_usage': _system_cpu_usage(reader),
+            'online_cpus': 2
+        },
+        'memory_stats': {
+            # no limit, limited by the host memory
+            'usage': 1000,
+            'limit': 1000 * 1024,
+            'stats': {'cache': 100}
+        },
+        'blkio_stats': {
+            'io_service_bytes_recursive': [
+                {'op': 'Read', 'value': 11},
+                {'op': 'Write', 'value': 22}
+            ]
+        },
+        'networks': {'eth0': {'rx_bytes': 1500, 'tx_bytes': 2500}}
+    }
+
+
+def test_v1_stats(cgroup_v1, proc):
+    reader = CgroupReader(cgroup_v1, proc)
+    assert reader.version == 1
+    assert reader.stats(CONTAINER_ID) == {
+        'cpu_stats': {
+            'cpu_usage': {'total_usage': 2000000},
+            'system_cpu_usage': _system_cpu_usage(reader),
+            'online_cpus': 2
+        },
+        'memory_stats': {
+            'usage': 1000,
+            'limit': 512000,
+            'stats': {'cache': 50}
+        },
+        'blkio_stats': {
+            'io_service_bytes_recursive': [
+                {'op': 'Read', 'value': 10},
+                {'op': 'Write', 'value': 20}
+            ]
+        },
+        'networks': {'eth0': {'rx_bytes': 1500, 'tx_bytes': 2500}}
+    }
+
+
+def test_unknown_container(cgroup_v2, proc):
+    assert CgroupReader(cgroup_v2, proc).stats('d' * 64) is None
+
+
+@pytest.mark.parametrize('version', [1, 2])
+def test_hidden_processes_are_not_an_empty_sample(version, cgroup_v1, cgroup_v2, proc):
+    # outside of the host PID namespace /proc/<pid> of the container is not there
+    os.remove(os.path.join(proc, str(PID), 'net', 'dev'))
+    reader = CgroupReader(cgroup_v1 if version == 1 else cgroup_v2, proc)
+    assert reader.stats(CONTAINER_ID) is None
+
+
+class _Container(object):
+    id = CONTAINER_ID
+    status = 'running'
+
+    def stats(self, stream: bool):
+        return {'networks': {'eth0': {'rx_bytes': 1, 'tx_bytes': 2}}}
+
+
+def test_job_falls_back_to_docker(cgroup_v2, proc):
+    reader = CgroupReader(cgroup_v2, proc)
+    job = ContainerStatsJob(None, _Container(), reader)
+    assert job._read_stats()['networks']['eth0']['rx_bytes'] == 1500
+    os.remove(os.path.join(proc, str(PID), 'net', 'dev'))
+    assert job._read_stats() == _Container().stats(stream=False)
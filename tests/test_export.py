@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from system_monitor.export import export_log  # noqa: E402
+from system_monitor.loader import ExportedLog  # noqa: E402
+from system_monitor.storage import SegmentedLog  # noqa: E402
+from system_monitor.columnar import COLUMNAR_SCHEMAS, normalize  # noqa: E402
+
+
+def _microseconds(log: dict) -> dict:
+    # the export keeps the timestamps of the columnar sections in microseconds
+    for key, value in log.items():
+        if key in COLUMNAR_SCHEMAS:
+            for row in value:
+                row['time'] = round(row['time'] * 1e6) / 1e6
+    return log
+
+
+def test_export_round_trip(recorded_log, tmp_path):
+    path = export_log(recorded_log, str(tmp_path / 'key'))
+    exported = ExportedLog(path)
+    assert exported.get_log() == _microseconds(recorded_log.get_log())
+    # as it would have been uploaded
+    assert exported.get_log() == _microseconds(json.loads(''.join(recorded_log.iter_json())))
+
+
+def test_export_of_a_segmented_log(recorded_log, tmp_path):
+    log = SegmentedLog(recorded_log.get_log()['general'], str(tmp_path / 'segments'))
+    try:
+        for key, value in recorded_log.get_log().items():
+            if key != 'general':
+                # as extended by the target
+                log.extend(key, normalize(key, value) if isinstance(value, list) else value)
+        path = export_log(log, str(tmp_path / 'key'))
+        assert ExportedLog(path).get_log() == _microseconds(recorded_log.get_log())
+    finally:
+        log.close()
+
+
+def test_export_replaces_the_previous_one(recorded_log, tmp_path):
+    path = str(tmp_path / 'key')
+    export_log(recorded_log, path)
+    recorded_log.extend('events', [{'time': 0.0, 'type': 'container/remove', 'id': 'x'}])
+    export_log(recorded_log, path)
+    assert ExportedLog(path).get_log()['events'][-1]['type'] == 'container/remove'
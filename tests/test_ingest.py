@@ -0,0 +1,40 @@
+import threading
+
+from system_monitor.ingest import ShardedIngestor
+
+
+def test_entries_wait_for_a_preempted_producer():
+    consumed = []
+    ingestor = ShardedIngestor(consumed.extend)
+    # a producer took its number, but did not append its entry yet
+    late = next(ingestor._sequence)
+    ingestor.put('k', 1)
+    ingestor.flush()
+    assert consumed == [] and ingestor.pending() == 1
+    ingestor._local.shard.append((late, ('k', 0)))
+    ingestor.put('k', 2)
+    ingestor.flush()
+    assert consumed == [('k', 0), ('k', 1), ('k', 2)]
+    assert ingestor.pending() == 0
+
+
+def test_entries_are_handed_over_in_order():
+    consumed = []
+    ingestor = ShardedIngestor(consumed.extend)
+    ingestor.start()
+    lock, counter = threading.Lock(), [0]
+
+    def produce():
+        for _ in range(2000):
+            # the numbers taken under our lock follow the order of the sequence
+            with lock:
+                ingestor.put('k', counter[0])
+                counter[0] += 1
+
+    threads = [threading.Thread(target=produce) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ingestor.stop()
+    assert [value for _, value in consumed] == list(range(8000))
@@ -0,0 +1,255 @@
+import os
+import logging
+import argparse
+
+import pytest
+
+from system_monitor import procfs
+from system_monitor.procfs import ProcScanner, PS_COLUMN_TO_KEY, is_host_namespace
+from system_monitor.jobs import container
+from system_monitor.jobs.container import ContainerListJob
+from system_monitor.jobs.process import ProcessStatsJob, HostProcessStatsJob
+from system_monitor.constants import HOST_PROCESS_STATS_MAX_EMPTY_SCANS
+
+TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+MEM_TOTAL_KB = 1000000
+
+
+class FakeProc(object):
+    """A synthetic /proc tree"""
+
+    def __init__(self, root: str, uptime: float = 1000.0):
+        self.root = root
+        self._write('uptime', '{:.2f} 1.00\n'.format(uptime))
+        self._write('meminfo', 'MemTotal:       {:d} kB\nMemFree:  1 kB\n'.format(MEM_TOTAL_KB))
+
+    def add(self, pid: int, comm: str, ppid: int = 1, pgrp: int = None, utime: int = 0,
+            stime: int = 0, threads: int = 1, starttime: int = 0, rss: int = 0, data: int = 0,
+            cmdline: str = '', cgroup: str = '0::/\n'):
+        pgrp = pid if pgrp is None else pgrp
+        # pid (comm) state ppid pgrp session tty_nr tpgid flags minflt cminflt majflt cmajflt
+        # utime stime cutime cstime priority nice num_threads itrealvalue starttime vsize rss
+        stat = '{} ({}) S {} {} {} 0 -1 4194560 100 0 0 0 {} {} 0 0 20 0 {} 0 {} 1000000 {} ' \
+               '18446744073709551615 1 1 0 0 0 0 0 0 0 0 0 0 17 0 0 0 0 0 0\n'.format(
+                   pid, comm, ppid, pgrp, pgrp, utime, stime, threads, starttime, rss)
+        self._write('{}/stat'.format(pid), stat)
+        self._write('{}/statm'.format(pid), '1000 {} 50 10 0 {} 0\n'.format(rss, data))
+        # arguments are NUL-terminated
+        self._write('{}/cmdline'.format(pid), ''.join(arg + '\0' for arg in cmdline.split()))
+        self._write('{}/cgroup'.format(pid), cgroup)
+
+    def remove(self, pid: int, name: str = None):
+        path = os.path.join(self.root, str(pid))
+        for file in ([name] if name else os.listdir(path)):
+            os.remove(os.path.join(path, file))
+        if name is None:
+            os.rmdir(path)
+
+    def _write(self, name: str, content: str):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wt') as fout:
+            fout.write(content)
+
+
+class FakeTime(object):
+    # the clock of the scanner, moved by hand
+
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+CONTAINER_ID = 'c' * 64
+OTHER_ID = 'd' * 64
+
+
+class App(object):
+    """The app, as seen by the process jobs"""
+
+    def __init__(self):
+        self.args = argparse.Namespace(dedup_configs=False)
+        self.logger = logging.getLogger('test')
+        self.pool = self
+        self.sampler = None
+        self.rows = []
+        self.enqueued = []
+
+    def extend_log(self, key, value):
+        self.rows.extend(value)
+
+    def enqueue(self, job):
+        self.enqueued.append(job)
+
+
+class Container(object):
+    status = 'running'
+
+    def __init__(self, container_id: str):
+        self.id = container_id
+
+
+@pytest.fixture
+def proc(tmp_path) -> FakeProc:
+    return FakeProc(str(tmp_path / 'proc'))
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeTime:
+    clock = FakeTime()
+    monkeypatch.setattr(procfs, 'time', clock)
+    return clock
+
+
+def _by_pid(processes: list) -> dict:
+    return {process['pid']: process for process in processes}
+
+
+def test_stat_with_spaces_and_parentheses(proc, clock):
+    proc.add(10, 'tmux: server (1) ) x', ppid=7, threads=3, utime=2 * TICKS, stime=TICKS,
+             cmdline='tmux new -s a')
+    process, = ProcScanner(proc.root).scan()
+    assert process['pid'] == 10
+    assert process['ppid'] == 7
+    assert process['nthreads'] == 3
+    assert process['cputime'] == '00:00:03'
+    assert process['command'] == 'tmux new -s a'
+
+
+def test_command_of_process_without_cmdline(proc, clock):
+    proc.add(10, 'kworker (a b)')
+    process, = ProcScanner(proc.root).scan()
+    assert process['command'] == '[kworker (a b)]'
+
+
+def test_kernel_threads_are_skipped(proc, clock):
+    proc.add(2, 'kthreadd', ppid=0, pgrp=0)
+    proc.add(10, 'app')
+    assert [p['pid'] for p in ProcScanner(proc.root).scan()] == [10]
+
+
+def test_memory(proc, clock):
+    rss = MEM_TOTAL_KB * 1024 // PAGE_SIZE // 4
+    proc.add(10, 'app', rss=rss, data=2000)
+    process, = ProcScanner(proc.root).scan()
+    assert process['pmem'] == round(rss * PAGE_SIZE / (MEM_TOTAL_KB * 1024) * 100.0, 1)
+    # SIZE is data + stack in KB (field 6 of statm), reported /1000 as done with ps
+    assert process['mem'] == 2000 * PAGE_SIZE // 1024 / 1000
+
+
+def test_cpu_since_previous_scan(proc, clock):
+    # started 500 secs after boot, 1000 secs of uptime: 50 secs of CPU are 10%
+    proc.add(10, 'app', utime=40 * TICKS, stime=10 * TICKS, starttime=500 * TICKS)
+    scanner = ProcScanner(proc.root)
+    assert scanner.scan()[0]['pcpu'] == 10.0
+    # then over the time elapsed since the previous scan
+    proc.add(10, 'app', utime=41 * TICKS, stime=10 * TICKS, starttime=500 * TICKS)
+    clock.now += 2.0
+    assert scanner.scan()[0]['pcpu'] == 50.0
+    # a new process with the same PID starts over
+    proc.add(10, 'app', utime=TICKS, starttime=900 * TICKS)
+    clock.now += 2.0
+    assert scanner.scan()[0]['pcpu'] == 1.0
+
+
+def test_pid_vanishing_mid_scan(proc, clock):
+    proc.add(10, 'app')
+    proc.add(11, 'gone')
+    proc.add(12, 'exiting')
+    proc.add(13, 'app')
+    scanner = ProcScanner(proc.root)
+    pids = scanner.pids()
+    # one is gone after listing the PIDs, one after reading its stat
+    proc.remove(11)
+    proc.remove(12, 'statm')
+    assert sorted(_by_pid(scanner.scan(pids))) == [10, 13]
+
+
+def test_ps_column_mapping(proc, clock):
+    # the rows sampled from /proc have the keys of those parsed from `docker top`
+    proc.add(10, 'app', cmdline='app --flag')
+    process, = ProcScanner(proc.root).scan()
+    assert set(process) == set(PS_COLUMN_TO_KEY.values())
+    app = App()
+    top = {
+        'Titles': ['PPID', 'PID', '%CPU', 'THCNT', 'TIME', '%MEM', 'SIZE', 'CMD'],
+        'Processes': [['1', '10', '0.0', '1', '00:00:00', '0.0', '1000', 'app --flag']]
+    }
+    ProcessStatsJob(app, Container(CONTAINER_ID))._update(top, 0.0)
+    row, = app.rows
+    assert set(row) - {'container', 'time'} == set(process)
+
+
+def test_host_namespace(proc, monkeypatch):
+    # no namespace to read, e.g. /proc of another machine
+    assert not is_host_namespace(proc.root)
+    proc.add(1, 'init')
+    os.makedirs(os.path.join(proc.root, '1', 'ns'))
+    path = os.path.join(proc.root, '1', 'ns', 'pid')
+    with open(path, 'wt'):
+        pass
+    assert not is_host_namespace(proc.root)
+    monkeypatch.setattr(procfs, '_HOST_PID_NAMESPACE_INODE', os.stat(path).st_ino)
+    assert is_host_namespace(proc.root)
+    assert ProcScanner(proc.root).is_host_namespace()
+
+
+def test_host_namespace_of_self(proc, monkeypatch):
+    # without the privileges to read the namespace of PID 1, ours tells
+    os.makedirs(os.path.join(proc.root, 'self', 'ns'))
+    path = os.path.join(proc.root, 'self', 'ns', 'pid')
+    with open(path, 'wt'):
+        pass
+    stat = os.stat
+
+    def denied(p, *args, **kwargs):
+        if p.startswith(os.path.join(proc.root, '1') + os.sep):
+            raise PermissionError(p)
+        return stat(p, *args, **kwargs)
+
+    monkeypatch.setattr(procfs.os, 'stat', denied)
+    monkeypatch.setattr(procfs, '_HOST_PID_NAMESPACE_INODE', stat(path).st_ino)
+    assert is_host_namespace(proc.root)
+
+
+def test_host_process_job(proc, clock):
+    proc.add(10, 'app', cgroup='0::/system.slice/docker-{}.scope\n'.format(CONTAINER_ID))
+    proc.add(11, 'other', cgroup='12:memory:/docker/{}\n'.format(OTHER_ID))
+    proc.add(12, 'host')
+    app, fallback = App(), []
+    job = HostProcessStatsJob(app, ProcScanner(proc.root), lambda: {CONTAINER_ID},
+                              lambda: fallback.append(True))
+    job.run()
+    assert [(row['pid'], row['container']) for row in app.rows] == [(10, CONTAINER_ID)]
+    assert not fallback and not job.is_terminated()
+
+
+def test_host_process_job_falls_back_to_docker(proc, clock):
+    # the processes of the containers are not in this /proc
+    proc.add(12, 'host')
+    app, fallback = App(), []
+    job = HostProcessStatsJob(app, ProcScanner(proc.root), lambda: {CONTAINER_ID},
+                              lambda: fallback.append(True))
+    for _ in range(HOST_PROCESS_STATS_MAX_EMPTY_SCANS - 1):
+        job.run()
+    assert not fallback and not job.is_terminated()
+    job.run()
+    assert fallback == [True] and job.is_terminated()
+    assert not app.rows
+
+
+def test_container_list_falls_back_to_docker_top(proc, clock, monkeypatch):
+    monkeypatch.setattr(container, 'CONTAINER_STATS_STREAMING', False)
+    app = App()
+    job = ContainerListJob(app, None, procs=ProcScanner(proc.root))
+    host_job = job._host_process_job
+    job._containers_seen = {CONTAINER_ID: Container(CONTAINER_ID), OTHER_ID: Container(OTHER_ID)}
+    for _ in range(HOST_PROCESS_STATS_MAX_EMPTY_SCANS):
+        host_job.run()
+    # one docker top job per container, the new containers get their own
+    assert job._host_process_job is None and host_job.is_terminated()
+    assert all(isinstance(j, ProcessStatsJob) for j in app.enqueued)
+    assert sorted(j.container_id() for j in app.enqueued) == [CONTAINER_ID, OTHER_ID]
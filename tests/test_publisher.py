@@ -0,0 +1,258 @@
+import re
+import json
+import time
+import zlib
+import random
+import hashlib
+import logging
+import argparse
+import threading
+
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+import pytest
+
+from system_monitor.columnar import normalize
+from system_monitor.httpclient import HttpClient, CircuitBreaker, _endpoint
+from system_monitor.pool import StatisticsCollector
+from system_monitor.storage import MemoryLog
+from system_monitor.jobs import publisher
+from system_monitor.jobs.publisher import PublisherJob
+
+CHUNK_SIZE = 1024
+
+
+class LogAPI(object):
+    """Local stand-in for the log API: the single-POST endpoint and the chunk endpoint.
+
+    Parts can be made to fail a given number of times, either with an HTTP error or with
+    an error reported by the API. A log is committed when its last part is acknowledged.
+    """
+
+    def __init__(self):
+        self.posts = []
+        self.attempts = Counter()
+        self.checksums = {}
+        self.parts = {}
+        self.committed = {}
+        # part -> (number of failures left, 'http' or 'api')
+        self.failures = {}
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,),
+                                        daemon=True)
+
+    @property
+    def url(self) -> str:
+        return 'http://127.0.0.1:{}/web-api/1.0/data/set'.format(self._server.server_address[1])
+
+    def fail(self, part: int, times: int, how: str = 'api'):
+        self.failures[part] = (times, how)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _chunk(self, fields: dict) -> tuple:
+        key, part, payload = fields['key'].decode(), int(fields['part']), fields['value']
+        self.attempts[part] += 1
+        self.checksums.setdefault(part, set()).add(fields['checksum'].decode())
+        left, how = self.failures.get(part, (0, None))
+        if left:
+            self.failures[part] = (left - 1, how)
+            return (503, None) if how == 'http' else (200, 500)
+        if hashlib.sha256(payload).hexdigest() != fields['checksum'].decode():
+            return 200, 400
+        self.parts.setdefault(key, {})[part] = (payload, fields['last'] == b'1',
+                                                fields['encoding'].decode())
+        if fields['last'] == b'1':
+            parts = self.parts[key]
+            if sorted(parts) != list(range(part + 1)):
+                return 200, 409
+            self.committed[key] = b''.join(parts[i][0] for i in range(part + 1))
+        return 200, 200
+
+    def _handler(self):
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                # like the real endpoint, the body must come with its length
+                if 'Content-Length' not in self.headers:
+                    self._reply(411, None)
+                    return
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.path.endswith('/json'):
+                    api.posts.append((dict(self.headers), parse_qs(body.decode('utf-8'))))
+                    self._reply(200, 200)
+                elif self.path.endswith('/chunk'):
+                    fields = _parse_multipart(body, self.headers['Content-Type'])
+                    self._reply(*api._chunk(fields))
+                else:
+                    self._reply(404, None)
+
+            def _reply(self, status: int, code):
+                body = b'' if code is None else json.dumps({
+                    'code': code, 'status': 'OK' if code == 200 else 'Error', 'message': ''
+                }).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_):
+                pass
+
+        return _Handler
+
+
+class App(object):
+
+    def __init__(self, chunked: bool, compression: str = 'gzip'):
+        self.args = argparse.Namespace(
+            app_id='app', app_secret='secret', database='db', export_format='json',
+            export_dir='/tmp', chunked_upload=chunked, compression=compression
+        )
+        self.logger = logging.getLogger('test')
+        self.http = HttpClient(StatisticsCollector())
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = LogAPI()
+    api.start()
+    monkeypatch.setattr(publisher, 'LOG_API_URL', api.url + '/json')
+    monkeypatch.setattr(publisher, 'LOG_API_CHUNK_URL', api.url + '/chunk')
+    monkeypatch.setattr(publisher, 'LOG_API_CHUNK_SIZE_BYTES', CHUNK_SIZE)
+    monkeypatch.setattr(publisher, 'LOG_API_RETRY_EVERY_S', 0)
+    yield api
+    api.stop()
+
+
+@pytest.fixture
+def log():
+    rng = random.Random(0)
+    log = MemoryLog({'time': 0.0, 'version': 'test'})
+    log.extend('container_stats', normalize('container_stats', [{
+        'container': 'c{}'.format(i % 4), 'time': float(i), 'pcpu': rng.random() * 100,
+        'io_r': rng.randrange(1 << 30), 'io_w': rng.randrange(1 << 30), 'mem': i,
+        'pmem': rng.random(), 'network': {'eth0': {'rx': i, 'tx': rng.randrange(1 << 20)}}
+    } for i in range(500)]))
+    log.extend('events', [{'time': 0.0, 'type': 'container/add', 'id': 'c0'}])
+    return log
+
+
+def _parse_multipart(body: bytes, content_type: str) -> dict:
+    boundary = re.search(r'boundary=([^;]+)', content_type).group(1).encode('ascii')
+    fields = {}
+    for part in body.split(b'--' + boundary)[1:-1]:
+        head, _, value = part[2:].partition(b'\r\n\r\n')
+        name = re.search(rb'name="([^"]*)"', head).group(1).decode('ascii')
+        # each part ends with \r\n before the next boundary
+        fields[name] = value[:-2]
+    return fields
+
+
+def _decompress(data: bytes, encoding: str) -> bytes:
+    if encoding == 'gzip':
+        return zlib.decompress(data, wbits=31)
+    if encoding == 'zlib':
+        return zlib.decompress(data)
+    return data
+
+
+def _expected(log) -> bytes:
+    return ''.join(log.iter_json()).encode('utf-8')
+
+
+def test_single_post_is_buffered(api, log):
+    job = PublisherJob(App(chunked=False), 'key', log, no_upload=False)
+    job.run()
+    assert job.is_terminated()
+    assert len(api.posts) == 1
+    headers, form = api.posts[0]
+    assert 'chunked' not in headers.get('Transfer-Encoding', '')
+    assert form['key'] == ['key']
+    assert form['value'][0].encode('utf-8') == _expected(log)
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zlib', 'none'])
+def test_parts_are_cut_at_the_chunk_size(api, log, compression):
+    job = PublisherJob(App(chunked=True, compression=compression), 'key', log, no_upload=False)
+    job.run()
+    assert job.is_terminated()
+    parts = api.parts['key']
+    assert sorted(parts) == list(range(len(parts)))
+    assert len(parts) > 1
+    # all the parts but the last are full, only the last one says so
+    assert all(len(parts[i][0]) == CHUNK_SIZE for i in range(len(parts) - 1))
+    assert [parts[i][1] for i in range(len(parts))] == [False] * (len(parts) - 1) + [True]
+    assert {encoding for _, _, encoding in parts.values()} == {compression}
+    # the boundaries do not have to fall on a compressed block, only the stream counts
+    assert _decompress(api.committed['key'], compression) == _expected(log)
+
+
+def test_part_is_retried(api, log):
+    api.fail(1, 2, how='http')
+    job = PublisherJob(App(chunked=True), 'key', log, no_upload=False)
+    job.run()
+    assert job.is_terminated()
+    assert api.attempts[1] == 3
+    assert len(api.checksums[1]) == 1
+    assert _decompress(api.committed['key'], 'gzip') == _expected(log)
+
+
+def test_resume_after_failed_part(api, log):
+    api.fail(2, publisher.LOG_API_CHUNK_RETRY_N_TIMES)
+    job = PublisherJob(App(chunked=True), 'key', log, no_upload=False)
+    job.run()
+    # the job is retried later, from the part that failed
+    assert not job.is_terminated()
+    assert 'key' not in api.committed
+    job.run()
+    assert job.is_terminated()
+    assert api.attempts[0] == api.attempts[1] == 1
+    assert api.attempts[2] == publisher.LOG_API_CHUNK_RETRY_N_TIMES + 1
+    # the part is regenerated identical
+    assert len(api.checksums[2]) == 1
+    assert _decompress(api.committed['key'], 'gzip') == _expected(log)
+
+
+def test_log_is_committed_by_the_last_part(api, log):
+    job = PublisherJob(App(chunked=True), 'key', log, no_upload=False)
+    last = sum(1 for _ in publisher._iter_parts(
+        log.iter_json(), publisher._Compressor('gzip'), CHUNK_SIZE)) - 1
+    api.fail(last, publisher.LOG_API_CHUNK_RETRY_N_TIMES)
+    job.run()
+    assert not job.is_terminated()
+    assert 'key' not in api.committed
+    assert sorted(api.parts['key']) == list(range(last))
+    job.run()
+    assert job.is_terminated()
+    # only the last part was sent again
+    assert all(api.attempts[i] == 1 for i in range(last))
+    assert _decompress(api.committed['key'], 'gzip') == _expected(log)
+
+
+@pytest.mark.parametrize('chunked', [False, True])
+def test_open_breaker_is_not_a_trial(api, log, chunked):
+    app = App(chunked=chunked)
+    # the breaker was opened by someone else (e.g., the live publisher)
+    url = publisher.LOG_API_CHUNK_URL if chunked else publisher.LOG_API_URL
+    breaker = app.http._breakers[_endpoint(url)] = CircuitBreaker(failures=1, cooldown=0.2)
+    breaker.failure()
+    job = PublisherJob(app, 'key', log, no_upload=False)
+    for _ in range(publisher.LOG_API_RETRY_N_TIMES + 1):
+        job.run()
+    assert not job.is_terminated()
+    assert not api.posts and not api.attempts
+    time.sleep(0.2)
+    job.run()
+    assert job.is_terminated()
+    assert len(api.posts) == 1 or 'key' in api.committed
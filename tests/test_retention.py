@@ -0,0 +1,105 @@
+import json
+
+from system_monitor.columnar import normalize
+from system_monitor.storage import MemoryLog
+from system_monitor.constants import \
+    LOG_RETENTION_EVICT_FRACTION, \
+    LOG_RETENTION_DOWNSAMPLED_FRACTION
+
+MAX_ROWS = 100
+
+
+def _stats(t: float, containers=('a',)) -> list:
+    return normalize('container_stats', [{
+        'container': c, 'time': float(t), 'pcpu': 1.0, 'io_r': 0, 'io_w': 0, 'mem': 0.0,
+        'pmem': 0.0, 'network': {}
+    } for c in containers])
+
+
+def _column(log: MemoryLog, name: str, key: str = 'container_stats') -> list:
+    return [row[name] for row in log.get_log()[key]]
+
+
+def test_ring_buffer():
+    log = MemoryLog({}, MAX_ROWS)
+    for t in range(MAX_ROWS):
+        assert log.extend('container_stats', _stats(t))[1] is None
+    # full: the oldest quarter of the budget leaves
+    lengths, evicted = log.extend('container_stats', _stats(MAX_ROWS))
+    num = int(MAX_ROWS * LOG_RETENTION_EVICT_FRACTION)
+    assert evicted[0] == num and evicted[1] > 0
+    assert _column(log, 'time') == [float(t) for t in range(num, MAX_ROWS + 1)]
+    assert log.evicted == {'container_stats': num}
+    for t in range(MAX_ROWS + 1, 10 * MAX_ROWS):
+        log.extend('container_stats', _stats(t))
+        assert len(log.get_log()['container_stats']) <= MAX_ROWS
+    assert _column(log, 'time')[-1] == float(10 * MAX_ROWS - 1)
+
+
+def test_ring_buffer_of_other_sections():
+    log = MemoryLog({}, MAX_ROWS)
+    for t in range(MAX_ROWS + 1):
+        log.extend('events', [{'time': float(t), 'type': 'container/add', 'id': str(t)}])
+    assert _column(log, 'time', 'events')[0] == float(MAX_ROWS * LOG_RETENTION_EVICT_FRACTION)
+    # the encoded length of what is left is kept up to date
+    assert log.memory_usage()['events'] == sum(
+        len(json.dumps(row)) for row in log.get_log()['events'])
+
+
+def test_downsampled_rows_are_kept_at_the_head():
+    log = MemoryLog({}, MAX_ROWS, downsample_s=10)
+    # two containers, one row each per second
+    t = 0
+    while len(log.get_log().get('container_stats', [])) + 2 <= MAX_ROWS:
+        log.extend('container_stats', _stats(t, ('a', 'b')))
+        t += 1
+    log.extend('container_stats', _stats(t, ('a', 'b')))
+    times, containers = _column(log, 'time'), _column(log, 'container')
+    # the evicted rows (seconds 0 to 12) are thinned to one per container every 10 seconds
+    assert list(zip(times[:4], containers[:4])) == [(0.0, 'a'), (0.0, 'b'), (10.0, 'a'),
+                                                    (10.0, 'b')]
+    assert times[4] > 10.0
+    assert log._downsampled['container_stats'] == 4
+    # later evictions keep the head in order, within its share of the budget
+    for t in range(t + 1, t + 20 * MAX_ROWS):
+        log.extend('container_stats', _stats(t, ('a', 'b')))
+    times = _column(log, 'time')
+    head = log._downsampled['container_stats']
+    assert 0 < head <= int(MAX_ROWS * LOG_RETENTION_DOWNSAMPLED_FRACTION)
+    assert times == sorted(times)
+    assert set(_column(log, 'container')[:head]) == {'a', 'b'}
+    assert len(times) <= MAX_ROWS
+
+
+def test_trim_up_to_a_watermark():
+    log = MemoryLog({'time': 0.0})
+    for t in range(10):
+        log.extend('container_stats', _stats(t))
+    log.extend('containers', {'a': 'first', 'b': 'second'})
+    view = log.since({})
+    assert len(view.get_log()['container_stats']) == 10
+    for t in range(10, 15):
+        log.extend('container_stats', _stats(t))
+    log.extend('containers', {'b': 'renamed'})
+    log.trim(view.watermark)
+    # what was published is dropped, the rest is kept
+    assert _column(log, 'time') == [float(t) for t in range(10, 15)]
+    assert log.get_log()['containers'] == {'b': 'renamed'}
+    assert [row['time'] for row in log.since(view.watermark).get_log()['container_stats']] == \
+        [float(t) for t in range(10, 15)]
+    # trimming again is a no-op
+    log.trim(view.watermark)
+    assert len(log.get_log()['container_stats']) == 5
+
+
+def test_trim_after_eviction():
+    log = MemoryLog({}, MAX_ROWS)
+    view = log.since({})
+    for t in range(MAX_ROWS + 1):
+        log.extend('container_stats', _stats(t))
+    # the rows up to the watermark were evicted, their indices are absolute
+    view = log.since(view.watermark)
+    log.extend('container_stats', _stats(MAX_ROWS + 1))
+    log.trim(view.watermark)
+    assert _column(log, 'time') == [float(MAX_ROWS + 1)]
+    assert log.since(view.watermark).get_log()['container_stats'][0]['time'] == MAX_ROWS + 1
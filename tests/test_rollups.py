@@ -0,0 +1,40 @@
+from system_monitor.rollups import Rollups, ROLLUP_FIELDS
+from system_monitor.constants import ROLLUP_WINDOWS_S
+
+WINDOW = ROLLUP_WINDOWS_S[0]
+
+
+def _samples(start: int, num: int) -> list:
+    # one sample per second, the value is the time
+    return [{'container': 'c', 'time': float(t), 'pcpu': float(t)}
+            for t in range(start, start + num)]
+
+
+def test_closed_windows_are_written_once():
+    rollups = Rollups()
+    rollups.observe('container_stats', _samples(0, 3 * WINDOW + 1))
+    windows = [row for row in rollups.closed_windows() if row['metric'] == 'pcpu']
+    assert [(row['entity'], row['window'], row['start'], row['count']) for row in windows] == [
+        ('container_stats/c', WINDOW, float(i * WINDOW), WINDOW) for i in range(3)
+    ]
+    assert set(ROLLUP_FIELDS) < set(windows[0])
+    # nothing closed since
+    assert rollups.closed_windows() == []
+    rollups.observe('container_stats', _samples(3 * WINDOW + 1, WINDOW))
+    assert [row['start'] for row in rollups.closed_windows() if row['metric'] == 'pcpu'] == \
+        [float(3 * WINDOW)]
+
+
+def test_summary_has_the_run_and_the_open_window():
+    rollups = Rollups()
+    rollups.observe('container_stats', _samples(0, 2 * WINDOW + 1))
+    summary = rollups.summary(changed_only=True)
+    assert summary['$fields'] == ROLLUP_FIELDS
+    pcpu = summary['container_stats/c']['pcpu']
+    assert pcpu['run'][:2] == [0.0, 2 * WINDOW + 1]
+    # only the open window, with its single sample (the quantiles are approximate)
+    assert list(pcpu['windows']) == [str(WINDOW)]
+    assert pcpu['windows'][str(WINDOW)][:5] == [float(2 * WINDOW), 1] + [float(2 * WINDOW)] * 3
+    # unchanged entities are not written again
+    assert rollups.summary(changed_only=True) == {}
+    assert list(rollups.summary()) == ['container_stats/c', '$fields']
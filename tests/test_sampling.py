@@ -0,0 +1,39 @@
+import time
+
+from system_monitor.jobs.jobs import Job
+from system_monitor.pool import Scheduler
+from system_monitor.sampling import AdaptiveSampler
+
+
+def test_reschedule_moves_a_queued_job():
+    scheduler = Scheduler()
+    slow, other = Job(period=60), Job(period=30)
+    slow._last_executed = other._last_executed = time.time()
+    scheduler.put(slow)
+    scheduler.put(other)
+    slow.period = 0
+    assert scheduler.reschedule(slow, slow.next_execution())
+    job, _ = scheduler.get(timeout=1)
+    assert job is slow
+    # not in the queue (e.g., running)
+    assert not scheduler.reschedule(slow, 0)
+
+
+def test_queued_jobs_are_rescheduled_when_their_period_shrinks():
+    rescheduled = []
+    sampler = AdaptiveSampler(rescheduled.append)
+    job = Job(period=10)
+    # throttled, then back under the CPU budget
+    sampler._throttle = 4.0
+    sampler.observe(job)
+    assert job.period == 40.0
+    sampler._last_cpu_time = (time.monotonic() - 1000.0, time.process_time())
+    sampler.control()
+    assert job.period < 40.0
+    assert rescheduled == [job]
+    # longer periods wait for the next execution
+    sampler._throttle = 8.0
+    sampler._last_cpu_time = (time.monotonic() - 1000.0, time.process_time())
+    sampler._jobs[job].factor = 4.0
+    sampler.control()
+    assert rescheduled == [job]
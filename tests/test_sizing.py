@@ -0,0 +1,70 @@
+import json
+import random
+
+import pytest
+
+from system_monitor.columnar import normalize
+from system_monitor.sizing import LogSize, encode, encoded_lengths
+from system_monitor.storage import MemoryLog, SegmentedLog
+
+GENERAL = {'time': 0.0, 'version': '2.0', 'notes': 'a "quoted" note\n', 'clock': None}
+
+
+def _batches(seed: int = 0):
+    # (key, value) as the jobs log them, in order
+    rng = random.Random(seed)
+    for i in range(60):
+        yield 'container_stats', [{
+            'container': 'c{}'.format(c), 'time': float(i), 'pcpu': rng.random() * 400,
+            'io_r': rng.randrange(1 << 40), 'io_w': 0, 'mem': rng.random() * 1e9,
+            'pmem': rng.random(), 'network': {'eth{}'.format(n): {
+                'rx': rng.randrange(1 << 30), 'tx': rng.randrange(1 << 20)} for n in range(c)}
+        } for c in range(3)]
+        yield 'process_stats', [{
+            'container': 'c0', 'time': float(i), 'ppid': '1', 'pid': str(100 + p),
+            # %CPU of ps above 99.95 is an integer
+            'pcpu': rng.choice(['0.0', '12.5', '99.9', '150', '1200']),
+            'nthreads': str(p + 1), 'cputime': '00:01:0{}'.format(p), 'pmem': '1.5',
+            'mem': rng.random() * 1e5, 'command': rng.choice(['python3 -m app', 'café "x"',
+                                                              '[kworker/0:1]'])
+        } for p in range(4)]
+        if i % 10 == 0:
+            yield 'events', [{'time': float(i), 'type': 'container/add', 'id': 'c{}'.format(i)}]
+            yield 'containers', {'c{}'.format(i): 'name-{}'.format(i), 'c0': 'renamed'}
+            # a field outside of the schema
+            yield 'health', [{'time': float(i), 'temperature': 40 + i, 'extra': {'a': [1, 2]}}]
+
+
+def _fill(log) -> LogSize:
+    # as done by the target
+    size = LogSize()
+    size.add('general', encoded_lengths(encode(GENERAL)))
+    for key, value in _batches():
+        if isinstance(value, list):
+            value = normalize(key, value)
+        lengths, evicted = log.extend(key, value)
+        size.add(key, lengths)
+        if evicted:
+            size.remove(key, *evicted)
+    return size
+
+
+@pytest.mark.parametrize('max_rows', [0, 50])
+def test_memory_log_size(max_rows):
+    log = MemoryLog(dict(GENERAL), max_rows)
+    size = _fill(log)
+    assert size.total() == len(json.dumps(log.get_log()))
+    assert size.total() == len(''.join(log.iter_json()))
+    assert size.sections() == {
+        key: len(json.dumps({key: value})) - 2 for key, value in log.get_log().items()
+    }
+
+
+def test_segmented_log_size(tmp_path):
+    log = SegmentedLog(dict(GENERAL), str(tmp_path))
+    try:
+        size = _fill(log)
+        assert size.total() == len(json.dumps(log.get_log()))
+        assert size.total() == len(''.join(log.iter_json()))
+    finally:
+        log.close()